@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+"""Gunicorn 設定：預設以 ASGI（uvicorn worker）啟動，TRIPS_SERVER=wsgi 時改回同步 WSGI。
+
+    gunicorn -c gunicorn.conf.py                      # ASGI
+    TRIPS_SERVER=wsgi gunicorn -c gunicorn.conf.py    # WSGI + gthread
+
+ASGI 模式搭配 TRIPS_ASYNC_API=1，題目、進度查詢與 PATCH 會改走 trips/async_views.py。
+"""
+import multiprocessing
+import os
+
+server = os.environ.get('TRIPS_SERVER', 'asgi')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = 30
+accesslog = '-'
+
+if server == 'wsgi':
+    wsgi_app = 'mysite.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WSGI_THREADS', 4))
+else:
+    wsgi_app = 'mysite.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
@@ -3,6 +3,9 @@ ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run with ``gunicorn -c gunicorn.conf.py`` (uvicorn workers); set
+``TRIPS_ASYNC_API=1`` to route the hot trips endpoints to ``trips.async_views``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -13,6 +13,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 import os
+import tempfile
+
+from corsheaders.defaults import default_headers
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -29,7 +32,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-yscstx(m_o@((v!s%^_x!vnzomub%_*abo)e*z)1s0#063$v-p'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ['*']
 
@@ -49,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 放在最前面，量測的處理時間才包含其他 middleware（TRIPS_METRICS=1 時啟用）
+    'trips.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +62,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # 放在 CorsMiddleware 之後，前端跨網域下載 .mind 等素材時才會帶 CORS 標頭
+    'trips.middleware.AssetMiddleware',
     'django.middleware.common.CommonMiddleware',
 ]
 
@@ -68,6 +75,9 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# AR 素材分段下載使用 Range / If-Range，前端需要讀取 Content-Range 與 ETag
+CORS_ALLOW_HEADERS = (*default_headers, 'range', 'if-range')
+CORS_EXPOSE_HEADERS = ['content-range', 'etag']
 ROOT_URLCONF = 'mysite.urls'
 
 import os
@@ -98,13 +108,145 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DB_ENGINE=sqlite3（預設）或 postgresql；多個 worker 同時寫入時請使用 PostgreSQL
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+if DB_ENGINE == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'trips'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+    }
+
+# SQLite 設定檔：DB_PROFILE=default 維持 Django 預設；DB_PROFILE=tuned 供現場多人同時作答使用
+DB_PROFILE = os.environ.get('DB_PROFILE', 'default')
+DB_PROFILES = {
+    'default': {'CONN_MAX_AGE': 0, 'OPTIONS': {}, 'PRAGMAS': {}},
+    'tuned': {
+        # 同一個 worker 執行緒重複使用連線，不必每個請求重新開檔與套用 PRAGMA
+        'CONN_MAX_AGE': 60,
+        # BEGIN IMMEDIATE：交易一開始就取得寫入鎖，避免讀鎖升級寫鎖時直接回 database is locked
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # 由 trips/signals.py 在 connection_created 時套用
+        'PRAGMAS': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000},
+    },
+}
+TRIPS_SQLITE_PRAGMAS = {}
+if DB_ENGINE == 'postgresql':
+    DATABASES['default'].update(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+else:
+    DATABASES['default'].update(
+        CONN_MAX_AGE=DB_PROFILES[DB_PROFILE]['CONN_MAX_AGE'],
+        CONN_HEALTH_CHECKS=DB_PROFILES[DB_PROFILE]['CONN_MAX_AGE'] > 0,
+        OPTIONS=DB_PROFILES[DB_PROFILE]['OPTIONS'],
+    )
+    TRIPS_SQLITE_PRAGMAS = DB_PROFILES[DB_PROFILE]['PRAGMAS']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'trips',
+    }
+}
+
+# 題目快取使用的 cache alias 與存活秒數（None 表示不過期，只靠後台修改時失效）
+TRIPS_QUESTION_CACHE = 'default'
+TRIPS_QUESTION_CACHE_TIMEOUT = None
+# 題目快取的版本檔（trips/cache.py）：題目修改 commit 後換掉，同一台主機上的所有 worker 依此改用新的快取 key
+TRIPS_QUESTION_CACHE_VERSION_FILE = os.environ.get(
+    'TRIPS_QUESTION_CACHE_VERSION_FILE', os.path.join(tempfile.gettempdir(), 'trips-question-cache.version'),
+)
+
+# ASGI 模式：設 TRIPS_ASYNC_API=1 時，題目、進度讀取與更新改由 trips/async_views.py 的 async view 處理
+TRIPS_ASYNC_API = os.environ.get('TRIPS_ASYNC_API') == '1'
+
+# 進度推播（trips/events.py，ASGI 模式的 /api/events/）：local 只在同一個行程內轉送；
+# gunicorn 有多個 worker 時設 socket，經由 TRIPS_EVENT_SOCKET_DIR 中的 Unix socket 轉送給其他 worker
+TRIPS_EVENT_BROKER = os.environ.get('TRIPS_EVENT_BROKER', 'local')
+TRIPS_EVENT_SOCKET_DIR = os.environ.get('TRIPS_EVENT_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'trips-events'))
+# 閒置多少秒送一次 keepalive 註解，需小於 nginx 等代理伺服器的 read timeout
+TRIPS_EVENT_KEEPALIVE = 15
+
+# 作答寫入（trips/answer_log.py）：sync 在同一個交易內新增 AnswerEvent 並更新 LevelResult 與統計；
+# append 只新增 AnswerEvent，由 compact_answer_events 定期整併，事件存在至少 TRIPS_ANSWER_COMPACT_DELAY 秒
+# 再加上 TRIPS_WRITE_BEHIND_TIMEOUT 才整併（PostgreSQL 上 commit 順序可能與 id 不同，queue 模式的合併交易在請求
+# 逾時前都可能還沒 commit；SQLite 寫入依序進行，不需等待，見 answer_log.compact_delay）；
+# queue 另把同一時間的寫入合併成一個交易，並在 web 行程內背景整併（trips/write_behind.py）
+TRIPS_ANSWER_WRITES = os.environ.get('TRIPS_ANSWER_WRITES', 'sync')
+TRIPS_ANSWER_COMPACT_DELAY = 2 if DB_ENGINE == 'postgresql' else 0
+TRIPS_ANSWER_COMPACT_BATCH = 500
+# queue 模式：收集多少毫秒內的寫入合併 commit、一個交易最多幾筆、請求最多等幾秒；
+# 每隔多少毫秒整併一次，0 表示不在 web 行程內整併（改為另外執行 compact_answer_events --interval）
+TRIPS_WRITE_BEHIND_COMMIT_MS = 10
+TRIPS_WRITE_BEHIND_MAX_BATCH = 200
+TRIPS_WRITE_BEHIND_TIMEOUT = 10
+TRIPS_WRITE_BEHIND_APPLY_MS = int(os.environ.get('TRIPS_WRITE_BEHIND_APPLY_MS', '500'))
+
+# 是否接受前端送來的 status/user_answer/correct_answer（舊版前端）；關閉時 PATCH 與批次上傳必須帶 choice，
+# 對錯由伺服器依題目的正確答案判斷，玩家無法自行把任何一關設為通過
+TRIPS_CLIENT_VERDICTS = os.environ.get('TRIPS_CLIENT_VERDICTS') == '1'
+
+# 玩家進度列表（/api/posts/）輪詢用的 cursor 往回重疊的秒數：updated_at 在交易 commit 前就已決定，
+# 需大於最長的作答交易（含 write-behind 的 TRIPS_WRITE_BEHIND_TIMEOUT），晚 commit 的玩家才會在下次輪詢出現
+TRIPS_SYNC_OVERLAP_SECONDS = 30
+
+# 排行榜快取秒數，現場大螢幕輪詢時最多每幾秒查一次資料庫
+TRIPS_LEADERBOARD_CACHE_TIMEOUT = 5
+
+# 圖片最佳化（trips/images.py、optimize_media 指令）：輸出寬度、格式，API 未指定 icon_width 時的預設寬度
+TRIPS_IMAGE_DIRS = ('questions', 'vendor_icons')
+TRIPS_IMAGE_WIDTHS = (320, 640, 1280)
+TRIPS_IMAGE_FORMATS = ('webp', 'avif')
+TRIPS_IMAGE_DEFAULT_WIDTH = 640
+
+# 各關 MindAR 標記檔的來源目錄（trips/targets.py、build_route_targets 指令）
+TRIPS_MIND_SOURCE_DIR = BASE_DIR.parent / 'frontend' / 'mind'
+# AR 素材分段校驗表的分段大小（/api/asset-chunks/）
+TRIPS_ASSET_CHUNK_SIZE = 256 * 1024
+
+# 離線快取清單（trips/offline.py、build_precache_manifest 指令）：前端目錄與不預先下載的路徑；
+# mind/ 下是各關與全部關卡的標記檔，改由各路線的 bundle 預先下載
+TRIPS_PRECACHE_APP_DIR = BASE_DIR.parent / 'frontend'
+TRIPS_PRECACHE_APP_EXCLUDE = ('mind/',)
+
+# 請求量測（trips/metrics.py）：依 view 記錄處理時間、查詢數、序列化時間與回應大小，/trips/api/metrics 以 Prometheus 格式輸出；
+# 抓取時帶 Authorization: Bearer <TRIPS_METRICS_TOKEN>，或以管理員帳號登入
+TRIPS_METRICS = os.environ.get('TRIPS_METRICS') == '1'
+TRIPS_METRICS_TOKEN = os.environ.get('TRIPS_METRICS_TOKEN', '')
+# 每個 view 單一請求的查詢數上限（不含 BEGIN/COMMIT 與 PRAGMA，含題目快取未命中時的查詢），超過時記錄警告；
+# tests.py 的 QueryBudgetTests 也以此檢查
+TRIPS_QUERY_BUDGETS = {
+    'QuestionDetailAPIView': 1,
+    'UserProfileAPIView': 2,
+    'PostUpdateAPIView': 6,
+    'AnswerSubmitAPIView': 5,
+    'PostBatchUpdateAPIView': 6,
+    'PostDetailAPIView': 3,
+    'RouteBootstrapAPIView': 3,
+    'LeaderboardAPIView': 2,
+    'PrecacheManifestAPIView': 2,
+}
+# 抽樣剖析：依比例抽樣請求，處理時間超過 TRIPS_PROFILE_SLOW_MS 的存到 TRIPS_PROFILE_DIR；
+# TRIPS_PROFILER=pyinstrument 時輸出 HTML（需要 pyinstrument），否則為 cProfile 的 .prof
+TRIPS_PROFILE_SAMPLE_RATE = float(os.environ.get('TRIPS_PROFILE_SAMPLE_RATE', '0'))
+TRIPS_PROFILE_SLOW_MS = int(os.environ.get('TRIPS_PROFILE_SLOW_MS', '500'))
+TRIPS_PROFILE_DIR = BASE_DIR / 'profiles'
+TRIPS_PROFILER = os.environ.get('TRIPS_PROFILER', 'cprofile')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -141,6 +283,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+# collectstatic 一併收集前端頁面與媒體檔（含 AR 素材），產生帶雜湊的檔名、manifest 與 .gz/.br（見 trips/storage.py）
+STATICFILES_DIRS = [
+    ('frontend', BASE_DIR.parent / 'frontend'),
+    ('media', BASE_DIR / 'media'),
+]
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'trips.storage.PrecompressedManifestStaticFilesStorage'},
+}
+
+# 由 Django 直接提供 /static/ 與 /media/（trips/middleware.py），DEBUG 關閉時預設開啟；
+# 前面有 nginx 時設 TRIPS_SERVE_ASSETS=0 並使用 asset_server_config 產生的設定
+TRIPS_SERVE_ASSETS = os.environ.get('TRIPS_SERVE_ASSETS', '0' if DEBUG else '1') == '1'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
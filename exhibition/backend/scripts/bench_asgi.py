@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""對已啟動的伺服器壓測 WSGI 與 ASGI 模式：每位模擬玩家輪流讀題目、讀進度、PATCH 進度。
+
+需要 httpx（uv sync --extra bench）。先分別啟動兩種模式，例如：
+
+    TRIPS_SERVER=wsgi BIND=127.0.0.1:8001 gunicorn -c gunicorn.conf.py
+    TRIPS_ASYNC_API=1 BIND=127.0.0.1:8002 gunicorn -c gunicorn.conf.py
+
+再執行：
+
+    python scripts/bench_asgi.py --target wsgi=http://127.0.0.1:8001 \\
+        --target asgi=http://127.0.0.1:8002 --concurrency 10 50 200 --duration 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchutil import percentile
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 壓測用的選用套件
+    httpx = None
+
+
+async def ensure_player(client, phone):
+    response = await client.post('/trips/api/user/', json={'phone': phone, 'gender': 'M'})
+    # 重複執行時玩家已存在，回 400 也可以繼續
+    if response.status_code not in (201, 400):
+        raise RuntimeError(f'建立玩家失敗：{response.status_code} {response.text}')
+
+
+async def player_loop(client, phone, questions, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        level = random.randint(1, questions)
+        requests = (
+            ('GET', f'/trips/api/question/{level}/', None),
+            ('GET', f'/trips/api/post-detail/{phone}/', None),
+            ('PATCH', f'/trips/api/post/{phone}/', {'level': level, 'choice': random.choice('ABCD')}),
+        )
+        for method, path, payload in requests:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=payload)
+                ok = response.status_code < 500
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors.append(path)
+
+
+async def run_level(base_url, concurrency, duration, questions):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        phones = [f'097{concurrency:03d}{index:04d}' for index in range(concurrency)]
+        await asyncio.gather(*(ensure_player(client, phone) for phone in phones))
+
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            player_loop(client, phone, questions, deadline, latencies, errors) for phone in phones
+        ))
+        elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--questions', type=int, default=29, help='資料庫中題目編號 1..N 必須存在')
+    args = parser.parse_args()
+
+    if httpx is None:
+        parser.error('需要 httpx：uv sync --extra bench')
+
+    targets = [target.split('=', 1) for target in args.target]
+    for name, base_url in targets:
+        for concurrency in args.concurrency:
+            rps, latencies, errors = asyncio.run(run_level(base_url, concurrency, args.duration, args.questions))
+            ms = [value * 1000 for value in latencies]
+            print(
+                f"{name:<6} c={concurrency:<4} {rps:8.1f} req/s "
+                f"p50={percentile(ms, 50):7.2f}ms p99={percentile(ms, 99):7.2f}ms errors={len(errors)}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""批次上傳與逐筆 PATCH 的吞吐量比較：每位玩家上傳 29 關答案。
+
+用法：
+    python scripts/bench_batch_submit.py --players 50
+"""
+import argparse
+import time
+import uuid
+
+from benchutil import create_questions, setup_django, summarize
+
+
+def answers_for(level_count):
+    return [
+        {'key': uuid.uuid4().hex, 'level': level, 'choice': 'A'}
+        for level in range(1, level_count + 1)
+    ]
+
+
+def run_single(client, phones, level_count):
+    latencies = []
+    started = time.perf_counter()
+    for phone in phones:
+        for answer in answers_for(level_count):
+            start = time.perf_counter()
+            response = client.patch(f'/trips/api/post/{phone}/', answer, content_type='application/json')
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.content
+    return time.perf_counter() - started, latencies
+
+
+def run_batch(client, phones, level_count):
+    latencies = []
+    started = time.perf_counter()
+    for phone in phones:
+        start = time.perf_counter()
+        response = client.post(
+            f'/trips/api/post/{phone}/batch/', {'answers': answers_for(level_count)}, content_type='application/json'
+        )
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--levels', type=int, default=29)
+    args = parser.parse_args()
+
+    setup_django()
+    create_questions()
+    from django.test import Client
+
+    from trips.models import Post, UserProfile
+
+    client = Client()
+    total = args.players * args.levels
+    for mode, runner in (('single PATCH', run_single), ('batch POST', run_batch)):
+        phones = [f'09{mode[0]}{i:07d}' for i in range(args.players)]
+        for phone in phones:
+            Post.objects.create(user=UserProfile.objects.create(phone=phone, gender='O'))
+        elapsed, latencies = runner(client, phones, args.levels)
+        summarize(mode, latencies, {
+            'requests': len(latencies),
+            'answers/s': f"{total / elapsed:.0f}",
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""SQLite 設定檔寫入競爭壓測：多個執行緒同時 PATCH 進度，比較各 DB_PROFILE 的吞吐量與錯誤數。
+
+DB_PROFILE 在 settings 載入時決定，因此每個設定檔各開一個子行程執行。
+
+用法：
+    python scripts/bench_db_profiles.py --threads 4 16 --requests 400
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchutil import create_questions, setup_django, summarize
+
+
+def run_profile(threads, total):
+    from django.db import close_old_connections, connections
+    from django.test import Client
+
+    from trips.models import Post, UserProfile
+
+    phones = [f'0960{threads:03d}{index:03d}' for index in range(threads * 4)]
+    for phone in phones:
+        Post.objects.create(user=UserProfile.objects.create(phone=phone, gender='O'))
+    connections.close_all()
+
+    def worker(worker_id):
+        # 500 時計入錯誤而不是拋出例外（database is locked）
+        client = Client(raise_request_exception=False)
+        latencies, errors = [], 0
+        try:
+            for i in range(total // threads):
+                phone = phones[(worker_id + i * threads) % len(phones)]
+                start = time.perf_counter()
+                response = client.patch(
+                    f'/trips/api/post/{phone}/',
+                    {'level': str(i % 29 + 1), 'choice': 'A'},
+                    content_type='application/json',
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+                # 測試 Client 不會觸發 request_finished 的連線回收，這裡模擬正式環境每個請求結束時的行為
+                close_old_connections()
+        finally:
+            connections.close_all()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [value for result in results for value in result[0]]
+    errors = sum(result[1] for result in results)
+    return elapsed, latencies, errors
+
+
+def child(args):
+    setup_django()
+    create_questions()
+    # database is locked 的 500 由 errors 欄位統計，不逐筆印出 traceback
+    logging.disable(logging.ERROR)
+    from django.conf import settings
+
+    for threads in args.threads:
+        elapsed, latencies, errors = run_profile(threads, args.requests)
+        summarize(f'{settings.DB_PROFILE} x{threads}', latencies, {
+            'req/s': f'{len(latencies) / elapsed:.1f}', 'errors': errors,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=['default', 'tuned'])
+    parser.add_argument('--threads', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    for profile in args.profiles:
+        command = [sys.executable, __file__, '--child', '--requests', str(args.requests), '--threads']
+        command += [str(threads) for threads in args.threads]
+        subprocess.run(command, env={**os.environ, 'DB_PROFILE': profile}, check=True)
+
+
+if __name__ == '__main__':
+    main()
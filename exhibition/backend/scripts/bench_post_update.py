@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""PostUpdateAPIView 壓測：每次 PATCH 的查詢數、延遲分佈，以及併發寫入後遺失的關卡數。
+
+用法：
+    python scripts/bench_post_update.py --requests 500 --threads 8
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchutil import create_questions, setup_django, summarize
+
+
+def sequential(client, phone, total):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, queries = [], []
+    for i in range(total):
+        level = str(i % 29 + 1)
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = client.patch(
+                f'/trips/api/post/{phone}/',
+                {'level': level, 'choice': 'A'},
+                content_type='application/json',
+            )
+            latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+        queries.append(len(ctx.captured_queries))
+    summarize('sequential PATCH', latencies, {'queries/PATCH': f"{sum(queries) / len(queries):.2f}"})
+
+
+def concurrent(phone, total, threads):
+    from django.db import connections
+    from django.test import Client
+
+    from trips.models import LevelResult
+
+    def worker(levels):
+        client = Client()
+        latencies, failures = [], 0
+        try:
+            for level in levels:
+                start = time.perf_counter()
+                response = client.patch(
+                    f'/trips/api/post/{phone}/',
+                    {'level': str(level), 'choice': 'B'},
+                    content_type='application/json',
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+        finally:
+            connections.close_all()
+        return latencies, failures
+
+    # 每個執行緒負責不同的關卡，但寫入的是同一個玩家
+    jobs = [[(i * threads + t) % 29 + 1 for i in range(total // threads)] for t in range(threads)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, jobs))
+
+    latencies = [value for result in results for value in result[0]]
+    failures = sum(result[1] for result in results)
+
+    touched = {level for levels in jobs for level in levels}
+    recorded = set(LevelResult.objects.filter(user_id=phone, status='fail').values_list('level', flat=True))
+    summarize(f'concurrent PATCH x{threads}', latencies,
+              {'non-200': failures, 'lost-levels': len(touched - recorded)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=290)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    create_questions()
+    from django.test import Client
+
+    from trips.models import Post, UserProfile
+
+    for phone in ('0900000001', '0900000002'):
+        Post.objects.create(user=UserProfile.objects.create(phone=phone, gender='O'))
+
+    sequential(Client(), '0900000001', args.requests)
+    concurrent('0900000002', args.requests, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""作答寫入模式壓測：多個執行緒同時 PATCH 進度，比較各 TRIPS_ANSWER_WRITES 的吞吐量、延遲與遺失的關卡數。
+
+TRIPS_ANSWER_WRITES 在 settings 載入時決定，因此每個模式各開一個子行程執行。append / queue 模式在壓測結束後
+先寫完佇列、整併全部事件，再比對回應 200 的關卡是否都寫進 LevelResult。
+
+--server asgi 時改為啟動 uvicorn（單一 worker，TRIPS_ASYNC_API=1）並以 httpx 併發送出請求，量測實際部署的
+ASGI 路徑；需要 httpx（uv sync --extra bench）。
+
+用法：
+    python scripts/bench_write_behind.py --threads 8 32 --requests 800
+    DB_PROFILE=tuned python scripts/bench_write_behind.py --server asgi --threads 8 32 --requests 800
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchutil import BACKEND_DIR, create_questions, setup_django, summarize
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 壓測用的選用套件
+    httpx = None
+
+
+def create_players(threads):
+    from django.db import connections
+
+    from trips.models import Post, UserProfile
+
+    phones = [f'0970{threads:03d}{index:03d}' for index in range(threads * 4)]
+    for phone in phones:
+        Post.objects.create(user=UserProfile.objects.create(phone=phone, gender='O'))
+    connections.close_all()
+    return phones
+
+
+def requests_for(phones, threads, total, worker_id):
+    """第 worker_id 個執行緒依序送出的 (手機, 關卡)。"""
+    return [(phones[(worker_id + i * threads) % len(phones)], i % 29 + 1) for i in range(total // threads)]
+
+
+def run_client(phones, threads, total):
+    """以 Django 測試 Client（WSGI）在多個執行緒中送出請求。"""
+    from django.db import close_old_connections, connections
+    from django.test import Client
+
+    def worker(worker_id):
+        client = Client(raise_request_exception=False)
+        latencies, errors, acked = [], 0, set()
+        try:
+            for phone, level in requests_for(phones, threads, total, worker_id):
+                start = time.perf_counter()
+                response = client.patch(
+                    f'/trips/api/post/{phone}/',
+                    {'level': str(level), 'choice': 'A'},
+                    content_type='application/json',
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code == 200:
+                    acked.add((phone, level))
+                else:
+                    errors += 1
+                close_old_connections()
+        finally:
+            connections.close_all()
+        return latencies, errors, acked
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    return time.perf_counter() - started, results
+
+
+def run_asgi(phones, threads, total):
+    """啟動 uvicorn 並以 httpx 併發送出請求；結束時以 SIGTERM 停止，讓 queue 模式寫完佇列。"""
+    from django.db import connection
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = {**os.environ, 'DB_NAME': connection.settings_dict['NAME'], 'TRIPS_ASYNC_API': '1', 'DJANGO_DEBUG': '0'}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'mysite.asgi:application', '--port', str(port),
+         '--log-level', 'warning', '--no-access-log'],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        return asyncio.run(drive_asgi(f'http://127.0.0.1:{port}', phones, threads, total))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def drive_asgi(base_url, phones, threads, total):
+    limits = httpx.Limits(max_connections=threads, max_keepalive_connections=threads)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for _ in range(100):
+            try:
+                await client.get('/trips/api/question/1/')
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+        async def worker(worker_id):
+            latencies, errors, acked = [], 0, set()
+            for phone, level in requests_for(phones, threads, total, worker_id):
+                start = time.perf_counter()
+                try:
+                    response = await client.patch(f'/trips/api/post/{phone}/', json={'level': str(level), 'choice': 'A'})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                if ok:
+                    acked.add((phone, level))
+                else:
+                    errors += 1
+            return latencies, errors, acked
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(worker(worker_id) for worker_id in range(threads)))
+        return time.perf_counter() - started, results
+
+
+def run_mode(server, threads, total):
+    from trips.models import LevelResult
+
+    phones = create_players(threads)
+    elapsed, results = (run_asgi if server == 'asgi' else run_client)(phones, threads, total)
+
+    drain()
+    passed = set(LevelResult.objects.filter(user_id__in=phones, status='pass').values_list('user_id', 'level'))
+    latencies = [value for result in results for value in result[0]]
+    errors = sum(result[1] for result in results)
+    acked = set().union(*(result[2] for result in results))
+    return elapsed, latencies, errors, len(acked - passed)
+
+
+def drain():
+    """寫完佇列中的寫入並整併全部事件（sync 模式沒有待整併的事件）。"""
+    from django.conf import settings
+
+    from trips.answer_log import compact_events
+
+    if settings.TRIPS_ANSWER_WRITES == 'queue':
+        from trips.write_behind import shutdown
+
+        shutdown()
+    compact_events(delay=0)
+
+
+def child(args):
+    setup_django()
+    create_questions()
+    logging.disable(logging.ERROR)
+    from django.conf import settings
+
+    for threads in args.threads:
+        elapsed, latencies, errors, lost = run_mode(args.server, threads, args.requests)
+        summarize(f'{args.server} {settings.TRIPS_ANSWER_WRITES} x{threads}', latencies, {
+            'req/s': f'{len(latencies) / elapsed:.1f}', 'errors': errors, 'lost': lost,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['sync', 'append', 'queue'])
+    parser.add_argument('--threads', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--requests', type=int, default=800)
+    parser.add_argument('--server', choices=['client', 'asgi'], default='client',
+                        help='client：Django 測試 Client（WSGI）；asgi：uvicorn + async view')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.server == 'asgi' and httpx is None:
+        parser.error('需要 httpx：uv sync --extra bench')
+    if args.child:
+        child(args)
+        return
+
+    for mode in args.modes:
+        command = [sys.executable, __file__, '--child', '--server', args.server, '--requests', str(args.requests)]
+        command += ['--threads', *[str(threads) for threads in args.threads]]
+        subprocess.run(command, env={**os.environ, 'TRIPS_ANSWER_WRITES': mode}, check=True)
+
+
+if __name__ == '__main__':
+    main()
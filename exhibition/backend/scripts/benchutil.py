@@ -0,0 +1,64 @@
+"""壓測腳本共用的工具：初始化 Django、建立獨立的測試資料庫與題目、統計延遲。"""
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None):
+    """載入 Django 並在暫存的 SQLite 檔案上建立全新的資料庫，不會動到 db.sqlite3。"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    # 壓測時衝突與 4xx 是預期內的結果，由統計數字呈現，不逐筆印出
+    logging.disable(logging.WARNING)
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='trips-bench-'), 'bench.sqlite3')
+    # 使用檔案型資料庫（而非 in-memory），多執行緒時才會有真實的鎖競爭
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = db_path
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return db_path
+
+
+def create_questions(count=29, answer='A'):
+    """建立第 1..count 題（正確答案都是 answer），PATCH 與批次上傳帶 choice 時由伺服器判斷對錯。"""
+    from trips.models import Question
+
+    Question.objects.bulk_create([
+        Question(
+            number=number, batch='壓測', route='ABC'[(number - 1) * 3 // count], title=f'廠商{number}',
+            question=f'第 {number} 題', choiceA='A', choiceB='B', choiceC='C', choiceD='D', answer=answer,
+        )
+        for number in range(1, count + 1)
+    ])
+
+
+def percentile(samples, pct):
+    """最近秩法的百分位數，samples 為空時回傳 0。"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(label, latencies, extra=None):
+    """印出一行延遲統計（毫秒）。"""
+    ms = [value * 1000 for value in latencies]
+    line = (
+        f"{label:<28} n={len(ms):<6} "
+        f"p50={percentile(ms, 50):7.2f}ms p99={percentile(ms, 99):7.2f}ms max={max(ms, default=0):7.2f}ms"
+    )
+    if extra:
+        line += ' ' + ' '.join(f"{key}={value}" for key, value in extra.items())
+    print(line)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""活動日負載測試：模擬玩家陸續到場、註冊、讀取進度，沿 A/B/C 路線逐關讀題並送出答案。
+
+每位玩家的流程：
+    POST /trips/api/user/                 註冊
+    GET  /trips/api/post-detail/{phone}/  讀取進度
+    GET  /trips/api/route/{route}/{phone}/ 進入路線
+    依路線的每一關：GET /trips/api/question/{n}/ → 思考 → POST /trips/api/post/{phone}/answer/（只送選項）
+    GET  /trips/api/post-detail/{phone}/  完成後查看成績
+
+輸出各端點的請求數、每秒請求數、p50/p90/p99 延遲與錯誤率，可存成 JSON 報告並與基準比較。
+不指定 --url 時在暫存資料庫上以行程內的 ASGI 應用程式執行，並匯入 loadtest_questions.json；
+對已啟動的伺服器測試前，先以同一份題目檔匯入：
+
+    python manage.py import_questions scripts/loadtest_questions.json --no-download
+
+用法（需要 httpx，uv sync --extra bench）：
+    python scripts/loadtest_event_day.py --players 300 --concurrency 50
+    python scripts/loadtest_event_day.py --url http://127.0.0.1:8000 --players 2000 --concurrency 200
+    python scripts/loadtest_event_day.py --report /tmp/report.json --baseline scripts/loadtest_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+from benchutil import percentile, setup_django
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 壓測用的選用套件
+    httpx = None
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+QUESTIONS_FIXTURE = SCRIPTS_DIR / 'loadtest_questions.json'
+BASELINE = SCRIPTS_DIR / 'loadtest_baseline.json'
+ENDPOINTS = ('register', 'post-detail', 'route', 'question', 'answer')
+# 玩家選擇路線的比例：A 線最短、C 線最長
+ROUTE_WEIGHTS = {'A': 0.4, 'B': 0.35, 'C': 0.25}
+
+
+class Recorder:
+    """依端點累計延遲（秒）與錯誤數。"""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.statuses = {}
+
+    async def request(self, client, endpoint, method, path, expected=200, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as exc:
+            response, status = None, type(exc).__name__
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if status != expected:
+            self.errors[endpoint] += 1
+            self.statuses[f'{endpoint} {status}'] = self.statuses.get(f'{endpoint} {status}', 0) + 1
+            return None
+        return response
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name in ENDPOINTS:
+            ms = [value * 1000 for value in self.latencies[name]]
+            endpoints[name] = {
+                'requests': len(ms),
+                'rps': round(len(ms) / elapsed, 1),
+                'p50_ms': round(percentile(ms, 50), 2),
+                'p90_ms': round(percentile(ms, 90), 2),
+                'p99_ms': round(percentile(ms, 99), 2),
+                'error_rate': round(self.errors[name] / len(ms), 4) if ms else 0.0,
+            }
+        total = [value * 1000 for values in self.latencies.values() for value in values]
+        endpoints['total'] = {
+            'requests': len(total),
+            'rps': round(len(total) / elapsed, 1),
+            'p50_ms': round(percentile(total, 50), 2),
+            'p90_ms': round(percentile(total, 90), 2),
+            'p99_ms': round(percentile(total, 99), 2),
+            'error_rate': round(sum(self.errors.values()) / len(total), 4) if total else 0.0,
+        }
+        return endpoints
+
+
+async def play(client, recorder, rng, phone, routes, answers, think):
+    """一位玩家從註冊到走完一條路線。"""
+    response = await recorder.request(
+        client, 'register', 'POST', '/trips/api/user/', expected=201,
+        json={'phone': phone, 'gender': rng.choice('MFO')},
+    )
+    if response is None:
+        return
+    await recorder.request(client, 'post-detail', 'GET', f'/trips/api/post-detail/{phone}/')
+
+    route = rng.choices(list(ROUTE_WEIGHTS), weights=list(ROUTE_WEIGHTS.values()))[0]
+    await recorder.request(client, 'route', 'GET', f'/trips/api/route/{route}/{phone}/')
+    for number in routes.get(route, []):
+        await asyncio.sleep(rng.uniform(0, think))
+        await recorder.request(client, 'question', 'GET', f'/trips/api/question/{number}/')
+        await asyncio.sleep(rng.uniform(0, think))
+        correct = rng.random() < 0.8
+        choice = answers[number] if correct else rng.choice([c for c in 'ABCD' if c != answers[number]])
+        # 與前端相同只送選項，對錯由伺服器判斷
+        await recorder.request(client, 'answer', 'POST', f'/trips/api/post/{phone}/answer/', json={
+            'level': number, 'choice': choice,
+        })
+    await recorder.request(client, 'post-detail', 'GET', f'/trips/api/post-detail/{phone}/')
+
+
+async def run(client, args, routes, answers):
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # 每次執行使用不同的號碼段，對同一台伺服器重複測試時不會撞號
+    prefix = f'08{int(time.time()) % 10000:04d}' if args.url else '0800'
+    players = [(f'{prefix}{index:04d}', random.Random(rng.random())) for index in range(args.players)]
+
+    async def arrive(index, phone, player_rng):
+        # 玩家在 --ramp 秒內陸續到場，同時在場的人數上限為 --concurrency
+        await asyncio.sleep(args.ramp * index / max(args.players, 1))
+        async with semaphore:
+            await play(client, recorder, player_rng, phone, routes, answers, args.think)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(arrive(index, phone, player_rng) for index, (phone, player_rng) in enumerate(players)))
+    return recorder, time.perf_counter() - started
+
+
+def load_questions():
+    questions = json.loads(QUESTIONS_FIXTURE.read_text(encoding='utf-8'))
+    routes = {}
+    for question in sorted(questions, key=lambda q: q['number']):
+        routes.setdefault(question['route'], []).append(question['number'])
+    return questions, routes, {q['number']: q['answer'] for q in questions}
+
+
+def in_process_client(args):
+    """在暫存資料庫匯入題目，回傳直接呼叫 ASGI 應用程式的 client。
+
+    ASGI 下每個同步請求各自在新的執行緒、以新的連線存取資料庫，預設使用現場的 DB_PROFILE=tuned；
+    以 DB_PROFILE=default 執行可重現 database is locked。
+    """
+    os.environ.setdefault('DB_PROFILE', 'tuned')
+    setup_django()
+    from django.core.asgi import get_asgi_application
+
+    from trips.question_io import read_rows, upsert_questions, validate_rows
+
+    with open(QUESTIONS_FIXTURE, 'rb') as fp:
+        upsert_questions(validate_rows(read_rows(fp, 'json')))
+    transport = httpx.ASGITransport(app=get_asgi_application())
+    return httpx.AsyncClient(transport=transport, base_url='http://testserver', timeout=args.timeout)
+
+
+def compare(report, baseline, tolerance):
+    """與基準比較，回傳退步項目的說明；延遲超過基準 (1 + tolerance) 倍或錯誤率上升即算退步。"""
+    problems = []
+    for name, current in report['endpoints'].items():
+        previous = baseline['endpoints'].get(name)
+        if not previous:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            # 1 毫秒以內的差異視為誤差
+            limit = previous[key] * (1 + tolerance) + 1
+            if current[key] > limit:
+                problems.append(f'{name} {key} {current[key]:.2f} > {limit:.2f}（基準 {previous[key]:.2f}）')
+        if current['error_rate'] > previous['error_rate'] + 0.001:
+            problems.append(f'{name} error_rate {current["error_rate"]:.2%}（基準 {previous["error_rate"]:.2%}）')
+    return problems
+
+
+def print_report(report):
+    print(f"{'endpoint':<12} {'requests':>8} {'req/s':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'errors':>7}")
+    for name, row in report['endpoints'].items():
+        print(
+            f"{name:<12} {row['requests']:>8} {row['rps']:>8.1f} {row['p50_ms']:>7.2f}ms "
+            f"{row['p90_ms']:>7.2f}ms {row['p99_ms']:>7.2f}ms {row['error_rate']:>7.2%}"
+        )
+    for status, count in sorted(report['failures'].items()):
+        print(f'  {status}: {count}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='已啟動的伺服器；不指定時在暫存資料庫上以行程內的 ASGI 執行')
+    parser.add_argument('--players', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=50, help='同時在場的玩家數')
+    parser.add_argument('--ramp', type=float, default=5, help='玩家在幾秒內陸續到場')
+    parser.add_argument('--think', type=float, default=0.05, help='每次操作前的最長思考時間（秒）')
+    parser.add_argument('--seed', type=int, default=2025, help='路線、答題與思考時間的亂數種子')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--report', help='把結果存成 JSON')
+    parser.add_argument('--baseline', nargs='?', const=str(BASELINE), help=f'與基準報告比較，預設 {BASELINE.name}')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='延遲可超過基準的比例')
+    args = parser.parse_args()
+
+    if httpx is None:
+        parser.error('需要 httpx：uv sync --extra bench')
+
+    questions, routes, answers = load_questions()
+    if args.url:
+        client = httpx.AsyncClient(
+            base_url=args.url, timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency),
+        )
+    else:
+        client = in_process_client(args)
+
+    async def main_async():
+        async with client:
+            return await run(client, args, routes, answers)
+
+    recorder, elapsed = asyncio.run(main_async())
+    report = {
+        'target': args.url or f"in-process ASGI (SQLite, DB_PROFILE={os.environ['DB_PROFILE']})",
+        'python': platform.python_version(),
+        'settings': {key: getattr(args, key) for key in ('players', 'concurrency', 'ramp', 'think', 'seed')},
+        'questions': len(questions),
+        'elapsed_s': round(elapsed, 2),
+        'endpoints': recorder.report(elapsed),
+        'failures': recorder.statuses,
+    }
+    print_report(report)
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        if baseline['settings'] != report['settings']:
+            print(f'注意：與基準的參數不同 {baseline["settings"]}')
+        problems = compare(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f'退步：{problem}')
+        if problems:
+            sys.exit(1)
+        print('與基準相比沒有退步')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,178 @@
-from django.contrib import admin
-from .models import Question, UserProfile, Post
+from django.contrib import admin, messages
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .cache import get_route_levels
+from .forms import QuestionImportForm
+from .models import AnswerEvent, LevelResult, Question, UserProfile, Post
+from .progress import ANSWERED
+from .question_io import QuestionImportError, detect_format, export_questions, import_questions
 
 # Register your models here.
-admin.site.register(Question)
 
-class UserProfileAdmin(admin.ModelAdmin):
+
+class QuestionAdmin(admin.ModelAdmin):
+    list_display = ('number', 'route', 'batch', 'title', 'answer', 'updated_at')
+    list_filter = ('route', 'batch')
+    search_fields = ('title', 'question')
+    ordering = ('number',)
+    actions = ('export_csv',)
+    change_list_template = 'admin/trips/question/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='trips_question_import'),
+            *super().get_urls(),
+        ]
+
+    def import_view(self, request):
+        """上傳 CSV / XLSX / JSON 批次匯入題目，驗證失敗時列出錯誤、不寫入任何資料。"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect('admin:trips_question_changelist')
+        form = QuestionImportForm(request.POST or None, request.FILES or None)
+        errors = []
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            dry_run = form.cleaned_data['dry_run']
+            try:
+                summary = import_questions(upload, detect_format(upload.name), dry_run=dry_run)
+            except QuestionImportError as exc:
+                errors = exc.errors
+            except ValueError as exc:
+                form.add_error('file', str(exc))
+            else:
+                for warning in summary['warnings']:
+                    self.message_user(request, warning, messages.WARNING)
+                if dry_run:
+                    self.message_user(request, f'驗證通過：{summary["rows"]} 題，未寫入資料庫')
+                    return redirect('admin:trips_question_import')
+                self.message_user(request, (
+                    f'匯入 {summary["rows"]} 題：新增 {summary["created"]}、更新 {summary["updated"]}。'
+                    '若路線有變動，請再執行 rebuild_progress_counters 與 build_route_targets'
+                ), messages.SUCCESS)
+                return redirect('admin:trips_question_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': '匯入題目',
+            'opts': self.model._meta,
+            'form': form,
+            'errors': errors,
+        }
+        return TemplateResponse(request, 'admin/trips/question/import.html', context)
+
+    @admin.action(description='匯出選取的題目（CSV）')
+    def export_csv(self, request, queryset):
+        response = HttpResponse(export_questions('csv', queryset), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="questions.csv"'
+        return response
+
+admin.site.register(Question, QuestionAdmin)
+
+
+class PhoneSearchMixin:
+    """以手機號碼開頭搜尋，轉成主鍵範圍查詢（>= 0912 且 < 0913）可直接使用索引，
+    不用 LIKE '%...%' 掃過每一列。"""
+    phone_field = 'user_id'
+    search_help_text = '輸入完整手機號碼或開頭幾碼'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        return queryset.filter(**{f'{self.phone_field}__gte': term, f'{self.phone_field}__lt': upper}), False
+
+
+class UserProfileAdmin(PhoneSearchMixin, admin.ModelAdmin):
     list_display = ('gender', 'phone')  # 显示用户信息
+    phone_field = 'phone'
+    search_fields = ('phone',)
 
 admin.site.register(UserProfile, UserProfileAdmin)
 
-class PostAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at')  # 显示Post的信息
-    search_fields = ('user__phone', 'content')  # 添加搜索功能，可以根据用户电话和内容搜索
-    list_filter = ('created_at', 'updated_at')  # 过滤器，可以按创建时间和更新时间过滤
+
+class ProgressFilter(admin.SimpleListFilter):
+    """依 Post 上預先累計的通過/失敗數篩選；玩家只走其中一條路線，答完任一路線的全部關卡即算完成。"""
+    title = '作答進度'
+    parameter_name = 'progress'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('none', '尚未作答'),
+            ('playing', '作答中'),
+            ('finished', '全部關卡已作答'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'none':
+            return queryset.filter(passed_count=0, failed_count=0)
+        if self.value() not in ('playing', 'finished'):
+            return queryset
+        queryset, finished = self.with_route_progress(queryset.alias(answered=F('passed_count') + F('failed_count')))
+        if self.value() == 'playing':
+            return queryset.filter(answered__gt=0).exclude(finished)
+        return queryset.filter(finished)
+
+    @staticmethod
+    def with_route_progress(queryset):
+        """加上各路線已作答的關卡數，回傳 (queryset, 答完任一路線的條件)。
+
+        作答數不到最短路線的關卡數就不可能完成，條件先比對 Post 上的累計數，其餘玩家才需要計算各路線的作答數。
+        """
+        routes = list(get_route_levels().values())
+        if not routes:
+            return queryset, Q(pk__in=[])
+        finished = Q()
+        for index, levels in enumerate(routes):
+            answered = LevelResult.objects.filter(
+                user_id=OuterRef('user_id'), level__in=levels, status__in=ANSWERED,
+            ).values('user_id').annotate(count=Count('pk')).values('count')
+            queryset = queryset.alias(**{f'route_{index}': Coalesce(Subquery(answered), Value(0))})
+            finished |= Q(**{f'route_{index}': len(levels)})
+        return queryset, Q(answered__gte=min(map(len, routes))) & finished
+
+
+class PostAdmin(PhoneSearchMixin, admin.ModelAdmin):
+    list_display = ('user', 'passed_count', 'failed_count', 'updated_at', 'created_at')  # 显示Post的信息
+    list_select_related = ('user',)
+    search_fields = ('user__phone',)  # 添加搜索功能，可以根据用户电话搜索
+    list_filter = (ProgressFilter, 'updated_at', 'created_at')  # 过滤器，可以按作答進度、更新时间和创建时间过滤
+    ordering = ('-updated_at',)
+    # 不另外計算未篩選前的總筆數
+    show_full_result_count = False
 
 admin.site.register(Post, PostAdmin)
+
+
+class LevelResultAdmin(PhoneSearchMixin, admin.ModelAdmin):
+    list_display = ('user', 'level', 'status', 'user_answer', 'correct_answer', 'answered_at')
+    list_select_related = ('user',)
+    list_filter = ('level', 'status')
+    search_fields = ('user__phone',)
+    show_full_result_count = False
+
+admin.site.register(LevelResult, LevelResultAdmin)
+
+
+class AnswerEventAdmin(PhoneSearchMixin, admin.ModelAdmin):
+    """作答事件紀錄只供查詢；更正請追加事件（replay_answer_events --regrade）或修改 LevelResult。"""
+    list_display = ('id', 'phone', 'level', 'status', 'user_answer', 'correct_answer', 'choice', 'created_at')
+    list_filter = ('level', 'status')
+    search_fields = ('phone',)
+    phone_field = 'phone'
+    ordering = ('-id',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(AnswerEvent, AnswerEventAdmin)
@@ -0,0 +1,159 @@
+# trips/answer_log.py
+"""作答事件紀錄（AnswerEvent）的整併、重播與重新判分。
+
+每次作答都新增一筆 AnswerEvent，只記錄該次提供的欄位，從不修改；LevelResult、Post 的通過/失敗數與計數器
+是依事件整併出的目前狀態，ProgressSnapshot 記錄已整併到哪一筆事件。
+    compact_events  把快照之後的事件整併進 LevelResult 與計數器（append 模式由 compact_answer_events 定期執行）
+    replay_events   清除 LevelResult 後依全部事件重建，再重算統計（replay_answer_events 指令）
+    regrade_events  題目答案修正後，依目前的正確答案重新判斷由伺服器判分的作答，結果不同時追加更正事件
+
+事件 id 在新增時配發，但 PostgreSQL 上交易 commit 的順序可能與 id 不同；append 模式只整併存在超過
+compact_delay() 秒的事件，避免快照越過還沒 commit 的事件。多個整併程序（例如每個 worker 的
+write_behind 整併執行緒）以快照列的鎖輪流執行。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AnswerEvent, LevelResult, ProgressSnapshot, UserProfile
+from .progress import SNAPSHOT_ID, append_only, apply_changes, judge_answer, rebuild_counters, upsert_results
+
+
+def fold_events(events):
+    """依寫入順序合併事件，回傳 {(phone, level): (欄位, 最後一筆事件)}，後面的事件覆寫前面的欄位。"""
+    merged = {}
+    for event in events:
+        fields, _ = merged.get((event.phone, event.level), ({}, None))
+        merged[(event.phone, event.level)] = ({**fields, **event.as_fields()}, event)
+    return merged
+
+
+def lock_snapshot():
+    """在交易內鎖定快照列，同一時間只有一個整併或重播。"""
+    snapshot, _ = ProgressSnapshot.objects.select_for_update().get_or_create(pk=SNAPSHOT_ID)
+    return snapshot
+
+
+def apply_events(events):
+    """把一批事件套用到 LevelResult，並依狀態變化更新統計（apply_changes），需在交易內呼叫。
+
+    sync 模式寫入時 LevelResult 的作答時間與事件相同，作答時間不早於事件的關卡表示已套用過（或之後又寫入過），略過。
+    """
+    merged = fold_events(events)
+    phones = {phone for phone, _ in merged}
+    current = {
+        (phone, level): (level_status, answered_at)
+        for phone, level, level_status, answered_at in LevelResult.objects.select_for_update()
+        .filter(user_id__in=phones).values_list('user_id', 'level', 'status', 'answered_at')
+    }
+
+    by_fields = {}
+    changes = {}
+    for (phone, level), (fields, last) in merged.items():
+        old_status, answered_at = current.get((phone, level), (None, None))
+        if answered_at is not None and answered_at >= last.created_at:
+            continue
+        by_fields.setdefault(tuple(sorted(fields)), []).append(
+            LevelResult(user_id=phone, level=level, answered_at=last.created_at, **fields)
+        )
+        player_changes, now = changes.get(phone, ([], last.created_at))
+        player_changes.append((level, old_status, fields.get('status', old_status or 'null')))
+        changes[phone] = (player_changes, max(now, last.created_at))
+
+    for fields, results in by_fields.items():
+        upsert_results(results, fields)
+    for phone, (player_changes, now) in changes.items():
+        apply_changes(phone, player_changes, now)
+
+
+def compact_delay():
+    """append / queue 模式整併前等待的秒數，需不小於事件從 created_at 到 commit 的最長時間。
+
+    queue 模式的合併交易最晚在請求逾時（TRIPS_WRITE_BEHIND_TIMEOUT）前開始（見 write_behind.GroupCommitWriter.submit），
+    因此在 TRIPS_ANSWER_COMPACT_DELAY 之外再加上逾時秒數；TRIPS_ANSWER_COMPACT_DELAY 為 0 的 SQLite 依序寫入，不需等待。
+    """
+    if not settings.TRIPS_ANSWER_COMPACT_DELAY:
+        return 0
+    return settings.TRIPS_ANSWER_COMPACT_DELAY + settings.TRIPS_WRITE_BEHIND_TIMEOUT
+
+
+def compact_events(batch_size=None, delay=None):
+    """把快照之後的事件依序整併，每批一個交易，回傳整併的事件數。
+
+    delay 預設為 append 模式的 compact_delay()（sync 模式寫入時已套用，不需等待）。
+    """
+    batch_size = batch_size or settings.TRIPS_ANSWER_COMPACT_BATCH
+    if delay is None:
+        delay = compact_delay() if append_only() else 0
+    total = 0
+    while True:
+        cutoff = timezone.now() - timedelta(seconds=delay)
+        with transaction.atomic():
+            snapshot = lock_snapshot()
+            events = []
+            for event in AnswerEvent.objects.filter(id__gt=snapshot.event_id).order_by('id')[:batch_size]:
+                # 依 id 順序遇到太新的事件就停下，之後的留到下一次
+                if event.created_at > cutoff:
+                    break
+                events.append(event)
+            if not events:
+                return total
+            apply_events(events)
+            snapshot.event_id = events[-1].id
+            snapshot.save()
+        total += len(events)
+
+
+def regrade_events(phone=None):
+    """依目前的正確答案重新判斷各關最後一次由伺服器判分的作答，結果不同時追加更正事件並回傳。
+
+    更正事件與一般作答一樣需要整併（compact_events）才會反映到 LevelResult 與統計。
+    """
+    events = AnswerEvent.objects.exclude(status=None).order_by('id')
+    if phone is not None:
+        events = events.filter(phone=phone)
+    latest = {(event.phone, event.level): event for event in events.iterator(chunk_size=2000)}
+
+    now = timezone.now()
+    corrections = []
+    for (player, level), event in latest.items():
+        if not event.choice:
+            continue
+        fields = judge_answer(level, event.choice)
+        if fields is None or (fields['status'], fields['correct_answer']) == (event.status, event.correct_answer):
+            continue
+        corrections.append(AnswerEvent(phone=player, level=level, choice=event.choice, created_at=now, **fields))
+    return AnswerEvent.objects.bulk_create(corrections)
+
+
+def replay_events(phone=None):
+    """先整併到最新，再清除 LevelResult、依快照之前的全部事件重建並重算統計，回傳重建的關卡數。
+
+    只重建仍存在的玩家；LevelResult 在後台的手動修改會被事件紀錄的內容取代。請在沒有人作答時執行。
+    """
+    compact_events(delay=0)
+    with transaction.atomic():
+        snapshot = lock_snapshot()
+        events = AnswerEvent.objects.filter(id__lte=snapshot.event_id).order_by('id')
+        results = LevelResult.objects.all()
+        players = UserProfile.objects.all()
+        if phone is not None:
+            events = events.filter(phone=phone)
+            results = results.filter(user_id=phone)
+            players = players.filter(phone=phone)
+        players = set(players.values_list('phone', flat=True))
+
+        merged = fold_events(events.iterator(chunk_size=2000))
+        results.delete()
+        LevelResult.objects.bulk_create(
+            [
+                LevelResult(user_id=player, level=level, answered_at=last.created_at, **fields)
+                for (player, level), (fields, last) in merged.items()
+                if player in players
+            ],
+            batch_size=1000,
+        )
+        rebuild_counters()
+    return sum(player in players for player, _ in merged)
@@ -0,0 +1,224 @@
+# trips/assets.py
+"""靜態檔案與大型 AR 素材的傳送：強 ETag、條件請求（304）、HTTP Range（206）與預先壓縮的 .br/.gz。
+
+AssetMiddleware（trips/middleware.py）用它提供 STATIC_ROOT 與 MEDIA_ROOT 的檔案；
+前面若有 nginx，改用 asset_server_config 指令產生的設定即可，行為相同。
+/api/assets/ 與 /api/asset-chunks/（AR 素材）不論設定都由 Django 提供，並附分段校驗碼供前端續傳。
+ASGI 請求的內容以 async iterator 逐段讀取（見 trips/streaming.py），大型素材不會先整個讀進記憶體。
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils._os import safe_join
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .images import MANIFEST_NAME, OPTIMIZED_DIR
+from .streaming import BLOCK_SIZE, aread_file, is_asgi
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# 依偏好順序：(Content-Encoding, 預先壓縮檔的副檔名)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+mimetypes.add_type('model/gltf+json', '.gltf')
+mimetypes.add_type('model/gltf-binary', '.glb')
+
+_digests = {}
+_chunk_manifests = {}
+
+
+def file_digest(path, stat=None):
+    """檔案內容的 SHA-256，以 (大小, 修改時間) 判斷是否需要重新計算。"""
+    stat = stat or os.stat(path)
+    cached = _digests.get(path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024 * 1024), b''):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+    _digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def file_etag(path, stat=None):
+    return f'"{file_digest(path, stat)[:32]}"'
+
+
+def chunk_manifest(path, chunk_size=None):
+    """檔案的分段校驗表：{size, sha256, etag, chunk_size, chunks: [{offset, length, sha256}]}。
+
+    前端依此以 Range 逐段下載並驗證，斷線後只需重新下載缺少或損壞的分段。
+    """
+    chunk_size = chunk_size or getattr(settings, 'TRIPS_ASSET_CHUNK_SIZE', 256 * 1024)
+    stat = os.stat(path)
+    cached = _chunk_manifests.get((path, chunk_size))
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    hasher, chunks, offset = hashlib.sha256(), [], 0
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(chunk_size), b''):
+            hasher.update(block)
+            chunks.append({'offset': offset, 'length': len(block), 'sha256': hashlib.sha256(block).hexdigest()})
+            offset += len(block)
+    digest = hasher.hexdigest()
+    _digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    manifest = {
+        'size': offset,
+        'sha256': digest,
+        'etag': f'"{digest[:32]}"',
+        'chunk_size': chunk_size,
+        'chunks': chunks,
+    }
+    _chunk_manifests[(path, chunk_size)] = (stat.st_size, stat.st_mtime_ns, manifest)
+    return manifest
+
+
+def media_path(name):
+    """MEDIA_ROOT 下的檔案路徑，跳出目錄或不是檔案時拋出 Http404。"""
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+    return path
+
+
+def media_cache_control(relative):
+    """media/optimized/ 下帶雜湊的檔案可長期快取，manifest 與其他媒體檔每次重新驗證。"""
+    if relative.startswith(f'{OPTIMIZED_DIR}/') and not relative.endswith(MANIFEST_NAME):
+        return IMMUTABLE
+    return REVALIDATE
+
+
+def parse_range(header, size):
+    """解析單一 bytes 範圍，回傳含頭含尾的 (start, end)。
+
+    不支援的格式（例如多段範圍）回傳 None，改回完整內容；範圍超出檔案時拋出 ValueError（416）。
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError('空的範圍')
+        start, end = max(size - suffix, 0), size - 1
+    if start >= size:
+        raise ValueError('範圍超出檔案大小')
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        while length > 0:
+            data = fp.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _content(request, path, start, length):
+    """path 從 start 起 length bytes 的內容；ASGI 請求回傳 async iterator。"""
+    if not is_asgi(request):
+        return read_range(path, start, length)
+    fp = open(path, 'rb')
+    fp.seek(start)
+    return aread_file(fp, length)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """If-Range 的驗證值與目前檔案相符時才回傳部分內容，否則整個檔案重傳。"""
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _pick_encoding(request, path):
+    accept = request.headers.get('Accept-Encoding', '')
+    for encoding, suffix in ENCODINGS:
+        if encoding in accept and os.path.isfile(path + suffix):
+            return encoding, path + suffix
+    return None, path
+
+
+def serve_file(request, path, cache_control=REVALIDATE):
+    """回傳 path 的內容，處理 If-None-Match / If-Modified-Since、Range / If-Range 與預先壓縮檔。"""
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    last_modified = int(stat.st_mtime)
+    etag = file_etag(path, stat)
+    compressible = any(os.path.isfile(path + suffix) for _, suffix in ENCODINGS)
+
+    range_header = request.headers.get('Range')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        # 續傳一律使用未壓縮的內容，位移才與檔案一致
+        encoding, served_path, served_etag = None, path, etag
+    else:
+        range_header = None
+        encoding, served_path = _pick_encoding(request, path)
+        served_etag = f'"{etag[1:-1]}-{encoding}"' if encoding else etag
+
+    response = get_conditional_response(request, etag=served_etag, last_modified=last_modified)
+    if response is None:
+        size = os.path.getsize(served_path)
+        try:
+            byte_range = parse_range(range_header, size) if range_header else None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _content(request, served_path, start, end - start + 1), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        elif is_asgi(request):
+            # FileResponse 的內容是同步 iterator，ASGI 下會整個讀進記憶體才送出
+            response = StreamingHttpResponse(_content(request, served_path, 0, size), content_type=content_type)
+            response['Content-Length'] = str(size)
+            response['Content-Disposition'] = content_disposition_header(False, os.path.basename(path))
+        else:
+            response = FileResponse(
+                open(served_path, 'rb'), content_type=content_type, filename=os.path.basename(path)
+            )
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = served_etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    if compressible:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
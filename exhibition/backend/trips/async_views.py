@@ -0,0 +1,99 @@
+# trips/async_views.py
+"""ASGI 模式下使用的 async view（settings.TRIPS_ASYNC_API 開啟時由 trips/urls.py 掛上）。
+
+與 views.py 中對應的 APIView 回傳完全相同的內容與狀態碼，差別在於讀取使用 Django 的
+async ORM，不佔用 worker 執行緒；寫入需要交易，仍透過 sync_to_async 交給同步的
+record_level 處理，只有 queue 模式直接在事件迴圈上等待合併寫入（progress.arecord_level）。
+進度推播的 SSE 端點（player_events、progress_events）只在這個模式提供。
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+from rest_framework import serializers, status
+
+from .cache import aget_question_entry
+from .events import PROGRESS_CHANNEL, event_response, player_channel
+from .images import select_icon, tagged_etag
+from .models import Post
+from .progress import aload_content, arecord_level, judge_answer, parse_level_update, progress_summary
+
+# 與 DRF 輸出相同的時間格式
+datetime_field = serializers.DateTimeField()
+
+
+@require_GET
+async def question_detail(request, question_id):
+    entry = await aget_question_entry(question_id)
+    if entry is None:
+        return JsonResponse({"res": "Object with question id does not exist"}, status=status.HTTP_400_BAD_REQUEST)
+
+    data, tag = select_icon(entry['data'], request)
+    etag = tagged_etag(entry['etag'], tag)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=entry['last_modified'])
+    if not_modified is not None:
+        return not_modified
+
+    response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@require_GET
+async def post_detail(request, phone):
+    updated_at = await Post.objects.filter(user_id=phone).values_list('updated_at', flat=True).afirst()
+    if updated_at is None:
+        return JsonResponse({"error": "用户不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+    return JsonResponse(
+        {'content': await aload_content(phone), 'updated_at': datetime_field.to_representation(updated_at)},
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+@csrf_exempt
+@require_http_methods(['PATCH'])
+async def post_update(request, phone):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"error": "JSON 格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "JSON 格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        level, fields, choice = parse_level_update(data)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    if choice:
+        fields = await sync_to_async(judge_answer)(level, choice)
+        if fields is None:
+            return JsonResponse({"error": "該關卡不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+    entry = await arecord_level(phone, level, fields, choice=choice)
+    return JsonResponse(entry, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+async def player_events(request, phone):
+    """玩家進度的 SSE：snapshot 為完整進度（與 post-detail 的 content 相同），之後每次作答送出 levels。"""
+    if not await Post.objects.filter(user_id=phone).aexists():
+        return JsonResponse({"error": "用户不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+    async def snapshot():
+        return {'content': await aload_content(phone)}
+
+    return event_response([player_channel(phone)], snapshot)
+
+
+@require_GET
+async def progress_events(request):
+    """全場統計的 SSE：snapshot 為排行榜的 routes 與 levels，之後送出變動項目的 counters。"""
+    return event_response([PROGRESS_CHANNEL], sync_to_async(progress_summary))
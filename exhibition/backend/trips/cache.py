@@ -0,0 +1,153 @@
+# trips/cache.py
+"""題目快取：每一題序列化後的內容連同 ETag、Last-Modified 存在 Django cache。
+
+使用的 cache 由 settings.TRIPS_QUESTION_CACHE 指定（預設 'default'），
+可換成 locmem、檔案或資料庫等任何 Django cache backend。正確答案另外整理成索引，只在伺服器端判斷對錯時使用，
+不會出現在回傳給手機的題目內容中。
+
+預設的 locmem 每個 gunicorn worker 各有一份，因此快取的 key 帶有版本：版本是
+settings.TRIPS_QUESTION_CACHE_VERSION_FILE 的 inode 與修改時間，每次讀取時 stat 一次。題目在後台修改、
+刪除或匯入時，交易 commit 後換掉這個檔案（invalidate_questions），所有 worker 下一次讀取就改用新的 key；
+commit 前開始的讀取只會寫進舊版本的 key，不會把舊題目放回快取。
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Question
+
+
+def question_cache():
+    return caches[getattr(settings, 'TRIPS_QUESTION_CACHE', 'default')]
+
+
+def question_cache_version():
+    try:
+        stat = os.stat(settings.TRIPS_QUESTION_CACHE_VERSION_FILE)
+    except FileNotFoundError:
+        return '0'
+    return f'{stat.st_ino}-{stat.st_mtime_ns}'
+
+
+def question_cache_key(number, version=None):
+    return f'trips:question:{version or question_cache_version()}:{number}'
+
+
+def question_index_key(version=None):
+    return f'trips:question-index:{version or question_cache_version()}'
+
+
+def build_question_entry(question):
+    # serializers → progress → cache，在這裡才匯入以避免循環匯入
+    from .serializers import QuestionSerializer
+
+    data = dict(QuestionSerializer(question).data)
+    digest = hashlib.md5(
+        json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+    return {
+        'data': data,
+        'etag': f'"{digest}"',
+        'last_modified': int(question.updated_at.timestamp()),
+    }
+
+
+def get_question_entry(number):
+    """回傳 {'data', 'etag', 'last_modified'}，題目不存在時回傳 None。"""
+    cache = question_cache()
+    key = question_cache_key(number)
+    entry = cache.get(key)
+    if entry is None:
+        try:
+            question = Question.objects.get(number=number)
+        except Question.DoesNotExist:
+            return None
+        entry = build_question_entry(question)
+        cache.set(key, entry, getattr(settings, 'TRIPS_QUESTION_CACHE_TIMEOUT', None))
+    return entry
+
+
+def get_question_entries(numbers):
+    """一次取得多題的快取內容 {題號: entry}；未快取的題目以一個查詢讀出並寫回快取，不存在的題號略過。"""
+    cache = question_cache()
+    version = question_cache_version()
+    keys = {question_cache_key(number, version): number for number in numbers}
+    entries = {keys[key]: entry for key, entry in cache.get_many(keys).items()}
+    missing = [number for number in numbers if number not in entries]
+    if missing:
+        questions = Question.objects.filter(number__in=missing)
+        built = {question.number: build_question_entry(question) for question in questions}
+        cache.set_many(
+            {question_cache_key(number, version): entry for number, entry in built.items()},
+            getattr(settings, 'TRIPS_QUESTION_CACHE_TIMEOUT', None),
+        )
+        entries.update(built)
+    return entries
+
+
+async def aget_question_entry(number):
+    """get_question_entry 的非同步版本，供 ASGI 模式的 async view 使用。"""
+    cache = question_cache()
+    key = question_cache_key(number)
+    entry = await cache.aget(key)
+    if entry is None:
+        try:
+            question = await Question.objects.aget(number=number)
+        except Question.DoesNotExist:
+            return None
+        entry = build_question_entry(question)
+        await cache.aset(key, entry, getattr(settings, 'TRIPS_QUESTION_CACHE_TIMEOUT', None))
+    return entry
+
+
+def get_question_index():
+    """所有題目的精簡索引：{'answers': {題號: 正確答案}, 'routes': {路線: [題號, ...]}}。
+
+    供伺服器端判斷對錯與路線完成統計使用，整份放在同一個 cache key。
+    """
+    cache = question_cache()
+    key = question_index_key()
+    index = cache.get(key)
+    if index is None:
+        index = {'answers': {}, 'routes': {}}
+        for number, route, answer in Question.objects.order_by('number').values_list('number', 'route', 'answer'):
+            index['answers'][number] = answer.strip().upper()
+            index['routes'].setdefault(route, []).append(number)
+        cache.set(key, index, getattr(settings, 'TRIPS_QUESTION_CACHE_TIMEOUT', None))
+    return index
+
+
+def get_answer_index():
+    return get_question_index()['answers']
+
+
+def get_route_levels():
+    return get_question_index()['routes']
+
+
+def bump_question_version():
+    """換掉版本檔：先寫暫存檔再取代，新檔的 inode 一定與舊檔不同（修改時間的精度不足以分辨連續兩次修改）。
+
+    暫存檔以 mkstemp 建立，同一個行程的多個執行緒同時更新（例如後台儲存與匯入）也不會寫到同一個檔案。
+    """
+    path = settings.TRIPS_QUESTION_CACHE_VERSION_FILE
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(str(os.getpid()))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def invalidate_questions():
+    """題目或題號索引有變動時呼叫，交易 commit 後才讓所有 worker 的快取失效（不在交易內時立即執行）。"""
+    transaction.on_commit(bump_question_version)
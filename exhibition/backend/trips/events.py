@@ -0,0 +1,228 @@
+# trips/events.py
+"""進度推播：作答交易 commit 後，把玩家各關狀態與路線/關卡統計的變化以 Server-Sent Events 推給前端。
+
+頻道：
+    player:<phone>  該玩家變動的關卡狀態（event: levels），路線頁與 AR 頁更新通過/失敗標記
+    progress        變動後的路線完成人數與各關通過/失敗人數（event: counters），主辦單位的大螢幕使用
+
+LocalBroker 只在同一個行程內轉送。gunicorn 有多個 worker 時設 TRIPS_EVENT_BROKER=socket：
+有 SSE 連線的 worker 在 TRIPS_EVENT_SOCKET_DIR 綁定一個 Unix datagram socket，發布時送給目錄中其他
+worker 的 socket（同一台主機上代替 Redis pub/sub）。事件帶的是變動後的值而不是增減量，重複或較晚收到都不會算錯。
+SSE 需要 ASGI（長連線不佔用 worker 執行緒），由 trips/urls.py 在 TRIPS_ASYNC_API 開啟時掛上。
+"""
+import asyncio
+import atexit
+import contextlib
+import json
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+PROGRESS_CHANNEL = 'progress'
+# 連線跟不上（佇列滿）或統計重算後送出，串流收到時重新送一次快照
+RESYNC = 'resync'
+QUEUE_SIZE = 100
+MAX_DATAGRAM = 64 * 1024
+RETRY_MS = 3000
+
+
+def player_channel(phone):
+    return f'player:{phone}'
+
+
+class Subscription:
+    """一個 SSE 連線的事件佇列，屬於建立它的 event loop；put 可從任何執行緒呼叫。"""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, name, data):
+        try:
+            self.loop.call_soon_threadsafe(self._put, name, data)
+        except RuntimeError:
+            # event loop 已關閉，連線早就不在了
+            self.close()
+
+    def _put(self, name, data):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            name, data = RESYNC, None
+        self.queue.put_nowait((name, data))
+
+    async def get(self):
+        """回傳 (event 名稱, 資料)。"""
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """行程內的轉送：發布時放進所有訂閱該頻道的 Subscription 佇列。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self.lock:
+            for channel in subscription.channels:
+                self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.channels.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.channels[channel]
+
+    def publish(self, channel, name, data):
+        self.deliver(channel, name, data)
+
+    def deliver(self, channel, name, data):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(name, data)
+
+
+class SocketBroker(LocalBroker):
+    """多個 worker 之間以 Unix datagram socket 轉送（只適用於同一台主機上的 Linux/macOS）。
+
+    只有曾經有 SSE 連線的 worker 會綁定 socket；發布時先交給本行程的訂閱者，再送給目錄中其他 worker。
+    worker 結束後留下的 socket 檔在下次發布送不出去時刪除。
+    """
+
+    def __init__(self, directory=None):
+        super().__init__()
+        self.directory = str(directory or settings.TRIPS_EVENT_SOCKET_DIR)
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+        self.receiver = None
+        self.path = None
+        self.reader_loop = None
+
+    def subscribe(self, channels):
+        subscription = super().subscribe(channels)
+        self.listen(subscription.loop)
+        return subscription
+
+    def listen(self, loop):
+        """綁定本 worker 的 socket，並在 event loop 上讀取其他 worker 送來的事件。"""
+        with self.lock:
+            if self.receiver is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.path = os.path.join(self.directory, f'{os.getpid()}-{id(self)}.sock')
+                receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                receiver.bind(self.path)
+                receiver.setblocking(False)
+                self.receiver = receiver
+                atexit.register(self.close)
+            if self.reader_loop is None or self.reader_loop.is_closed():
+                loop.add_reader(self.receiver.fileno(), self.receive)
+                self.reader_loop = loop
+
+    def receive(self):
+        while True:
+            try:
+                message = self.receiver.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                return
+            channel, name, data = json.loads(message)
+            self.deliver(channel, name, data)
+
+    def publish(self, channel, name, data):
+        self.deliver(channel, name, data)
+        message = json.dumps([channel, name, data], cls=DjangoJSONEncoder).encode()
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            path = os.path.join(self.directory, filename)
+            if path == self.path or not filename.endswith('.sock'):
+                continue
+            try:
+                self.sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+            except BlockingIOError:
+                # 對方的接收緩衝區已滿，放棄這一則；該 worker 的連線重新連線時會取得新的快照
+                pass
+
+    def close(self):
+        if self.receiver is None:
+            return
+        if self.reader_loop is not None and not self.reader_loop.is_closed():
+            with contextlib.suppress(RuntimeError):
+                self.reader_loop.remove_reader(self.receiver.fileno())
+        self.receiver.close()
+        self.receiver = self.reader_loop = None
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+BROKERS = {'local': LocalBroker, 'socket': SocketBroker}
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """依 settings.TRIPS_EVENT_BROKER 取得本行程的 broker。"""
+    kind = getattr(settings, 'TRIPS_EVENT_BROKER', 'local')
+    with _brokers_lock:
+        if kind not in _brokers:
+            _brokers[kind] = BROKERS[kind]()
+        return _brokers[kind]
+
+
+def publish(channel, name, data=None):
+    get_broker().publish(channel, name, data)
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def stream(channels, snapshot):
+    """SSE 內容：先送快照（await snapshot()），之後逐一送出事件；閒置時定期送註解讓代理伺服器不斷線。
+
+    先訂閱再讀快照，讀快照期間 commit 的變動也會收到。用戶端斷線時 ASGI handler 取消串流，finally 取消訂閱。
+    """
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        yield format_event('snapshot', await snapshot())
+        while True:
+            try:
+                name, data = await asyncio.wait_for(subscription.get(), settings.TRIPS_EVENT_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if name == RESYNC:
+                name, data = 'snapshot', await snapshot()
+            yield format_event(name, data)
+    finally:
+        subscription.close()
+
+
+def event_response(channels, snapshot):
+    response = StreamingHttpResponse(stream(channels, snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx 預設會緩衝回應，SSE 必須關閉
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,117 @@
+# trips/export.py
+"""匯出玩家進度給主辦單位：每位玩家一列，29 關各展開成 status / user_answer / correct_answer 三欄。
+
+以 iterator(chunk_size) 分批讀取玩家、每批查一次作答紀錄，CSV 邊讀邊輸出、Parquet 每批寫一個 row group，記憶體用量不隨玩家數增加。
+ASGI 請求改以 async iterator 傳送（見 trips/streaming.py），否則 Django 會先把整份內容讀進記憶體。
+Parquet 需要 pyarrow（uv sync --extra parquet）。
+"""
+import csv
+import datetime
+
+from .models import LevelResult, Post, default_content
+from .progress import LEVEL_FIELDS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - 選用套件
+    pyarrow = None
+
+CHUNK_SIZE = 2000
+# ASGI 下每次從執行緒取回的 CSV 行數（見 streaming.aiter_batches）
+CSV_BATCH_LINES = 500
+PLAYER_COLUMNS = ('phone', 'gender', 'created_at', 'updated_at', 'passed_count', 'failed_count')
+
+
+def export_levels():
+    return sorted(int(level) for level in default_content())
+
+
+def export_columns(levels=None):
+    levels = levels or export_levels()
+    return [*PLAYER_COLUMNS, *(f'level_{level}_{name}' for level in levels for name in LEVEL_FIELDS)]
+
+
+def iter_rows(chunk_size=CHUNK_SIZE, levels=None):
+    """依手機號碼順序逐列產生 list；每批 chunk_size 位玩家查一次作答紀錄，只取欄位值不建立 model。"""
+    levels = levels or export_levels()
+    posts = (
+        Post.objects.filter(user__isnull=False)
+        .order_by('user_id')
+        .values_list('user_id', 'user__gender', 'created_at', 'updated_at', 'passed_count', 'failed_count')
+    )
+    batch = []
+    for post in posts.iterator(chunk_size=chunk_size):
+        batch.append(post)
+        if len(batch) >= chunk_size:
+            yield from _flatten(batch, levels)
+            batch = []
+    yield from _flatten(batch, levels)
+
+
+def _flatten(batch, levels):
+    if not batch:
+        return
+    results = {}
+    answers = LevelResult.objects.filter(user_id__in=[post[0] for post in batch]).values_list(
+        'user_id', 'level', *LEVEL_FIELDS
+    )
+    for user_id, level, *fields in answers:
+        results.setdefault(user_id, {})[level] = fields
+    empty = [''] * len(LEVEL_FIELDS)
+    for post in batch:
+        answered = results.get(post[0], {})
+        row = list(post)
+        for level in levels:
+            row.extend(answered.get(level, empty))
+        yield row
+
+
+class _Echo:
+    """csv.writer 的輸出對象，write 直接回傳該行內容。"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, columns):
+    """逐行產生 CSV 文字，開頭加 BOM 讓 Excel 正確顯示中文。"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([value.isoformat() if isinstance(value, datetime.datetime) else value for value in row])
+
+
+def parquet_schema(columns):
+    types = {
+        'created_at': pyarrow.timestamp('us', tz='UTC'),
+        'updated_at': pyarrow.timestamp('us', tz='UTC'),
+        'passed_count': pyarrow.int16(),
+        'failed_count': pyarrow.int16(),
+    }
+    return pyarrow.schema([(name, types.get(name, pyarrow.string())) for name in columns])
+
+
+def write_parquet(target, rows, columns, chunk_size=CHUNK_SIZE):
+    """把 rows 寫成 Parquet（target 為路徑或檔案物件），回傳寫入的列數。"""
+    if pyarrow is None:
+        raise RuntimeError('需要 pyarrow 才能匯出 Parquet：uv sync --extra parquet')
+
+    schema = parquet_schema(columns)
+    count, batch = 0, []
+    with pyarrow.parquet.ParquetWriter(target, schema, compression='zstd') as writer:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                writer.write_batch(_record_batch(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_batch(_record_batch(batch, schema))
+            count += len(batch)
+    return count
+
+
+def _record_batch(rows, schema):
+    arrays = [pyarrow.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
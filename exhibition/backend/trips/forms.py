@@ -7,4 +7,9 @@ class UserProfileForm(forms.ModelForm):
         fields = ['gender', 'phone']
         widgets = {
             'gender': forms.RadioSelect(choices=UserProfile.GENDER_CHOICES)
-        }
\ No newline at end of file
+        }
+
+
+class QuestionImportForm(forms.Form):
+    file = forms.FileField(label='題目檔案', help_text='CSV、XLSX 或 JSON，第一列為欄位名稱')
+    dry_run = forms.BooleanField(label='只驗證，不寫入', required=False)
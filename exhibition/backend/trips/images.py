@@ -0,0 +1,219 @@
+# trips/images.py
+"""媒體圖片最佳化：把 media/ 下的 PNG/JPG 轉成多種寬度的 WebP/AVIF，檔名帶內容雜湊。
+
+產生的檔案與 manifest.json 放在 MEDIA_ROOT/optimized/，manifest 的格式為
+{"vendor_icons/11.png": {"hash", "width", "height", "bytes", "variants": [{"url", "format", "width", "bytes"}]}}。
+由 optimize_media 指令批次產生，後台儲存題目時也會為該題的 icon 產生（見 trips/signals.py）。
+需要 Pillow（uv sync --extra images）；未安裝時 API 仍回傳原始圖片網址。
+"""
+import hashlib
+import json
+import os
+import tempfile
+from urllib.parse import quote, unquote, urlsplit
+
+from django.conf import settings
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - 選用套件
+    Image = features = None
+
+OPTIMIZED_DIR = 'optimized'
+MANIFEST_NAME = 'manifest.json'
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 各格式的壓縮品質
+QUALITY = {'webp': 80, 'avif': 55}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+# 已讀取的 manifest：{路徑: (修改時間, 內容)}
+_manifests = {}
+
+
+def image_widths():
+    return tuple(getattr(settings, 'TRIPS_IMAGE_WIDTHS', (320, 640, 1280)))
+
+
+def image_formats():
+    """設定中的輸出格式，去掉目前 Pillow 不支援編碼的格式。"""
+    formats = getattr(settings, 'TRIPS_IMAGE_FORMATS', ('webp', 'avif'))
+    if features is None:
+        return ()
+    return tuple(fmt for fmt in formats if features.check(fmt))
+
+
+def manifest_path():
+    return os.path.join(settings.MEDIA_ROOT, OPTIMIZED_DIR, MANIFEST_NAME)
+
+
+def load_manifest(path=None):
+    """讀取 manifest（預設為圖片的 manifest），檔案沒變動時沿用記憶體中的內容。"""
+    path = path or manifest_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _manifests.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding='utf-8') as fp:
+            cached = _manifests[path] = (mtime, json.load(fp))
+    return cached[1]
+
+
+def save_manifest(manifest, path=None):
+    """先寫暫存檔再取代；暫存檔以 mkstemp 建立，多個 worker 或執行緒同時儲存也不會寫到同一個檔案。"""
+    path = path or manifest_path()
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            json.dump(manifest, fp, ensure_ascii=False, indent=1, sort_keys=True)
+        # mkstemp 建立的檔案只有擁有者可讀，manifest 可能由 nginx 直接提供
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def media_relative_path(url):
+    """把題目 icon 的網址對應到 MEDIA_ROOT 下的相對路徑，例如
+    https://github.com/.../blob/main/media/vendor_icons/11.png → vendor_icons/11.png；不是媒體檔時回傳 None。
+    """
+    if not url:
+        return None
+    path = unquote(urlsplit(url).path)
+    marker = '/' + settings.MEDIA_URL.strip('/') + '/'
+    if marker not in path:
+        return None
+    relative = path.split(marker, 1)[1]
+    if not relative.lower().endswith(SOURCE_EXTENSIONS):
+        return None
+    return relative
+
+
+def optimize_image(relative, manifest, force=False):
+    """為一張圖片產生各寬度、各格式的版本並更新 manifest，回傳該圖片的 manifest 項目。
+
+    來源內容沒變（雜湊相同）時直接沿用舊的項目；內容變了會刪除舊版本的檔案。
+    """
+    if Image is None:
+        raise RuntimeError('需要 Pillow 才能產生圖片版本：uv sync --extra images')
+
+    source = os.path.join(settings.MEDIA_ROOT, relative)
+    with open(source, 'rb') as fp:
+        digest = hashlib.sha256(fp.read()).hexdigest()[:10]
+
+    previous = manifest.get(relative)
+    if previous and previous['hash'] == digest and not force:
+        return previous
+
+    stem, _ = os.path.splitext(relative)
+    variants = []
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        width, height = image.size
+        # 不放大；原圖比最大寬度還小時，原尺寸也產生一份
+        widths = [w for w in image_widths() if w < width]
+        if width <= max(image_widths()):
+            widths.append(width)
+        for fmt in image_formats():
+            for target in sorted(set(widths)):
+                name = f'{OPTIMIZED_DIR}/{stem}.{digest}.{target}w.{fmt}'
+                path = os.path.join(settings.MEDIA_ROOT, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                resized = image if target == width else image.resize(
+                    (target, max(1, round(height * target / width))), Image.LANCZOS
+                )
+                resized.save(path, fmt.upper(), quality=QUALITY.get(fmt, 80))
+                variants.append({
+                    'url': settings.MEDIA_URL + quote(name),
+                    'format': fmt,
+                    'width': target,
+                    'bytes': os.path.getsize(path),
+                })
+
+    if previous:
+        _remove_variants(previous, keep={variant['url'] for variant in variants})
+
+    entry = {
+        'hash': digest,
+        'width': width,
+        'height': height,
+        'bytes': os.path.getsize(source),
+        'variants': variants,
+    }
+    manifest[relative] = entry
+    return entry
+
+
+def _remove_variants(entry, keep=()):
+    for variant in entry['variants']:
+        if variant['url'] in keep:
+            continue
+        name = unquote(variant['url'][len(settings.MEDIA_URL):])
+        try:
+            os.remove(os.path.join(settings.MEDIA_ROOT, name))
+        except FileNotFoundError:
+            pass
+
+
+def image_variants(url):
+    """題目 icon 在 manifest 中的所有版本，尚未產生時回傳空 list。"""
+    relative = media_relative_path(url)
+    if relative is None:
+        return []
+    entry = load_manifest().get(relative)
+    return entry['variants'] if entry else []
+
+
+def preferred_formats(request):
+    """依 ?icon_format= 或 Accept 標頭決定格式優先順序，最後都退回 WebP（現場手機皆支援）。
+
+    ?icon_format=png 表示要原始圖片。
+    """
+    requested = request.GET.get('icon_format')
+    if requested == 'png':
+        return ()
+    if requested:
+        formats = [requested]
+    else:
+        accept = request.headers.get('Accept', '')
+        formats = [fmt for fmt in ('avif', 'webp') if MIME_TYPES[fmt] in accept]
+    return tuple(dict.fromkeys([*formats, 'webp']))
+
+
+def pick_variant(variants, formats, width):
+    """依格式優先順序挑出寬度不小於 width 的最小版本，沒有就用該格式最大的版本。"""
+    for fmt in formats:
+        candidates = sorted((v for v in variants if v['format'] == fmt), key=lambda v: v['width'])
+        if candidates:
+            return next((v for v in candidates if v['width'] >= width), candidates[-1])
+    return None
+
+
+def select_icon(data, request):
+    """回傳 (data, tag)：data 的 icon 換成最適合這個請求的版本，tag 用於區分 ETag。
+
+    manifest 中的版本網址是站內路徑，回傳前轉成完整網址，與原本 icon 欄位的格式一致。
+    """
+    variants = data.get('icon_variants')
+    if not variants:
+        return data, ''
+    variants = [{**v, 'url': request.build_absolute_uri(v['url'])} for v in variants]
+    data = {**data, 'icon_variants': variants}
+    width = request.GET.get('icon_width', '')
+    # isdigit() 也接受「²」等 int() 無法轉換的字元
+    width = int(width) if width.isdecimal() else getattr(settings, 'TRIPS_IMAGE_DEFAULT_WIDTH', 640)
+    variant = pick_variant(variants, preferred_formats(request), width)
+    if variant is None:
+        return data, ''
+    return {**data, 'icon': variant['url']}, f"{variant['format']}{variant['width']}"
+
+
+def tagged_etag(etag, tag):
+    """同一題不同圖片版本的回應使用不同的 ETag。"""
+    return f'"{etag.strip(chr(34))}-{tag}"' if tag else etag
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trips.assets import IMMUTABLE
+from trips.images import MANIFEST_NAME, OPTIMIZED_DIR
+
+# collectstatic 產生的雜湊檔名：name.0123456789ab.ext
+HASHED_NAME_RE = r'\.[0-9a-f]{12}\.\w+'
+
+TEMPLATE = """\
+# 由 python manage.py asset_server_config 產生，放進 nginx 的 server {{ }} 區塊
+# 需先執行 collectstatic；brotli_static 需要 ngx_brotli 模組，沒有時刪掉這兩行
+# nginx 對靜態檔案本身就支援 ETag、If-None-Match 與 Range 續傳
+location {static_url} {{
+    alias {static_root}/;
+    gzip_static on;
+    brotli_static on;
+    add_header Cache-Control "no-cache";
+    add_header Vary "Accept-Encoding";
+}}
+
+location ~ "^{static_url}(.+{hashed})$" {{
+    alias {static_root}/$1;
+    gzip_static on;
+    brotli_static on;
+    add_header Cache-Control "{immutable}";
+    add_header Vary "Accept-Encoding";
+}}
+
+location {media_url} {{
+    alias {media_root}/;
+    add_header Cache-Control "no-cache";
+}}
+
+# 前端頁面跨網域下載 .mind bundle，內容帶雜湊且公開，允許任何來源
+location {media_url}{optimized}/ {{
+    alias {media_root}/{optimized}/;
+    add_header Cache-Control "{immutable}";
+    add_header Access-Control-Allow-Origin "*";
+}}
+
+location ~ "^{media_url}{optimized}/(.*{manifest})$" {{
+    alias {media_root}/{optimized}/$1;
+    add_header Cache-Control "no-cache";
+}}
+"""
+
+
+class Command(BaseCommand):
+    help = '產生 nginx 設定，直接提供 /static/ 與 /media/（預先壓縮檔、immutable 快取、Range 續傳）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='寫入檔案，預設輸出到 stdout')
+
+    def handle(self, *args, **options):
+        config = TEMPLATE.format(
+            static_url='/' + settings.STATIC_URL.strip('/') + '/',
+            static_root=str(settings.STATIC_ROOT).rstrip('/'),
+            media_url='/' + settings.MEDIA_URL.strip('/') + '/',
+            media_root=str(settings.MEDIA_ROOT).rstrip('/'),
+            optimized=OPTIMIZED_DIR,
+            manifest=MANIFEST_NAME.replace('.', r'\.'),
+            hashed=HASHED_NAME_RE,
+            immutable=IMMUTABLE,
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fp:
+                fp.write(config)
+            self.stdout.write(self.style.SUCCESS(f'已寫入 {options["output"]}'))
+        else:
+            self.stdout.write(config, ending='')
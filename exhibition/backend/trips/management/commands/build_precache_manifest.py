@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trips.offline import build_app_manifest, precache_manifest, route_entries
+
+
+class Command(BaseCommand):
+    help = '計算前端頁面與其引用檔案的內容雜湊，更新 service worker 的預先快取清單（/api/offline/manifest/）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app-dir', help='前端目錄，預設為 settings.TRIPS_PRECACHE_APP_DIR')
+
+    def handle(self, *args, **options):
+        app = build_app_manifest(options['app_dir'] or settings.TRIPS_PRECACHE_APP_DIR)
+        local = [entry for entry in app if entry['bytes'] is not None]
+        self.stdout.write(
+            f'前端：{len(local)} 個檔案，{sum(entry["bytes"] for entry in local) / 1024:.0f} KB；'
+            f'CDN：{len(app) - len(local)} 個'
+        )
+
+        manifest = precache_manifest()
+        questions = [entry for entry in manifest['api'] if '/question/' in entry['url']]
+        self.stdout.write(f'題目：{len(questions)} 題，icon：{len(manifest["api"]) - len(questions)} 張')
+        for route, data in route_entries().items():
+            self.stdout.write(f'路線 {route}：{len(data["levels"])} 關，標記檔 {data["bytes"] / 1024:.0f} KB')
+        if not manifest['routes']:
+            self.stdout.write(self.style.WARNING('沒有路線 bundle，請先執行 build_route_targets'))
+        self.stdout.write(self.style.SUCCESS(f'版本 {manifest["version"]}'))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.cache import get_route_levels
+from trips.targets import build_route_bundles, msgpack
+
+
+class Command(BaseCommand):
+    help = '依 Question.route 把各關的 MindAR 標記檔合併成各路線的 .mind bundle，並更新 manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='各關 targets_NN.mind 所在目錄，預設為 settings.TRIPS_MIND_SOURCE_DIR')
+
+    def handle(self, *args, **options):
+        if msgpack is None:
+            raise CommandError('需要 msgpack：uv sync --extra ar')
+
+        source = options['source'] or settings.TRIPS_MIND_SOURCE_DIR
+        routes = get_route_levels()
+        if not routes:
+            raise CommandError('沒有任何題目，無法依路線打包')
+
+        manifest = build_route_bundles(routes, source)
+        total = sum(entry['bytes'] for entry in manifest.values())
+        for route, entry in manifest.items():
+            self.stdout.write(
+                f'路線 {route}：{len(entry["levels"])} 個標記，{entry["bytes"] / 1024:.0f} KB → {entry["url"]}'
+            )
+            if entry['missing']:
+                self.stdout.write(self.style.WARNING(f'  缺少標記檔的關卡：{entry["missing"]}'))
+        for route in sorted(set(routes) - set(manifest)):
+            self.stdout.write(self.style.WARNING(f'路線 {route}：找不到任何標記檔，未產生 bundle'))
+        if manifest:
+            largest = max(entry['bytes'] for entry in manifest.values())
+            self.stdout.write(self.style.SUCCESS(
+                f'全部標記共 {total / 1024:.0f} KB，每位玩家最多下載 {largest / 1024:.0f} KB'
+            ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trips.answer_log import compact_events
+from trips.models import ProgressSnapshot
+
+
+class Command(BaseCommand):
+    help = '把作答事件（AnswerEvent）整併進 LevelResult 與統計；TRIPS_ANSWER_WRITES=append 時需定期執行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='持續執行，每隔幾秒整併一次')
+        parser.add_argument('--batch-size', type=int, help='每個交易整併的事件數，預設為 TRIPS_ANSWER_COMPACT_BATCH')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            count = compact_events(options['batch_size'])
+            if count or not interval:
+                snapshot = ProgressSnapshot.objects.values_list('event_id', flat=True).first()
+                self.stdout.write(f'整併 {count} 筆事件，快照到 #{snapshot}')
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.export import CHUNK_SIZE, export_columns, iter_csv, iter_rows, pyarrow, write_parquet
+
+
+class Command(BaseCommand):
+    help = '匯出所有玩家的進度（每位玩家一列、每關三欄），CSV 或 Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+        parser.add_argument('--output', help='輸出檔案，CSV 未指定時輸出到 stdout；Parquet 必須指定')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='每批讀取的玩家數')
+
+    def handle(self, *args, **options):
+        columns = export_columns()
+        rows = iter_rows(chunk_size=options['chunk_size'])
+        output = options['output']
+
+        if options['format'] == 'parquet':
+            if pyarrow is None:
+                raise CommandError('需要 pyarrow：uv sync --extra parquet')
+            if not output:
+                raise CommandError('匯出 Parquet 時請以 --output 指定檔案')
+            count = write_parquet(output, rows, columns, chunk_size=options['chunk_size'])
+            self.stderr.write(self.style.SUCCESS(f'已匯出 {count} 位玩家到 {output}'))
+            return
+
+        if not output:
+            for line in iter_csv(rows, columns):
+                self.stdout.write(line, ending='')
+            return
+        count = 0
+        with open(output, 'w', encoding='utf-8', newline='') as fp:
+            for count, line in enumerate(iter_csv(rows, columns)):
+                fp.write(line)
+        self.stderr.write(self.style.SUCCESS(f'已匯出 {count} 位玩家到 {output}'))
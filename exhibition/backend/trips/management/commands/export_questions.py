@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.question_io import FORMATS, detect_format, export_questions
+
+
+class Command(BaseCommand):
+    help = '匯出所有題目為 CSV / XLSX / JSON，格式與 import_questions 相同'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, help='預設依 --output 的副檔名判斷，輸出到 stdout 時為 csv')
+        parser.add_argument('--output', help='輸出檔案，預設輸出到 stdout（僅 csv、json）')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        try:
+            fmt = options['format'] or (detect_format(output) if output else 'csv')
+            data = export_questions(fmt)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if not output:
+            if fmt == 'xlsx':
+                raise CommandError('XLSX 請以 --output 指定檔案')
+            self.stdout.write(data.decode('utf-8-sig'), ending='')
+            return
+        with open(output, 'wb') as fp:
+            fp.write(data)
+        self.stderr.write(self.style.SUCCESS(f'已匯出到 {output}'))
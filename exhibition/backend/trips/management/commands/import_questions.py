@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.question_io import FORMATS, QuestionImportError, detect_format, import_questions
+
+
+class Command(BaseCommand):
+    help = '從 CSV / XLSX / JSON 匯入題目：驗證後在單一交易內依題號新增或更新，並下載、最佳化 icon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='題目檔案，第一列為欄位名稱（number, batch, route, title, icon, ...）')
+        parser.add_argument('--format', choices=FORMATS, help='預設依副檔名判斷')
+        parser.add_argument('--dry-run', action='store_true', help='只驗證，不寫入資料庫')
+        parser.add_argument('--no-download', action='store_true', help='不下載本機缺少的 icon')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = options['format'] or detect_format(path)
+            with open(path, 'rb') as fp:
+                summary = import_questions(
+                    fp, fmt, download=not options['no_download'], dry_run=options['dry_run']
+                )
+        except QuestionImportError as exc:
+            raise CommandError(f'驗證失敗，未寫入任何題目：\n{exc}')
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for warning in summary['warnings']:
+            self.stdout.write(self.style.WARNING(warning))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'驗證通過：{summary["rows"]} 題'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'匯入 {summary["rows"]} 題：新增 {summary["created"]}、更新 {summary["updated"]}，'
+            f'處理 {summary["icons"]} 張 icon'
+        ))
+        self.stdout.write('若路線有變動，請再執行 rebuild_progress_counters 與 build_route_targets')
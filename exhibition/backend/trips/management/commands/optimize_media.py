@@ -0,0 +1,61 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.cache import invalidate_questions
+from trips.images import (
+    OPTIMIZED_DIR, SOURCE_EXTENSIONS, Image, image_formats, load_manifest, optimize_image, pick_variant,
+    save_manifest,
+)
+
+
+class Command(BaseCommand):
+    help = '把 media/ 下的題目與廠商圖片轉成各寬度的 WebP/AVIF 並更新 manifest，最後列出節省的傳輸量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dirs', nargs='*', help='MEDIA_ROOT 下的子目錄，預設為 settings.TRIPS_IMAGE_DIRS')
+        parser.add_argument('--force', action='store_true', help='來源沒變也重新產生')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('需要 Pillow：uv sync --extra images')
+
+        dirs = options['dirs'] or settings.TRIPS_IMAGE_DIRS
+        manifest = dict(load_manifest())
+        sources = []
+        for directory in dirs:
+            root = os.path.join(settings.MEDIA_ROOT, directory)
+            if not os.path.isdir(root):
+                raise CommandError(f'找不到目錄：{root}')
+            for dirpath, _, filenames in os.walk(root):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(SOURCE_EXTENSIONS):
+                        path = os.path.join(dirpath, filename)
+                        sources.append(os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/'))
+
+        for relative in sources:
+            if relative.startswith(f'{OPTIMIZED_DIR}/'):
+                continue
+            optimize_image(relative, manifest, force=options['force'])
+            self.stdout.write(f'{relative}: {len(manifest[relative]["variants"])} 個版本')
+
+        save_manifest(manifest)
+        # 題目內容中的 icon_variants 來自 manifest，重新產生後清掉題目快取
+        invalidate_questions()
+        self.report([manifest[relative] for relative in sources if relative in manifest])
+
+    def report(self, entries):
+        """比較原始檔案與 API 預設寬度下各格式的總大小。"""
+        original = sum(entry['bytes'] for entry in entries)
+        width = settings.TRIPS_IMAGE_DEFAULT_WIDTH
+        self.stdout.write(f'原始圖片：{len(entries)} 張，共 {original / 1024 / 1024:.1f} MB')
+        for fmt in image_formats():
+            total = sum(
+                (pick_variant(entry['variants'], (fmt,), width) or entry)['bytes'] for entry in entries
+            )
+            saved = original - total
+            self.stdout.write(self.style.SUCCESS(
+                f'{fmt} {width}w：{total / 1024 / 1024:.1f} MB，節省 {saved / 1024 / 1024:.1f} MB'
+                f'（{saved / original:.0%}）' if original else f'{fmt}：沒有圖片'
+            ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from trips.progress import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = '從 LevelResult 重新計算玩家通過/失敗數、各關人數與路線完成人數'
+
+    def handle(self, *args, **options):
+        counters = rebuild_counters()
+        for key in sorted(counters):
+            self.stdout.write(f'{key}: {counters[key]}')
+        self.stdout.write(self.style.SUCCESS(f'已重建 {len(counters)} 個計數器'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from trips.answer_log import compact_events, regrade_events, replay_events
+
+
+class Command(BaseCommand):
+    help = '依作答事件紀錄重建 LevelResult 與統計；--regrade 先依目前的正確答案重新判分'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phone', help='只重建這位玩家（統計仍全部重算）')
+        parser.add_argument('--regrade', action='store_true', help='題目答案修正後，重新判斷由伺服器判分的作答')
+
+    def handle(self, *args, **options):
+        phone = options['phone']
+        if options['regrade']:
+            corrections = regrade_events(phone)
+            for event in corrections:
+                self.stdout.write(f'{event.phone} 第 {event.level} 關：{event.status}（正確答案 {event.correct_answer}）')
+            self.stdout.write(f'追加 {len(corrections)} 筆更正事件')
+            # 逐筆套用更正，玩家的頁面與大螢幕會收到推播
+            compact_events(delay=0)
+
+        count = replay_events(phone)
+        self.stdout.write(self.style.SUCCESS(f'已依事件紀錄重建 {count} 個關卡的作答結果'))
@@ -0,0 +1,236 @@
+# trips/metrics.py
+"""請求層級的量測：依 view 累計請求數、處理時間、查詢數與查詢時間、序列化時間與回應大小，以 Prometheus 文字格式輸出。
+
+由 MetricsMiddleware（trips/middleware.py）在 settings.TRIPS_METRICS 開啟時記錄。數字存在行程記憶體中，
+gunicorn 有多個 worker 時各自計數（與 locmem 快取相同）。序列化時間只計入有 TimedSerializerMixin 的序列化器。
+"""
+import contextvars
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.text import get_valid_filename
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - 選用套件
+    pyinstrument = None
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 交易控制與連線設定（signals.apply_sqlite_pragmas）不計入查詢數，測試（TestCase 以 savepoint 包住）與正式環境的數字才一致
+UNCOUNTED_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'PRAGMA')
+
+
+class RequestStats:
+    """單一請求的累計數字，由 middleware 建立並放在 contextvar 中。"""
+    __slots__ = ('queries', 'query_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper 的介面：計算每個查詢的次數與時間
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            if not sql.lstrip().upper().startswith(UNCOUNTED_STATEMENTS):
+                self.queries += 1
+
+
+current_stats = contextvars.ContextVar('trips_request_stats', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    """常駐在每條連線上的 execute_wrapper（見 signals.install_query_counter），查詢計入目前請求的 RequestStats。
+
+    contextvar 會隨 sync_to_async 帶到執行緒，ASGI 下在其他執行緒執行的查詢也算得到；不在請求中時直接執行。
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@contextmanager
+def measure_serializer():
+    """區塊內的時間計入目前請求的序列化時間；巢狀序列化器只計最外層。"""
+    stats = current_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - start
+        stats.serializing = False
+
+
+class TimedSerializerMixin:
+    """把 to_representation 的時間計入目前請求的序列化時間。"""
+
+    def to_representation(self, instance):
+        with measure_serializer():
+            return super().to_representation(instance)
+
+
+class ViewMetrics:
+    __slots__ = ('statuses', 'buckets', 'duration', 'queries', 'max_queries', 'query_time',
+                 'serializer_time', 'response_bytes', 'over_budget')
+
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+        self.over_budget = 0
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+
+class Registry:
+    """行程內所有 view 的累計數字。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, method, status, duration, stats, response_bytes):
+        """記錄一個請求，回傳該請求的查詢數是否超過 settings.TRIPS_QUERY_BUDGETS 的預算。"""
+        budget = getattr(settings, 'TRIPS_QUERY_BUDGETS', {}).get(view)
+        over_budget = budget is not None and stats.queries > budget
+        with self.lock:
+            metrics = self.views.setdefault(view, ViewMetrics())
+            key = (method, status)
+            metrics.statuses[key] = metrics.statuses.get(key, 0) + 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[index] += 1
+            metrics.duration += duration
+            metrics.queries += stats.queries
+            metrics.max_queries = max(metrics.max_queries, stats.queries)
+            metrics.query_time += stats.query_time
+            metrics.serializer_time += stats.serializer_time
+            metrics.response_bytes += response_bytes
+            metrics.over_budget += over_budget
+        return over_budget
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {view: _copy(metrics) for view, metrics in self.views.items()}
+
+
+def _copy(metrics):
+    copy = ViewMetrics()
+    for name in ViewMetrics.__slots__:
+        value = getattr(metrics, name)
+        setattr(copy, name, value.copy() if isinstance(value, (dict, list)) else value)
+    return copy
+
+
+registry = Registry()
+
+METRICS = (
+    ('trips_request_duration_seconds', 'histogram', '請求處理時間（秒）'),
+    ('trips_requests_total', 'counter', '請求數'),
+    ('trips_db_queries_total', 'counter', '資料庫查詢數'),
+    ('trips_db_queries_max', 'gauge', '單一請求的最多查詢數'),
+    ('trips_db_query_seconds_total', 'counter', '資料庫查詢時間（秒）'),
+    ('trips_serializer_seconds_total', 'counter', '序列化時間（秒）'),
+    ('trips_response_bytes_total', 'counter', '回應大小（位元組，不含串流回應）'),
+    ('trips_query_budget_exceeded_total', 'counter', '查詢數超過 TRIPS_QUERY_BUDGETS 的請求數'),
+)
+
+
+def render_metrics():
+    """Prometheus 文字格式（text/plain; version=0.0.4）。"""
+    views = sorted(registry.snapshot().items())
+    lines = []
+    for name, kind, help_text in METRICS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for view, metrics in views:
+            label = f'view="{view}"'
+            if name == 'trips_request_duration_seconds':
+                for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {metrics.requests}')
+                lines.append(f'{name}_sum{{{label}}} {metrics.duration:.6f}')
+                lines.append(f'{name}_count{{{label}}} {metrics.requests}')
+            elif name == 'trips_requests_total':
+                for (method, status), count in sorted(metrics.statuses.items()):
+                    lines.append(f'{name}{{{label},method="{method}",status="{status}"}} {count}')
+            else:
+                value = {
+                    'trips_db_queries_total': metrics.queries,
+                    'trips_db_queries_max': metrics.max_queries,
+                    'trips_db_query_seconds_total': round(metrics.query_time, 6),
+                    'trips_serializer_seconds_total': round(metrics.serializer_time, 6),
+                    'trips_response_bytes_total': metrics.response_bytes,
+                    'trips_query_budget_exceeded_total': metrics.over_budget,
+                }[name]
+                lines.append(f'{name}{{{label}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestProfiler:
+    """抽樣請求的效能剖析：settings.TRIPS_PROFILER 為 cprofile（輸出 .prof）或 pyinstrument（輸出 .html）。"""
+
+    def __init__(self):
+        self.kind = getattr(settings, 'TRIPS_PROFILER', 'cprofile')
+        if self.kind == 'pyinstrument' and pyinstrument is not None:
+            self.profiler = pyinstrument.Profiler(async_mode='disabled')
+        else:
+            self.kind, self.profiler = 'cprofile', cProfile.Profile()
+
+    def start(self):
+        """開始剖析；同一時間已有其他剖析在執行時回傳 False。"""
+        try:
+            if self.kind == 'pyinstrument':
+                self.profiler.start()
+            else:
+                self.profiler.enable()
+        except (RuntimeError, ValueError):
+            return False
+        return True
+
+    def stop(self):
+        if self.kind == 'pyinstrument':
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def save(self, view, duration):
+        """存到 settings.TRIPS_PROFILE_DIR，回傳檔案路徑；以 snakeviz / pstats 或瀏覽器檢視。"""
+        directory = settings.TRIPS_PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f'{now % 1:.3f}'[1:]
+        name = get_valid_filename(f'{stamp}-{os.getpid()}-{view}-{duration * 1000:.0f}ms')
+        if self.kind == 'pyinstrument':
+            path = os.path.join(directory, f'{name}.html')
+            with open(path, 'w', encoding='utf-8') as fp:
+                fp.write(self.profiler.output_html())
+        else:
+            path = os.path.join(directory, f'{name}.prof')
+            self.profiler.dump_stats(path)
+        return path
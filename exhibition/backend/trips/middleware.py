@@ -0,0 +1,155 @@
+# trips/middleware.py
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.utils._os import safe_join
+
+from .assets import IMMUTABLE, REVALIDATE, media_cache_control, serve_file
+from .metrics import RequestProfiler, RequestStats, current_stats, registry
+
+logger = logging.getLogger(__name__)
+
+
+class AssetMiddleware:
+    """settings.TRIPS_SERVE_ASSETS 開啟時，由 Django 直接提供 /static/ 與 /media/ 的檔案。
+
+    帶雜湊的檔名（collectstatic 的 manifest、media/optimized/ 的圖片版本）回傳 immutable 快取標頭，
+    其餘檔案每次以 ETag 重新驗證。前面有 nginx 時請改用 asset_server_config 產生的設定並關閉此選項。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRIPS_SERVE_ASSETS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.hashed_names = None
+        self.roots = [
+            ('/' + settings.STATIC_URL.lstrip('/'), settings.STATIC_ROOT, self.static_cache_control),
+            ('/' + settings.MEDIA_URL.lstrip('/'), settings.MEDIA_ROOT, media_cache_control),
+        ]
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        asset = self.resolve(request)
+        if asset is not None:
+            return serve_file(request, *asset)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        asset = self.resolve(request)
+        if asset is not None:
+            # stat、計算 ETag 與開檔都是阻塞 I/O，不必排進請求的 thread-sensitive 執行緒；
+            # ASGI 請求拿到的內容是 async iterator（見 assets.serve_file），讀檔同樣不佔用事件迴圈
+            return await sync_to_async(serve_file, thread_sensitive=False)(request, *asset)
+        return await self.get_response(request)
+
+    def resolve(self, request):
+        """回傳 (檔案路徑, Cache-Control)，不是要由這裡提供的檔案時回傳 None。"""
+        if request.method in ('GET', 'HEAD'):
+            for prefix, root, cache_control in self.roots:
+                if root and request.path.startswith(prefix):
+                    relative = request.path[len(prefix):]
+                    try:
+                        path = safe_join(root, relative)
+                    except SuspiciousFileOperation:
+                        return None
+                    return path, cache_control(relative)
+        return None
+
+    def static_cache_control(self, relative):
+        if self.hashed_names is None:
+            # manifest 只在部署時（collectstatic）改變，行程內讀一次即可
+            self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return IMMUTABLE if relative in self.hashed_names else REVALIDATE
+
+
+class MetricsMiddleware:
+    """settings.TRIPS_METRICS 開啟時，依 view 記錄處理時間、查詢數與查詢時間、序列化時間與回應大小（見 trips/metrics.py）。
+
+    放在 MIDDLEWARE 最前面，處理時間才包含其他 middleware。TRIPS_PROFILE_SAMPLE_RATE 大於 0 時，
+    抽樣的請求以 cProfile / pyinstrument 剖析，超過 TRIPS_PROFILE_SLOW_MS 的才存檔。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRIPS_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # 查詢由各連線上的 metrics.count_query 計入 contextvar 中的 stats
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        profiler = self.start_profiler()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            if profiler:
+                profiler.stop()
+            current_stats.reset(token)
+        return self.record(request, response, stats, profiler, duration)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        profiler = self.start_profiler()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            if profiler:
+                profiler.stop()
+            current_stats.reset(token)
+        return self.record(request, response, stats, profiler, duration)
+
+    def record(self, request, response, stats, profiler, duration):
+        view = self.view_name(request)
+        if profiler and duration * 1000 >= settings.TRIPS_PROFILE_SLOW_MS:
+            path = profiler.save(view, duration)
+            logger.warning('慢請求 %s %s %.0fms，剖析結果：%s', request.method, request.path, duration * 1000, path)
+        if registry.observe(view, request.method, response.status_code, duration, stats, self.response_size(response)):
+            logger.warning('%s 的查詢數 %d 超過預算 %d', view, stats.queries, settings.TRIPS_QUERY_BUDGETS[view])
+        return response
+
+    def start_profiler(self):
+        rate = getattr(settings, 'TRIPS_PROFILE_SAMPLE_RATE', 0)
+        if rate <= 0 or random.random() >= rate:
+            return None
+        profiler = RequestProfiler()
+        return profiler if profiler.start() else None
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        view = getattr(match.func, 'view_class', match.func)
+        return view.__name__
+
+    @staticmethod
+    def response_size(response):
+        if response.streaming:
+            return int(response.get('Content-Length') or 0)
+        return len(response.content)
+
@@ -24,7 +24,7 @@ class Migration(migrations.Migration):
         migrations.AddField(
             model_name='question',
             name='route',
-            field=models.CharField(default='Default Title', max_length=1),
+            field=models.CharField(default='A', max_length=1),
             preserve_default=False,
         ),
         migrations.AddField(
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0018_alter_userprofile_phone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='phone',
+            field=models.CharField(max_length=15, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0019_post_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LevelResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(default='null', max_length=10)),
+                ('user_answer', models.CharField(blank=True, default='', max_length=100)),
+                ('correct_answer', models.CharField(blank=True, default='', max_length=100)),
+                ('answered_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_results', to='trips.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['level', 'status'], name='level_result_level_status')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'level'), name='unique_user_level_result')],
+            },
+        ),
+    ]
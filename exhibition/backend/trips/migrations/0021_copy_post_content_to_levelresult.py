@@ -0,0 +1,47 @@
+from django.db import migrations
+
+LEVEL_FIELDS = ('status', 'user_answer', 'correct_answer')
+PLACEHOLDER = {'status': 'null', 'user_answer': '', 'correct_answer': ''}
+
+
+def copy_content(apps, schema_editor):
+    """把每位玩家 Post.content 中實際作答過的關卡搬到 LevelResult。"""
+    Post = apps.get_model('trips', 'Post')
+    LevelResult = apps.get_model('trips', 'LevelResult')
+
+    batch = []
+    for post in Post.objects.exclude(user=None).iterator(chunk_size=500):
+        for level, entry in (post.content or {}).items():
+            if not str(level).isdigit() or not isinstance(entry, dict):
+                continue
+            entry = {field: entry.get(field) or '' for field in LEVEL_FIELDS}
+            if entry == PLACEHOLDER:
+                continue
+            batch.append(LevelResult(user_id=post.user_id, level=int(level), answered_at=post.updated_at, **entry))
+        if len(batch) >= 1000:
+            LevelResult.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    LevelResult.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def restore_content(apps, schema_editor):
+    Post = apps.get_model('trips', 'Post')
+    LevelResult = apps.get_model('trips', 'LevelResult')
+
+    for post in Post.objects.exclude(user=None).iterator(chunk_size=500):
+        content = {str(level): dict(PLACEHOLDER) for level in range(1, 30)}
+        for result in LevelResult.objects.filter(user_id=post.user_id):
+            content[str(result.level)] = {field: getattr(result, field) for field in LEVEL_FIELDS}
+        post.content = content
+        post.save(update_fields=['content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0020_levelresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_content, restore_content),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0021_copy_post_content_to_levelresult'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='post',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='version',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0023_question_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerReceipt',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('level', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_receipts', to='trips.userprofile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:58
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+ANSWERED = ('pass', 'fail')
+
+
+def backfill_counters(apps, schema_editor):
+    """依現有的 LevelResult 計算每位玩家的通過/失敗數與各項計數器。"""
+    Post = apps.get_model('trips', 'Post')
+    LevelResult = apps.get_model('trips', 'LevelResult')
+    Question = apps.get_model('trips', 'Question')
+    ProgressCounter = apps.get_model('trips', 'ProgressCounter')
+
+    totals = LevelResult.objects.values('user_id').annotate(
+        passed=Count('id', filter=Q(status='pass')),
+        failed=Count('id', filter=Q(status='fail')),
+    )
+    for row in totals.iterator():
+        Post.objects.filter(user_id=row['user_id']).update(passed_count=row['passed'], failed_count=row['failed'])
+
+    counters = {}
+    for row in LevelResult.objects.filter(status__in=ANSWERED).values('level', 'status').annotate(n=Count('id')):
+        counters[f"level:{row['level']}:{row['status']}"] = row['n']
+
+    routes = {}
+    for number, route in Question.objects.values_list('number', 'route'):
+        routes.setdefault(route, []).append(number)
+    for route, levels in routes.items():
+        counters[f'route:{route}:finished'] = (
+            LevelResult.objects.filter(level__in=levels, status__in=ANSWERED)
+            .values('user_id').annotate(n=Count('id')).filter(n=len(levels)).count()
+        )
+
+    ProgressCounter.objects.bulk_create([ProgressCounter(key=key, value=value) for key, value in counters.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0024_answerreceipt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressCounter',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='failed_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='passed_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-passed_count', 'updated_at'], name='post_leaderboard'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_events(apps, schema_editor):
+    """現有的每一筆 LevelResult 各寫成一筆事件，並把快照設在最後一筆，重播時才能得到相同的狀態。"""
+    LevelResult = apps.get_model('trips', 'LevelResult')
+    AnswerEvent = apps.get_model('trips', 'AnswerEvent')
+    ProgressSnapshot = apps.get_model('trips', 'ProgressSnapshot')
+
+    batch = []
+    for result in LevelResult.objects.order_by('answered_at', 'id').iterator(chunk_size=1000):
+        batch.append(AnswerEvent(
+            phone=result.user_id, level=result.level, status=result.status, user_answer=result.user_answer,
+            correct_answer=result.correct_answer, created_at=result.answered_at,
+        ))
+        if len(batch) >= 1000:
+            AnswerEvent.objects.bulk_create(batch)
+            batch = []
+    AnswerEvent.objects.bulk_create(batch)
+
+    last = AnswerEvent.objects.order_by('-id').values_list('id', flat=True).first()
+    ProgressSnapshot.objects.create(pk=1, event_id=last or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0026_post_last_activity_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnswerEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=15)),
+                ('level', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(blank=True, max_length=10, null=True)),
+                ('user_answer', models.CharField(blank=True, max_length=100, null=True)),
+                ('correct_answer', models.CharField(blank=True, max_length=100, null=True)),
+                ('choice', models.CharField(blank=True, default='', max_length=1)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['phone', 'id'], name='answer_event_phone')],
+            },
+        ),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
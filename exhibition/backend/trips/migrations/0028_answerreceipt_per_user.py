@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0027_answer_event_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='answerreceipt',
+            name='key',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddField(
+            model_name='answerreceipt',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AddConstraint(
+            model_name='answerreceipt',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='unique_user_answer_receipt'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0028_answerreceipt_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='levelresult',
+            name='previous_status',
+            field=models.CharField(default='null', editable=False, max_length=10),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 def default_content():
@@ -24,6 +25,7 @@ class Question(models.Model):
     choiceC = models.CharField(max_length=100)
     choiceD = models.CharField(max_length=100)
     answer = models.CharField(max_length=100) #答案
+    updated_at = models.DateTimeField(auto_now=True)  # 最後修改時間，供 Last-Modified 使用
 
     def __str__(self):
         return f"{self.number}. {self.question}"
@@ -43,9 +45,118 @@ class UserProfile(models.Model):
 
 class Post(models.Model):
     user = models.OneToOneField(UserProfile, on_delete=models.SET_NULL, related_name='post', null=True, blank=True)
-    content = models.JSONField(default=default_content)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    passed_count = models.PositiveSmallIntegerField(default=0)  # 通過的關卡數，隨每次作答增減
+    failed_count = models.PositiveSmallIntegerField(default=0)  # 失敗的關卡數
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-passed_count', 'updated_at'], name='post_leaderboard'),
+            # 後台依最後作答時間排序與篩選
+            models.Index(fields=['updated_at'], name='post_last_activity'),
+        ]
+
+    def __str__(self):
+        return f"Post by {self.user.phone} at {self.created_at}"
+
+
+class LevelResult(models.Model):
+    """玩家在單一關卡的作答結果；尚未作答的關卡不建立資料列。"""
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='level_results')
+    level = models.PositiveSmallIntegerField()  # 關卡編號，對應 Question.number
+    status = models.CharField(max_length=10, default='null')  # null, pass, fail
+    user_answer = models.CharField(max_length=100, blank=True, default='')
+    correct_answer = models.CharField(max_length=100, blank=True, default='')
+    answered_at = models.DateTimeField(default=timezone.now)
+    # 最近一次寫入前的狀態，寫入時由 upsert 一併以 RETURNING 取回（見 progress.write_levels）
+    previous_status = models.CharField(max_length=10, default='null', editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'level'], name='unique_user_level_result'),
+        ]
+        indexes = [
+            models.Index(fields=['level', 'status'], name='level_result_level_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} 第 {self.level} 關：{self.status}"
+
+    def as_entry(self):
+        """轉成 API 回傳的單關格式（與原本 Post.content 每一關相同）。"""
+        return {
+            "status": self.status,
+            "user_answer": self.user_answer,
+            "correct_answer": self.correct_answer,
+        }
+
+
+class AnswerReceipt(models.Model):
+    """批次上傳答案時由手機產生的冪等鍵；同一位玩家以同一個 key 重送時不會再套用一次。"""
+    key = models.CharField(max_length=64)
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='answer_receipts')
+    level = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # key 由手機產生，不同玩家的 key 相同時各自套用
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_answer_receipt'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id} 第 {self.level} 關)"
+
+
+class ProgressCounter(models.Model):
+    """即時統計的計數器，與作答寫入在同一個交易內增減。
+
+    key 例如 level:12:pass（第 12 關通過人數）、route:A:finished（完成 A 路線的人數）。
+    """
+    key = models.CharField(max_length=50, primary_key=True)
+    value = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class AnswerEvent(models.Model):
+    """作答事件紀錄，只新增不修改（見 trips/answer_log.py）；LevelResult 與計數器是依它整併出的目前狀態。
+
+    只記錄該次有提供的欄位，未提供的為 None；choice 為由伺服器判斷對錯的選項，重新判分時依目前的正確答案重算。
+    """
+    phone = models.CharField(max_length=15)  # 不設外鍵：寫入前不必確認玩家存在，刪除玩家也保留紀錄
+    level = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=10, null=True, blank=True)
+    user_answer = models.CharField(max_length=100, null=True, blank=True)
+    correct_answer = models.CharField(max_length=100, null=True, blank=True)
+    choice = models.CharField(max_length=1, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # 讀取單一玩家尚未整併的事件（phone = ? AND id > 快照）
+            models.Index(fields=['phone', 'id'], name='answer_event_phone'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.phone} 第 {self.level} 關：{self.status}"
+
+    def as_fields(self):
+        """這次作答有提供的欄位（與 LevelResult 的欄位同名）。"""
+        fields = {
+            'status': self.status,
+            'user_answer': self.user_answer,
+            'correct_answer': self.correct_answer,
+        }
+        return {name: value for name, value in fields.items() if value is not None}
+
+
+class ProgressSnapshot(models.Model):
+    """LevelResult 與計數器已整併到哪一筆 AnswerEvent（只有一列）。"""
+    event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Post by {self.user.phone} at {self.created_at}"
\ No newline at end of file
+        return f"已整併到事件 #{self.event_id}"
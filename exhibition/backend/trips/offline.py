@@ -0,0 +1,140 @@
+# trips/offline.py
+"""離線優先：前端 service worker（frontend/sw.js）的預先快取清單，由 /api/offline/manifest/ 提供。
+
+清單分成三部分，每一項都有 revision（內容雜湊），sw.js 只重新下載 revision 改變的項目：
+    app     前端頁面與頁面引用的 CSS、JS、圖片及 CDN 上的函式庫，路徑相對於 sw.js；
+            由 build_precache_manifest 指令計算雜湊後存到 MEDIA_ROOT/optimized/precache.json，前端部署後重新執行
+    api     每一題的題目 API（revision 為題目快取的 ETag）與 icon 的預設圖片版本，讀取時依 Question 即時產生
+    routes  各路線的標記檔查詢與分段校驗表（revision 為 bundle 的雜湊），玩家選定路線後才下載；
+            sw.js 依校驗表把 bundle 分段存進 js/assetLoader.js 使用的快取，掃描時不必再下載
+version 為全部項目的雜湊，任何一項變動都會改變。
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.urls import reverse
+
+from .cache import get_question_entries, get_question_index
+from .images import OPTIMIZED_DIR, load_manifest, pick_variant, save_manifest
+from .targets import load_bundle_manifest
+
+APP_MANIFEST_NAME = 'precache.json'
+PAGE_EXTENSIONS = ('.html',)
+# 頁面與程式中引用的本機檔案：src/href 屬性、JS 字串與 CSS url()
+LOCAL_REFERENCE = re.compile(
+    r'''(?:["'(]|url\(\s*)(?:\./)?((?:\.\./|[\w%@.\- ]+/)*[\w%@.\- ]+\.'''
+    r'''(?:html|css|js|png|jpe?g|gif|svg|webp|avif|ico|json|mind|woff2?))(?:\?[^"')]*)?["')]'''
+)
+# CDN 上的函式庫（網址本身帶版本號）
+REMOTE_REFERENCE = re.compile(r'''<(?:script[^>]+src|link[^>]+href)=["'](https?://[^"']+)["']''')
+
+
+def app_manifest_path():
+    return os.path.join(settings.MEDIA_ROOT, OPTIMIZED_DIR, APP_MANIFEST_NAME)
+
+
+def file_revision(path):
+    with open(path, 'rb') as fp:
+        return hashlib.sha256(fp.read()).hexdigest()[:10]
+
+
+def url_revision(url):
+    """網址本身帶版本號或內容雜湊時，以網址當作 revision。"""
+    return hashlib.sha256(url.encode()).hexdigest()[:10]
+
+
+def _is_excluded(relative):
+    return any(relative.startswith(prefix) for prefix in settings.TRIPS_PRECACHE_APP_EXCLUDE)
+
+
+def collect_app_files(app_dir=None):
+    """從前端的頁面出發，找出所有引用到的本機檔案（相對路徑）與 CDN 網址。"""
+    app_dir = str(app_dir or settings.TRIPS_PRECACHE_APP_DIR)
+    pending = sorted(name for name in os.listdir(app_dir) if name.endswith(PAGE_EXTENSIONS))
+    local, remote = set(), set()
+    while pending:
+        relative = pending.pop()
+        if relative in local:
+            continue
+        local.add(relative)
+        if not relative.endswith(('.html', '.css', '.js')):
+            continue
+        with open(os.path.join(app_dir, relative), encoding='utf-8', errors='replace') as fp:
+            text = fp.read()
+        remote.update(REMOTE_REFERENCE.findall(text))
+        # CSS 中的路徑相對於 CSS 檔；JS 由頁面載入，路徑相對於頁面
+        base = posixpath.dirname(relative) if relative.endswith('.css') else ''
+        for reference in LOCAL_REFERENCE.findall(text):
+            target = posixpath.normpath(posixpath.join(base, unquote(reference)))
+            if target.startswith('..') or _is_excluded(target):
+                continue
+            if target not in local and os.path.isfile(os.path.join(app_dir, target)):
+                pending.append(target)
+    return sorted(local), sorted(remote)
+
+
+def build_app_manifest(app_dir=None):
+    """計算前端檔案的 revision，寫入並回傳 [{"url", "revision", "bytes"}]（CDN 網址的 bytes 為 None）。"""
+    app_dir = str(app_dir or settings.TRIPS_PRECACHE_APP_DIR)
+    local, remote = collect_app_files(app_dir)
+    entries = []
+    for relative in local:
+        path = os.path.join(app_dir, relative)
+        entries.append({'url': quote(relative), 'revision': file_revision(path), 'bytes': os.path.getsize(path)})
+    for url in remote:
+        entries.append({'url': url, 'revision': url_revision(url), 'bytes': None})
+    save_manifest(entries, app_manifest_path())
+    return entries
+
+
+def question_entries():
+    """每一題的題目 API 與 icon 預設版本（與未指定 Accept 的 API 回傳相同）。"""
+    numbers = [number for levels in get_question_index()['routes'].values() for number in levels]
+    cached = get_question_entries(numbers)
+    width = getattr(settings, 'TRIPS_IMAGE_DEFAULT_WIDTH', 640)
+    entries, icons = [], {}
+    for number in sorted(cached):
+        entry = cached[number]
+        entries.append({'url': reverse('question-detail', args=[number]), 'revision': entry['etag'].strip('"')[:10]})
+        variant = pick_variant(entry['data'].get('icon_variants') or [], ('webp',), width)
+        if variant is not None:
+            # 圖片版本的檔名已帶內容雜湊
+            icons[variant['url']] = {'url': variant['url'], 'revision': url_revision(variant['url'])}
+    return entries + sorted(icons.values(), key=lambda item: item['url'])
+
+
+def route_entries():
+    """各路線的標記檔查詢（?level=）與 bundle 的分段校驗表。"""
+    routes = {}
+    for route, bundle in sorted(load_bundle_manifest().items()):
+        name = bundle['url'][len(settings.MEDIA_URL):]
+        urls = [f"{reverse('target-bundles')}?level={level}" for level in sorted(set(bundle['levels']))]
+        urls.append(reverse('ar-asset-chunks', args=[name]))
+        routes[route] = {
+            'levels': sorted(set(bundle['levels'])),
+            'bytes': bundle['bytes'],
+            'entries': [{'url': url, 'revision': bundle['hash']} for url in urls],
+        }
+    return routes
+
+
+def precache_manifest(absolute=None):
+    """完整的清單；absolute 為把站內路徑轉成完整網址的函式（例如 request.build_absolute_uri）。"""
+    absolute = absolute or (lambda url: url)
+    app = load_manifest(app_manifest_path()) or []
+    manifest = {
+        'app': [{'url': item['url'], 'revision': item['revision']} for item in app],
+        'api': [{**item, 'url': absolute(item['url'])} for item in question_entries()],
+        'routes': {
+            route: {**data, 'entries': [{**item, 'url': absolute(item['url'])} for item in data['entries']]}
+            for route, data in route_entries().items()
+        },
+    }
+    digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+    return {'version': digest, **manifest}
+
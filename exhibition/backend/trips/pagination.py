@@ -0,0 +1,110 @@
+# trips/pagination.py
+"""玩家進度列表的游標分頁：依 (updated_at, id) 遞增排序，以最後一筆的位置當作下一頁的游標。
+
+查詢條件為 updated_at > t OR (updated_at = t AND id > pk)，可直接使用 updated_at 的索引，不需 OFFSET。
+最後一頁仍回傳 cursor，儀表板之後帶同一個 cursor 輪詢即可只取得之後有變動的玩家。
+
+updated_at 在交易 commit 前就已決定，較早的時間可能較晚才 commit，翻頁時已經越過它的位置。
+因此翻頁的 cursor 另外記下這一輪第一頁的讀取時間，最後一頁回傳的輪詢 cursor 退回該時間之前
+settings.TRIPS_SYNC_OVERLAP_SECONDS 秒：下一輪會重讀這段時間內有變動的玩家，前端依手機號碼覆蓋即可。
+"""
+import base64
+import binascii
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(updated_at, pk, started=None):
+    """started 為這一輪第一頁的讀取時間，只有翻頁用的 cursor 才帶。"""
+    raw = f'{updated_at.isoformat()}|{pk}'
+    if started is not None:
+        raw += f'|{started.isoformat()}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """回傳 (updated_at, pk, started)，輪詢用的 cursor 沒有 started（None）；格式錯誤時拋出 ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        updated_at, pk, *rest = raw.split('|')
+        moment = parse_datetime(updated_at)
+        started = parse_datetime(rest[0]) if rest else None
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('無效的 cursor')
+    # isdigit() 也接受「²」等 int() 無法轉換的字元
+    if moment is None or not pk.isdecimal() or len(rest) > 1 or (rest and started is None):
+        raise ValueError('無效的 cursor')
+    return moment, int(pk), started
+
+
+class UpdatedAtCursorPagination(BasePagination):
+    """?cursor= 接續上一頁，?updated_since= 只取該時間之後有變動的資料，?limit= 每頁筆數。"""
+    page_size = 100
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        cursor = request.query_params.get('cursor')
+        since = request.query_params.get('updated_since')
+        self.position = None
+        self.started = timezone.now()
+
+        if cursor:
+            try:
+                updated_at, pk, started = decode_cursor(cursor)
+            except ValueError as exc:
+                raise ValidationError({'cursor': str(exc)})
+            self.position = (updated_at, pk)
+            if started is not None:
+                self.started = started
+            queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+        elif since:
+            moment = parse_datetime(since)
+            if moment is None:
+                raise ValidationError({'updated_since': '請使用 ISO 8601 格式，例如 2025-05-01T10:00:00+08:00'})
+            queryset = queryset.filter(updated_at__gt=moment)
+
+        page = list(queryset.order_by('updated_at', 'id')[:self.limit + 1])
+        self.has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if page:
+            self.position = (page[-1].updated_at, page[-1].pk)
+        return page
+
+    def get_limit(self, request):
+        limit = request.query_params.get('limit', '')
+        if not limit:
+            return self.page_size
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_page_size:
+            raise ValidationError({'limit': f'limit 需介於 1 到 {self.max_page_size}'})
+        return limit
+
+    def get_paginated_response(self, data):
+        cursor = next_url = None
+        if self.has_more:
+            cursor = encode_cursor(*self.position, self.started)
+            url = remove_query_param(self.request.build_absolute_uri(), 'updated_since')
+            next_url = replace_query_param(url, 'cursor', cursor)
+        elif self.position:
+            # 這一輪結束：下次輪詢從第一頁讀取前 TRIPS_SYNC_OVERLAP_SECONDS 秒重讀，補上較晚 commit 的玩家
+            overlap = (self.started - timedelta(seconds=settings.TRIPS_SYNC_OVERLAP_SECONDS), 0)
+            cursor = encode_cursor(*min(self.position, overlap))
+        return Response({
+            'results': data,
+            'next': next_url,
+            'cursor': cursor,
+            'has_more': self.has_more,
+        })
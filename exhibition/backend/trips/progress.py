@@ -0,0 +1,559 @@
+# trips/progress.py
+"""玩家遊戲進度的讀寫：每一關一筆 LevelResult，對外仍組成原本 Post.content 的格式。
+
+每次作答另外新增一筆 AnswerEvent（只新增不修改）。settings.TRIPS_ANSWER_WRITES 為 append 時寫入只新增事件，
+LevelResult 與計數器由 compact_answer_events 整併（見 trips/answer_log.py），讀取玩家進度時再疊上尚未整併的事件；
+queue 模式另把同一時間的寫入合併成一個交易，並在背景整併（見 trips/write_behind.py）。
+"""
+from collections import Counter
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    Aggregate, BigIntegerField, CharField, Count, F, JSONField, OuterRef, Prefetch, Q, Subquery, Value,
+)
+from django.db.models.functions import Cast, Coalesce, JSONObject
+from django.utils import timezone
+
+from . import events
+from .cache import get_answer_index, get_route_levels
+from .models import (
+    AnswerEvent, AnswerReceipt, LevelResult, Post, ProgressCounter, ProgressSnapshot, UserProfile, default_content,
+)
+
+LEVEL_FIELDS = ('status', 'user_answer', 'correct_answer')
+ANSWERED = ('pass', 'fail')
+STATUSES = ('null',) + ANSWERED
+CHOICES = ('A', 'B', 'C', 'D')
+SNAPSHOT_ID = 1
+
+
+def empty_entry():
+    return default_content()['1']
+
+
+def parse_level_update(data):
+    """從 PATCH 內容取出 (level, fields, choice)，參數錯誤時拋出 ValueError。
+
+    帶 choice 時 fields 為空，由呼叫端以 judge_answer 判斷對錯；前端送來的 status 等判分結果只在
+    settings.TRIPS_CLIENT_VERDICTS 開啟時接受（舊版前端），fields 只包含有提供的欄位，choice 為空字串。
+    """
+    # JSON 陣列或純量沒有 get()；錯誤訊息固定，不回傳 int() 等例外的內容
+    if not isinstance(data, dict):
+        raise ValueError("JSON 格式錯誤")
+    level = data.get("level")
+    if level is None:
+        raise ValueError("缺少 level 或 data 参数")
+
+    try:
+        level = int(str(level))
+    except ValueError:
+        level = 0
+    if level < 1:
+        raise ValueError("無效的關卡參數")
+
+    choice = data.get('choice')
+    if choice is not None:
+        if choice not in CHOICES:
+            raise ValueError(f"無效的 choice，可用：{', '.join(CHOICES)}")
+        return level, {}, choice
+    if not settings.TRIPS_CLIENT_VERDICTS:
+        raise ValueError("缺少 choice：作答對錯由伺服器判斷")
+
+    fields = {name: data.get(name) for name in LEVEL_FIELDS if data.get(name) is not None}
+    # 欄位長度有限制（PostgreSQL 上超過時是 DataError），與 level 一樣在寫入前檢查
+    if fields.get('status', 'null') not in STATUSES:
+        raise ValueError(f"無效的 status，可用：{', '.join(STATUSES)}")
+    for name in ('user_answer', 'correct_answer'):
+        value = fields.get(name, '')
+        if not isinstance(value, str) or len(value) > LevelResult._meta.get_field(name).max_length:
+            raise ValueError(f"無效的 {name}")
+    return level, fields, ''
+
+
+def judge_answer(level, choice):
+    """對照正確答案判斷玩家的選項，回傳要寫入的欄位；該關不存在時回傳 None。"""
+    answer = get_answer_index().get(level)
+    if answer is None:
+        return None
+    return {'status': 'pass' if choice == answer else 'fail', 'user_answer': choice, 'correct_answer': answer}
+
+
+def append_only():
+    """寫入是否只新增 AnswerEvent（settings.TRIPS_ANSWER_WRITES 為 append 或 queue）。"""
+    return settings.TRIPS_ANSWER_WRITES in ('append', 'queue')
+
+
+def run_write(job):
+    """在交易內執行寫入並回傳結果；queue 模式交給寫入執行緒，與其他請求的寫入合併成一個交易。"""
+    if settings.TRIPS_ANSWER_WRITES == 'queue':
+        # write_behind 依序載入 answer_log、progress，在這裡才載入
+        from .write_behind import submit
+        return submit(job)
+    with transaction.atomic():
+        return job()
+
+
+def pending_events(phone, levels=None):
+    """快照之後、還沒整併進 LevelResult 的事件，依寫入順序（快照以子查詢取得，一個查詢）。"""
+    snapshot = ProgressSnapshot.objects.filter(pk=SNAPSHOT_ID).values('event_id')
+    queryset = AnswerEvent.objects.filter(
+        phone=phone, id__gt=Coalesce(Subquery(snapshot), Value(0), output_field=BigIntegerField()),
+    )
+    if levels is not None:
+        queryset = queryset.filter(level__in=levels)
+    return queryset.order_by('id')
+
+
+def merge_pending(content, events):
+    """把事件依序疊到 {"關卡": entry} 上；沒有紀錄的關卡從預設內容開始。"""
+    for event in events:
+        content.setdefault(str(event.level), empty_entry()).update(event.as_fields())
+    return content
+
+
+def overlay_pending(content, phone, levels=None):
+    """append 模式下疊上尚未整併的事件；sync 模式寫入時已更新 LevelResult，不多查詢。"""
+    if not append_only():
+        return content
+    return merge_pending(content, pending_events(phone, levels))
+
+
+def build_content(results):
+    """把 LevelResult 套到 29 關的預設內容上，回傳與舊版 Post.content 相同的字典。"""
+    content = default_content()
+    for result in results:
+        content[str(result.level)] = result.as_entry()
+    return content
+
+
+class LevelContent(Aggregate):
+    """在資料庫內把多筆 LevelResult 組成 {"關卡": {status, user_answer, correct_answer}} 的 JSON 物件。
+
+    PostgreSQL 使用 jsonb_object_agg，SQLite 使用 json_group_object；其他資料庫不支援，
+    呼叫前請先檢查 connection.vendor 是否在 vendors 中（見 load_content）。
+    """
+    vendors = ('postgresql', 'sqlite')
+    output_field = JSONField()
+
+    def __init__(self, **extra):
+        entry = JSONObject(**{name: name for name in LEVEL_FIELDS})
+        super().__init__(Cast('level', CharField()), entry, **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='JSONB_OBJECT_AGG', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='JSON_GROUP_OBJECT', **extra_context)
+
+
+def load_content(phone):
+    """讀取一位玩家的完整進度（Post.content 格式），一個查詢。
+
+    支援 JSON 聚合的資料庫直接回傳組好的物件，不必逐列建立 LevelResult；
+    其他資料庫退回在 Python 中以 build_content 組合。
+    """
+    results = LevelResult.objects.filter(user_id=phone)
+    if connection.vendor not in LevelContent.vendors:
+        return overlay_pending(build_content(results), phone)
+    content = default_content()
+    content.update(results.aggregate(content=LevelContent())['content'] or {})
+    return overlay_pending(content, phone)
+
+
+def content_subquery(level=None):
+    """以 OuterRef('phone') 對應玩家的進度 JSON 子查詢，查詢 UserProfile 時一併取回；指定 level 時只取該關。"""
+    results = LevelResult.objects.filter(user_id=OuterRef('phone'))
+    if level is not None:
+        results = results.filter(level=level)
+    return Subquery(results.values('user_id').annotate(content=LevelContent()).values('content'))
+
+
+def load_profile(phone, level=None):
+    """一個查詢取回 UserProfile、Post（select_related）與進度，回傳 (user_profile, content)。
+
+    content 為 Post.content 格式；指定 level 時只含該關，不組其他 28 關。玩家不存在時回傳 (None, None)。
+    不支援 JSON 聚合的資料庫改以 prefetch 讀取作答紀錄（兩個查詢）。
+    """
+    profiles = UserProfile.objects.select_related('post').filter(phone=phone)
+    json_aggregate = connection.vendor in LevelContent.vendors
+    if json_aggregate:
+        profiles = profiles.annotate(progress=content_subquery(level))
+    else:
+        results = LevelResult.objects.all() if level is None else LevelResult.objects.filter(level=level)
+        profiles = profiles.prefetch_related(Prefetch('level_results', queryset=results))
+    user_profile = profiles.first()
+    if user_profile is None:
+        return None, None
+
+    content = default_content() if level is None else {str(level): empty_entry()}
+    if json_aggregate:
+        content.update(user_profile.progress or {})
+    else:
+        content.update((str(result.level), result.as_entry()) for result in user_profile.level_results.all())
+    return user_profile, overlay_pending(content, phone, None if level is None else [level])
+
+
+async def aload_content(phone):
+    """load_content 的 async 版本（ASGI 模式使用）。"""
+    results = LevelResult.objects.filter(user_id=phone)
+    if connection.vendor not in LevelContent.vendors:
+        content = build_content([result async for result in results])
+    else:
+        content = default_content()
+        content.update((await results.aaggregate(content=LevelContent()))['content'] or {})
+    if append_only():
+        merge_pending(content, [event async for event in pending_events(phone)])
+    return content
+
+
+def level_counter_key(level, level_status):
+    return f'level:{level}:{level_status}'
+
+
+def route_counter_key(route):
+    return f'route:{route}:finished'
+
+
+def ensure_post(phone, now, passed=0, failed=0):
+    """更新 Post.updated_at 與通過/失敗數；找不到時沿用舊行為，自動建立 user_profile 和 post。"""
+    updated = Post.objects.filter(user_id=phone).update(
+        updated_at=now,
+        passed_count=F('passed_count') + passed,
+        failed_count=F('failed_count') + failed,
+    )
+    if not updated:
+        user_profile, _ = UserProfile.objects.get_or_create(phone=phone)
+        Post.objects.get_or_create(
+            user=user_profile, defaults={'passed_count': max(passed, 0), 'failed_count': max(failed, 0)}
+        )
+
+
+def bump_counters(deltas):
+    """一個語句累加多個計數器：INSERT ... ON CONFLICT (key) DO UPDATE SET value = value + excluded.value。
+
+    回傳變動後的 {key: value} 供推播使用；支援 RETURNING 的資料庫（PostgreSQL、SQLite 3.35+）不多查詢。
+    """
+    rows = [(key, delta) for key, delta in deltas.items() if delta]
+    if not rows:
+        return {}
+    quote = connection.ops.quote_name
+    table = quote(ProgressCounter._meta.db_table)
+    key, value = quote('key'), quote('value')
+    sql = (
+        f'INSERT INTO {table} ({key}, {value}) VALUES {", ".join(["(%s, %s)"] * len(rows))} '
+        f'ON CONFLICT ({key}) DO UPDATE SET {value} = {table}.{value} + excluded.{value}'
+    )
+    params = [param for row in rows for param in row]
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(f'{sql} RETURNING {key}, {value}', params)
+            return dict(cursor.fetchall())
+        cursor.execute(sql, params)
+    return dict(ProgressCounter.objects.filter(key__in=[row[0] for row in rows]).values_list('key', 'value'))
+
+
+def counter_tree(counters):
+    """把 {計數器 key: 值} 轉成排行榜的 {'routes': {路線: {'finished'}}, 'levels': {關卡: {'pass', 'fail'}}} 格式。"""
+    tree = {'routes': {}, 'levels': {}}
+    for name, value in counters.items():
+        kind, item, field = name.split(':')
+        tree[f'{kind}s'].setdefault(item, {})[field] = value
+    return tree
+
+
+def publish_changes(phone, levels, counters):
+    """推播一次作答造成的變化（見 trips/events.py），由 apply_changes 在交易 commit 後呼叫。"""
+    if levels:
+        events.publish(events.player_channel(phone), 'levels', {'levels': levels})
+    if counters:
+        events.publish(events.PROGRESS_CHANNEL, 'counters', counter_tree(counters))
+
+
+def apply_changes(phone, changes, now):
+    """依各關狀態的變化 (level, 舊狀態, 新狀態) 更新 Post 統計與計數器，需在交易內呼叫。
+
+    每次作答的成本與玩家總數無關：一次 Post 更新、每個變動的計數器一次更新，
+    只有「已作答關卡數」改變的路線才多查一次該玩家在這條路線的作答數。
+    狀態或統計有變化時，交易 commit 後推播給 SSE 連線。
+    """
+    level_routes = {level: route for route, levels in get_route_levels().items() for level in levels}
+    deltas = Counter()
+    answered_delta = Counter()
+    passed = failed = 0
+
+    for level, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        for level_status, sign in ((old_status, -1), (new_status, 1)):
+            if level_status in ANSWERED:
+                deltas[level_counter_key(level, level_status)] += sign
+        passed += (new_status == 'pass') - (old_status == 'pass')
+        failed += (new_status == 'fail') - (old_status == 'fail')
+        if level in level_routes:
+            answered_delta[level_routes[level]] += (new_status in ANSWERED) - (old_status in ANSWERED)
+
+    ensure_post(phone, now, passed, failed)
+
+    routes = get_route_levels()
+    for route, delta in answered_delta.items():
+        if not delta:
+            continue
+        total = len(routes[route])
+        after = LevelResult.objects.filter(user_id=phone, level__in=routes[route], status__in=ANSWERED).count()
+        deltas[route_counter_key(route)] += (after == total) - (after - delta == total)
+
+    counters = bump_counters(deltas)
+    levels = {str(level): new_status for level, old_status, new_status in changes if old_status != new_status}
+    if levels or counters:
+        transaction.on_commit(partial(publish_changes, phone, levels, counters))
+
+
+def write_levels(phone, results, fields):
+    """以一個 INSERT ... ON CONFLICT DO UPDATE 寫入玩家的多筆結果，只覆寫 fields 與作答時間，需在交易內呼叫。
+
+    回傳 {level: (原狀態, 寫入後的內容)}。ON CONFLICT 的 SET 以既有資料列的值計算，previous_status 因此記下
+    覆寫前的狀態，再以 RETURNING 連同寫入後的欄位取回，不必先鎖定讀取、部分更新後也不必再查詢。
+    同一關的併發寫入在衝突時會等前一筆 commit，再依它寫入的內容更新（PostgreSQL 的 READ COMMITTED、
+    SQLite 的寫入鎖皆然），不會兩筆都依同一個舊狀態增減統計。不支援 RETURNING 的 SQLite（3.35 以前）
+    在同一個交易內再讀一次，此時仍持有寫入鎖。
+    """
+    results = sorted(results, key=lambda result: result.level)
+    opts = LevelResult._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = [opts.get_field(name) for name in ('user', 'level', *LEVEL_FIELDS, 'answered_at', 'previous_status')]
+    updates = [f'{quote(name)} = excluded.{quote(name)}' for name in (*fields, 'answered_at')]
+    returning = ['level', 'previous_status', *LEVEL_FIELDS]
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in columns)}) '
+        f'VALUES {", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(results))} '
+        f'ON CONFLICT ({quote(columns[0].column)}, {quote(columns[1].column)}) DO UPDATE SET '
+        f'{quote("previous_status")} = {table}.{quote("status")}, {", ".join(updates)}'
+    )
+    params = [
+        field.get_db_prep_save(getattr(result, field.attname), connection) for result in results for field in columns
+    ]
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(f'{sql} RETURNING {", ".join(quote(name) for name in returning)}', params)
+            rows = cursor.fetchall()
+        else:
+            cursor.execute(sql, params)
+            rows = LevelResult.objects.filter(
+                user_id=phone, level__in=[result.level for result in results]
+            ).values_list(*returning)
+    return {level: (previous, dict(zip(LEVEL_FIELDS, entry))) for level, previous, *entry in rows}
+
+
+def upsert_results(results, fields):
+    """以 INSERT ... ON CONFLICT DO UPDATE 一個語句寫入多筆結果，只覆寫 fields 與作答時間。"""
+    LevelResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=['user', 'level'],
+        update_fields=[*fields, 'answered_at'],
+    )
+
+
+def record_level(phone, level, fields, choice=''):
+    """更新單一關卡，只覆寫 fields 中有提供的欄位，回傳更新後該關的內容。
+
+    不需要先讀出整份進度，該關原本的狀態與寫入後的內容由同一個 upsert 取回（write_levels）；不同關卡的併發寫入互不影響。
+    choice 為由伺服器判斷對錯的選項，記在事件上供重新判分。append 模式只新增一筆事件，寫入前不讀取。
+    """
+    now = timezone.now()
+    result = LevelResult(user_id=phone, level=level, answered_at=now, **fields)
+    event = AnswerEvent(phone=phone, level=level, choice=choice, created_at=now, **fields)
+
+    if append_only():
+        if settings.TRIPS_ANSWER_WRITES == 'queue':
+            run_write(event.save)
+        else:
+            event.save()
+        if len(fields) == len(LEVEL_FIELDS):
+            return result.as_entry()
+        return load_entry(phone, level)
+
+    with transaction.atomic():
+        old_status, entry = write_levels(phone, [result], fields)[level]
+        apply_changes(phone, [(level, old_status, entry['status'])], now)
+        event.save()
+    return entry
+
+
+async def arecord_level(phone, level, fields, choice=''):
+    """record_level 的 async 版本（ASGI 模式使用）。
+
+    queue 模式在事件迴圈上等待合併寫入 commit（write_behind.asubmit），不佔用執行緒，同一時間的請求都能
+    併入同一個交易；其他模式的寫入需要交易，仍交給 record_level。
+    """
+    if settings.TRIPS_ANSWER_WRITES != 'queue':
+        return await sync_to_async(record_level)(phone, level, fields, choice=choice)
+    from .write_behind import asubmit
+
+    now = timezone.now()
+    await asubmit(AnswerEvent(phone=phone, level=level, choice=choice, created_at=now, **fields).save)
+    if len(fields) == len(LEVEL_FIELDS):
+        return LevelResult(user_id=phone, level=level, answered_at=now, **fields).as_entry()
+    return await sync_to_async(load_entry)(phone, level)
+
+
+def load_entry(phone, level):
+    """單一關卡目前的內容（含尚未整併的事件）。"""
+    result = LevelResult.objects.filter(user_id=phone, level=level).first()
+    content = {str(level): result.as_entry() if result else empty_entry()}
+    return overlay_pending(content, phone, [level])[str(level)]
+
+
+def record_levels(phone, answers):
+    """在同一個交易中套用多筆答案，回傳每一筆的處理結果（順序與 answers 相同）。
+
+    answers 的每一筆為 {'key', 'level', 'fields', 'client_ts'}，由伺服器判斷對錯的另帶 'choice'：
+    - 同一位玩家的 key 已經套用過的回傳 duplicate，不再寫入；
+    - 同一批內同一關有多筆時，只套用 client_ts 最晚的一筆，其餘回傳 superseded；
+    - 其餘回傳 applied。
+    查詢數與筆數無關：檢查冪等鍵一次、每種欄位組合 upsert 一次（同時取回原狀態，見 write_levels）、
+    更新統計（見 apply_changes）、新增事件一次、寫入冪等鍵一次；append 模式只檢查冪等鍵與新增事件、冪等鍵。
+    """
+    now = timezone.now()
+    outcomes = [None] * len(answers)
+
+    def write():
+        keys = [answer['key'] for answer in answers]
+        seen = set(AnswerReceipt.objects.filter(user_id=phone, key__in=keys).values_list('key', flat=True))
+
+        latest = {}
+        for index, answer in enumerate(answers):
+            if answer['key'] in seen:
+                outcomes[index] = 'duplicate'
+                continue
+            seen.add(answer['key'])
+            current = latest.get(answer['level'])
+            if current is not None and _is_newer(answers[current], answer):
+                outcomes[index] = 'superseded'
+                continue
+            if current is not None:
+                outcomes[current] = 'superseded'
+            latest[answer['level']] = index
+        for index in latest.values():
+            outcomes[index] = 'applied'
+
+        if not append_only():
+            by_fields = {}
+            for index in latest.values():
+                answer = answers[index]
+                by_fields.setdefault(tuple(sorted(answer['fields'])), []).append(
+                    LevelResult(user_id=phone, level=answer['level'], answered_at=now, **answer['fields'])
+                )
+            changes = []
+            for fields, results in by_fields.items():
+                for level, (old_status, entry) in write_levels(phone, results, fields).items():
+                    changes.append((level, old_status, entry['status']))
+            apply_changes(phone, changes, now)
+
+        AnswerEvent.objects.bulk_create([
+            AnswerEvent(
+                phone=phone, level=answers[index]['level'], choice=answers[index].get('choice', ''), created_at=now,
+                **answers[index]['fields'],
+            )
+            for index in sorted(latest.values())
+        ])
+
+        AnswerReceipt.objects.bulk_create(
+            [
+                AnswerReceipt(key=answer['key'], user_id=phone, level=answer['level'])
+                for answer, outcome in zip(answers, outcomes)
+                if outcome != 'duplicate'
+            ],
+            ignore_conflicts=True,
+        )
+
+    run_write(write)
+    return outcomes
+
+
+def _is_newer(current, candidate):
+    """同一關的兩筆答案，current 是否比 candidate 新（沒有 client_ts 時以後送的為準）。"""
+    if current['client_ts'] is None or candidate['client_ts'] is None:
+        return False
+    return current['client_ts'] > candidate['client_ts']
+
+
+def rebuild_counters():
+    """從 LevelResult 重新計算所有統計，用於修正題目路線調整或併發造成的誤差。"""
+    routes = get_route_levels()
+    with transaction.atomic():
+        Post.objects.update(passed_count=0, failed_count=0)
+        totals = LevelResult.objects.values('user_id').annotate(
+            passed=Count('id', filter=Q(status='pass')),
+            failed=Count('id', filter=Q(status='fail')),
+        )
+        for row in totals.iterator():
+            Post.objects.filter(user_id=row['user_id']).update(
+                passed_count=row['passed'], failed_count=row['failed']
+            )
+
+        counters = {}
+        for row in LevelResult.objects.filter(status__in=ANSWERED).values('level', 'status').annotate(n=Count('id')):
+            counters[level_counter_key(row['level'], row['status'])] = row['n']
+        for route, levels in routes.items():
+            counters[route_counter_key(route)] = (
+                LevelResult.objects.filter(level__in=levels, status__in=ANSWERED)
+                .values('user_id').annotate(n=Count('id')).filter(n=len(levels)).count()
+            )
+
+        ProgressCounter.objects.all().delete()
+        ProgressCounter.objects.bulk_create([ProgressCounter(key=key, value=value) for key, value in counters.items()])
+        # 統計整批重算，已連線的大螢幕重新取得快照
+        transaction.on_commit(partial(events.publish, events.PROGRESS_CHANNEL, events.RESYNC))
+    return counters
+
+
+def progress_summary():
+    """各路線完成人數與各關通過/失敗人數（排行榜與 /api/events/progress/ 的快照）。"""
+    counters = dict(ProgressCounter.objects.values_list('key', 'value'))
+    routes = get_route_levels()
+    return {
+        'routes': {
+            route: {'levels': len(levels), 'finished': counters.get(route_counter_key(route), 0)}
+            for route, levels in sorted(routes.items())
+        },
+        'levels': {
+            str(level): {
+                'pass': counters.get(level_counter_key(level, 'pass'), 0),
+                'fail': counters.get(level_counter_key(level, 'fail'), 0),
+            }
+            for level in sorted(level for levels in routes.values() for level in levels)
+        },
+    }
+
+
+def build_leaderboard(limit):
+    """即時排行榜：各路線完成人數、各關通過/失敗人數與通過關卡數前 limit 名。"""
+    leaderboard = progress_summary()
+    top = (
+        Post.objects.filter(user__isnull=False, passed_count__gt=0)
+        .order_by('-passed_count', 'updated_at')
+        .values_list('user_id', 'passed_count', 'failed_count', 'updated_at')[:limit]
+    )
+    leaderboard['top'] = [
+        {
+            'rank': rank,
+            'phone': mask_phone(phone),
+            'passed': passed,
+            'failed': failed,
+            'updated_at': updated_at,
+        }
+        for rank, (phone, passed, failed, updated_at) in enumerate(top, start=1)
+    ]
+    return leaderboard
+
+
+def mask_phone(phone):
+    """排行榜公開顯示時遮住手機號碼中段。"""
+    if len(phone) <= 6:
+        return phone[:1] + '*' * (len(phone) - 1)
+    return phone[:4] + '*' * (len(phone) - 7) + phone[-3:]
@@ -0,0 +1,262 @@
+# trips/question_io.py
+"""題目批次匯入/匯出：CSV、XLSX、JSON 一列一題，欄位與 Question 相同。
+
+匯入流程：讀檔 → 逐列驗證（選項、答案、題號重複）→ 下載缺少的 icon → 單一交易內以
+bulk_create(update_conflicts=True) 依題號新增或更新 → 產生 icon 圖片版本 → 清一次題目快取。
+XLSX 需要 openpyxl（uv sync --extra xlsx）。
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.utils._os import safe_join
+from rest_framework import serializers
+
+from .cache import invalidate_questions
+from .images import Image, load_manifest, media_relative_path, optimize_image, save_manifest
+from .models import Question
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - 選用套件
+    openpyxl = None
+
+FIELDS = ('number', 'batch', 'route', 'title', 'icon', 'question', 'choiceA', 'choiceB', 'choiceC', 'choiceD', 'answer')
+CHOICES = ('choiceA', 'choiceB', 'choiceC', 'choiceD')
+FORMATS = ('csv', 'xlsx', 'json')
+DOWNLOAD_TIMEOUT = 10
+DOWNLOAD_SCHEMES = ('http', 'https')
+MAX_ICON_BYTES = 10 * 1024 * 1024
+
+
+class QuestionImportError(ValueError):
+    """檔案內容有誤；errors 為 [(列號, 訊息), ...]，列號從 1 開始（不含標題列）。"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('\n'.join(f'第 {row} 列：{message}' for row, message in errors))
+
+
+class QuestionRowSerializer(serializers.ModelSerializer):
+    """單列題目的驗證；題號唯一性由 upsert 處理，不在這裡檢查。"""
+
+    class Meta:
+        model = Question
+        fields = list(FIELDS)
+        extra_kwargs = {'number': {'validators': []}}
+
+    def validate_route(self, value):
+        return value.strip().upper()
+
+    def validate_answer(self, value):
+        value = value.strip().upper()
+        if value not in ('A', 'B', 'C', 'D'):
+            raise serializers.ValidationError('答案必須是 A、B、C 或 D')
+        return value
+
+    def validate(self, attrs):
+        choices = [attrs[name].strip() for name in CHOICES]
+        if len(set(choices)) < len(choices):
+            raise serializers.ValidationError('四個選項不可重複')
+        return attrs
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in FORMATS:
+        raise ValueError(f'不支援的檔案格式：{filename}（可用 {", ".join(FORMATS)}）')
+    return extension
+
+
+def read_rows(fileobj, fmt):
+    """把上傳的檔案讀成 dict 的 list，只保留 FIELDS 中的欄位。"""
+    data = fileobj.read()
+    if fmt == 'json':
+        rows = json.loads(data)
+        if isinstance(rows, dict):
+            rows = rows.get('questions', [])
+        if not isinstance(rows, list):
+            raise ValueError('JSON 必須是題目的陣列，或含 questions 陣列的物件')
+        errors = [(index, '每一列必須是物件') for index, row in enumerate(rows, start=1) if not isinstance(row, dict)]
+        if errors:
+            raise QuestionImportError(errors)
+    elif fmt == 'csv':
+        text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        if openpyxl is None:
+            raise ValueError('需要 openpyxl 才能讀取 XLSX：uv sync --extra xlsx')
+        try:
+            sheet = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True).active
+        except (zipfile.BadZipFile, KeyError) as exc:
+            raise ValueError(f'無法讀取 XLSX 檔案：{exc}')
+        values = sheet.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else '' for name in next(values, [])]
+        rows = [dict(zip(header, row)) for row in values if any(cell is not None for cell in row)]
+    return [
+        {name: '' if row.get(name) is None else str(row[name]).strip() for name in FIELDS if name in row}
+        for row in rows
+    ]
+
+
+def validate_rows(rows):
+    """回傳 Question instance 的 list；有任何錯誤時拋出 QuestionImportError，一筆都不寫入。"""
+    errors, questions, seen = [], [], {}
+    for index, row in enumerate(rows, start=1):
+        serializer = QuestionRowSerializer(data=row)
+        if not serializer.is_valid():
+            for field, messages in serializer.errors.items():
+                label = '' if field == 'non_field_errors' else f'{field} '
+                errors.extend((index, f'{label}{message}') for message in messages)
+            continue
+        number = serializer.validated_data['number']
+        if number in seen:
+            errors.append((index, f'題號 {number} 與第 {seen[number]} 列重複'))
+            continue
+        seen[number] = index
+        questions.append(Question(**serializer.validated_data))
+    if errors:
+        raise QuestionImportError(errors)
+    return questions
+
+
+def download_url(url):
+    """GitHub 的 blob 頁面網址換成原始檔案網址。"""
+    parts = urlsplit(url)
+    if parts.netloc == 'github.com' and '/blob/' in parts.path:
+        owner_repo, path = parts.path.split('/blob/', 1)
+        return urlunsplit(('https', 'raw.githubusercontent.com', f'{owner_repo}/{path}', '', ''))
+    return url
+
+
+def local_icon(relative):
+    """MEDIA_ROOT 下的完整路徑；含 ../ 等跑出 MEDIA_ROOT 的路徑回傳 None。"""
+    try:
+        return safe_join(settings.MEDIA_ROOT, relative)
+    except SuspiciousFileOperation:
+        return None
+
+
+def fetch_icon(url, relative):
+    """下載 icon 到 MEDIA_ROOT/relative，回傳錯誤訊息或 None；只接受 http(s)，大小上限為 MAX_ICON_BYTES。"""
+    source = download_url(url)
+    if urlsplit(source).scheme not in DOWNLOAD_SCHEMES:
+        return f'{url} 不是 http/https 網址'
+    path = local_icon(relative)
+    if path is None:
+        return f'{url} 的路徑不在 media/ 內'
+    try:
+        with urlopen(Request(source, headers={'User-Agent': 'trips-import'}), timeout=DOWNLOAD_TIMEOUT) as response:
+            content_type = response.headers.get('Content-Type', '')
+            if not content_type.startswith('image/'):
+                return f'{url} 不是圖片（{content_type}）'
+            data = response.read(MAX_ICON_BYTES + 1)
+    except OSError as exc:
+        return f'{url} 下載失敗：{exc}'
+    if len(data) > MAX_ICON_BYTES:
+        return f'{url} 超過 {MAX_ICON_BYTES // 1024 // 1024} MB'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fp:
+        fp.write(data)
+    return None
+
+
+def missing_icons(questions):
+    """icon 對應到 media/ 但本機還沒有檔案的 {相對路徑: 網址}。"""
+    missing = {}
+    for question in questions:
+        relative = media_relative_path(question.icon)
+        if relative:
+            path = local_icon(relative)
+            # 跑出 MEDIA_ROOT 的路徑也列入，由 fetch_icon 回報錯誤
+            if path is None or not os.path.exists(path):
+                missing.setdefault(relative, question.icon)
+    return missing
+
+
+def download_icons(questions, workers=8):
+    """並行下載缺少的 icon，回傳錯誤訊息的 list（下載失敗不影響匯入）。"""
+    missing = missing_icons(questions)
+    if not missing:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda item: fetch_icon(item[1], item[0]), missing.items())
+        return [message for message in results if message]
+
+
+def optimize_icons(questions):
+    """為本機存在的 icon 產生 WebP/AVIF 版本，manifest 只寫一次；回傳處理的圖片數。"""
+    if Image is None:
+        return 0
+    manifest = dict(load_manifest())
+    relatives = {media_relative_path(question.icon) for question in questions} - {None}
+    paths = {relative: local_icon(relative) for relative in sorted(relatives)}
+    relatives = [relative for relative, path in paths.items() if path and os.path.exists(path)]
+    for relative in relatives:
+        optimize_image(relative, manifest)
+    if relatives:
+        save_manifest(manifest)
+    return len(relatives)
+
+
+def upsert_questions(questions):
+    """單一交易內依題號新增或更新所有題目，回傳 (新增數, 更新數)。"""
+    numbers = [question.number for question in questions]
+    with transaction.atomic():
+        existing = set(Question.objects.filter(number__in=numbers).values_list('number', flat=True))
+        Question.objects.bulk_create(
+            questions,
+            update_conflicts=True,
+            unique_fields=['number'],
+            update_fields=[name for name in FIELDS if name != 'number'] + ['updated_at'],
+        )
+    return len(numbers) - len(existing), len(existing)
+
+
+def import_questions(fileobj, fmt, download=True, dry_run=False):
+    """完整的匯入流程，回傳摘要 dict；驗證失敗時拋出 QuestionImportError。"""
+    questions = validate_rows(read_rows(fileobj, fmt))
+    summary = {'rows': len(questions), 'created': 0, 'updated': 0, 'icons': 0, 'warnings': []}
+    if dry_run or not questions:
+        return summary
+    if download:
+        summary['warnings'] = download_icons(questions)
+    summary['created'], summary['updated'] = upsert_questions(questions)
+    summary['icons'] = optimize_icons(questions)
+    # bulk_create 不會觸發 post_save，全部寫入後清一次快取（含題號索引）
+    invalidate_questions()
+    return summary
+
+
+def export_questions(fmt, queryset=None):
+    """把題目輸出成 bytes，欄位與匯入格式相同，可直接編修後再匯入。"""
+    queryset = Question.objects.all() if queryset is None else queryset
+    rows = list(queryset.order_by('number').values_list(*FIELDS))
+    if fmt == 'json':
+        data = [dict(zip(FIELDS, row)) for row in rows]
+        return json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8')
+    if fmt == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+        return ('\ufeff' + output.getvalue()).encode('utf-8')
+    if openpyxl is None:
+        raise ValueError('需要 openpyxl 才能輸出 XLSX：uv sync --extra xlsx')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'questions'
+    sheet.append(FIELDS)
+    for row in rows:
+        sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
@@ -1,31 +1,114 @@
 # trips/serializers.py
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
+from .images import image_variants
+from .metrics import TimedSerializerMixin
 from .models import Question, UserProfile, Post
+from .progress import CHOICES, STATUSES, build_content, empty_entry
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # icon 的 WebP/AVIF 各寬度版本（見 trips/images.py），view 會依請求把 icon 換成最適合的版本
+    icon_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Question
-        fields = ['batch', 'title', 'icon', 'question',
-                  'choiceA', 'choiceB', 'choiceC', 'choiceD', 'answer']
+        # 不包含 answer：對錯由伺服器判斷（見 AnswerSubmitAPIView）
+        fields = ['batch', 'title', 'icon', 'icon_variants', 'question',
+                  'choiceA', 'choiceB', 'choiceC', 'choiceD']
+
+    def get_icon_variants(self, obj):
+        return image_variants(obj.icon)
+
+
+class RouteQuestionSerializer(QuestionSerializer):
+    """路線預載用：題目內容加上玩家在該關的作答狀態（由 context['progress'] 提供）。"""
+    progress = serializers.SerializerMethodField()
+
+    class Meta(QuestionSerializer.Meta):
+        fields = ['number', 'route'] + QuestionSerializer.Meta.fields + ['progress']
 
+    def get_progress(self, obj):
+        result = self.context['progress'].get(obj.number)
+        return result.as_entry() if result else empty_entry()
+
+
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    content = serializers.SerializerMethodField()
 
-class PostSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
         fields = ['content', 'updated_at']
         read_only_fields = ['updated_at']
 
+    def get_content(self, obj):
+        # view 已在同一個查詢取得進度時由 context 提供（見 UserProfileAPIView）
+        if 'content' in self.context:
+            return self.context['content']
+        # 列表查詢時請 prefetch_related('user__level_results')，避免逐筆查詢
+        results = obj.user.level_results.all() if obj.user_id else []
+        return build_content(results)
+
+
+class PostListSerializer(PostSerializer):
+    """玩家進度列表；fields 參數只保留指定的欄位，例如只取通過/失敗數等摘要。"""
+    phone = serializers.CharField(source='user_id', read_only=True)
+
+    class Meta(PostSerializer.Meta):
+        fields = ['phone', 'passed_count', 'failed_count', 'created_at', 'updated_at', 'content']
+        read_only_fields = fields
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class AnswerSubmissionSerializer(serializers.Serializer):
+    """批次上傳中的一筆答案。"""
+    key = serializers.CharField(max_length=64)
+    level = serializers.IntegerField(min_value=1)
+    status = serializers.ChoiceField(choices=STATUSES, required=False)
+    user_answer = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    correct_answer = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    client_ts = serializers.DateTimeField(required=False)
+    # 由伺服器判斷對錯（service worker 離線時累積的答案），忽略 status 等欄位
+    choice = serializers.ChoiceField(choices=CHOICES, required=False)
+
+    def validate(self, attrs):
+        # 前端送來的判分結果只在 settings.TRIPS_CLIENT_VERDICTS 開啟時接受（舊版前端）
+        if 'choice' not in attrs and not settings.TRIPS_CLIENT_VERDICTS:
+            raise serializers.ValidationError({'choice': ['缺少 choice：作答對錯由伺服器判斷']})
+        return attrs
+
+
+class AnswerChoiceSerializer(serializers.Serializer):
+    level = serializers.IntegerField(min_value=1)
+    choice = serializers.ChoiceField(choices=CHOICES)
+
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     post = PostSerializer(read_only=True)
 
     class Meta:
         model = UserProfile
         fields = ['phone', 'gender', 'post']
+        # 號碼是否已註冊由 INSERT 的主鍵衝突判斷（見 create），不另外先查詢一次
+        extra_kwargs = {'phone': {'validators': []}}
 
     def create(self, validated_data):
-        # 在創建 UserProfile 的同時創建一個關聯的 Post
-        user_profile = UserProfile.objects.create(**validated_data)
-        Post.objects.create(user=user_profile)
+        # 在創建 UserProfile 的同時創建一個關聯的 Post，同一個交易只 commit 一次
+        try:
+            with transaction.atomic():
+                user_profile = UserProfile.objects.create(**validated_data)
+                Post.objects.create(user=user_profile)
+        except IntegrityError:
+            # 與原本 UniqueValidator 的訊息相同，前端（user_profile.html）依此判斷已註冊
+            field = UserProfile._meta.get_field('phone')
+            message = field.error_messages['unique'] % {
+                'model_name': UserProfile._meta.verbose_name, 'field_label': field.verbose_name,
+            }
+            raise serializers.ValidationError({'phone': [message]})
         return user_profile
\ No newline at end of file
@@ -0,0 +1,51 @@
+# trips/signals.py
+import os
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_questions
+from .images import Image, load_manifest, media_relative_path, optimize_image, save_manifest
+from .metrics import count_query
+from .models import Question
+from .question_io import local_icon
+
+
+@receiver(post_save, sender=Question)
+def optimize_question_icon(sender, instance, **kwargs):
+    # 後台設定的 icon 若是 media/ 下的圖片，儲存時就產生 WebP/AVIF 版本（內容沒變時不重做）
+    relative = media_relative_path(instance.icon)
+    # 含 ../ 跑出 MEDIA_ROOT 的路徑不處理，否則圖片版本會寫到 media/ 之外
+    path = local_icon(relative) if relative else None
+    if Image is None or path is None or not os.path.exists(path):
+        return
+    manifest = dict(load_manifest())
+    previous = manifest.get(relative)
+    if optimize_image(relative, manifest) is not previous:
+        save_manifest(manifest)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_cache(sender, instance, **kwargs):
+    # 題號可能被修改，題號索引也要重建，整份題目快取換一個版本
+    invalidate_questions()
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # PRAGMA 只對當下這條連線有效，每次建立新連線都要重新設定（settings.DB_PROFILE）
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.TRIPS_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # 不論 TRIPS_METRICS 都裝上：沒有請求在量測時只多一次 contextvar 查詢；重新連線時 wrapper 仍在，不重複加
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
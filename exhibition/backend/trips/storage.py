@@ -0,0 +1,85 @@
+# trips/storage.py
+"""collectstatic 使用的 storage：檔名帶內容雜湊、HTML 內的引用改寫成雜湊檔名，並預先壓縮成 .gz/.br。
+
+brotli 為選用套件（uv sync --extra compression），未安裝時只產生 .gz。
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 選用套件
+    brotli = None
+
+# 值得預先壓縮的文字與 AR 素材格式；PNG/JPG/WebP 本身已壓縮
+COMPRESSIBLE_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg', '.txt', '.xml', '.map', '.mind', '.gltf')
+# 壓縮後至少要小 5% 才保留
+MIN_RATIO = 0.95
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    patterns = ManifestStaticFilesStorage.patterns + (
+        (
+            '*.html',
+            (
+                (
+                    r"""(?P<matched>(?P<attr>src|href)=(?P<quote>["'])(?P<url>[^"'#?]+)(?P=quote))""",
+                    """%(attr)s="%(url)s\"""",
+                ),
+                r"""(?P<matched>url\(['"]{0,1}\s*(?P<url>[^'")]*?)["']{0,1}\))""",
+            ),
+        ),
+    )
+    # 前端頁面引用的檔案不一定都存在（例如外部範例），找不到時保留原本的網址
+    manifest_strict = False
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def tolerant_converter(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj['matched']
+
+        return tolerant_converter
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        names = set()
+        for name in paths:
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            names.add(name)
+            if hashed_name:
+                names.add(hashed_name)
+                if name.endswith('.html'):
+                    # 頁面以原檔名存取，內容也要使用改寫成雜湊檔名後的版本
+                    with self.open(hashed_name) as fp:
+                        content = fp.read()
+                    self.delete(name)
+                    self._save(name, ContentFile(content))
+
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        compressors = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+        for suffix, compress in compressors:
+            compressed = compress(data)
+            if len(compressed) < len(data) * MIN_RATIO:
+                with open(path + suffix, 'wb') as fp:
+                    fp.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
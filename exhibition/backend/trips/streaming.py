@@ -0,0 +1,50 @@
+# trips/streaming.py
+"""ASGI 下的串流回應內容。
+
+Django 的 ASGIHandler 遇到同步的 streaming_content（產生器、FileResponse）會先以 sync_to_async(list)
+整個讀進記憶體再送出；ASGI 請求改用這裡的 async iterator，每次只在執行緒中取一段，記憶體用量維持固定。
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+BLOCK_SIZE = 64 * 1024
+
+
+def is_asgi(request):
+    """request 可以是 HttpRequest 或 DRF 的 Request。"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def aiter_batches(iterator, batch_size):
+    """每次在請求的 thread-sensitive 執行緒中取 batch_size 個字串串接後送出。
+
+    查詢資料庫的產生器因此一直使用同一條連線；中途斷線時關閉產生器，釋放伺服器端游標。
+    """
+    iterator = iter(iterator)
+    take = sync_to_async(lambda: list(islice(iterator, batch_size)))
+    try:
+        while batch := await take():
+            yield ''.join(batch)
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+async def aread_file(fp, length=None, block_size=BLOCK_SIZE):
+    """從 fp 目前的位置逐段讀取 length bytes（None 表示讀到檔尾），結束時關閉檔案。
+
+    讀檔是阻塞 I/O 但與請求的其他處理無關，不必排進請求的 thread-sensitive 執行緒。
+    """
+    read = sync_to_async(fp.read, thread_sensitive=False)
+    try:
+        while length is None or length > 0:
+            data = await read(block_size if length is None else min(block_size, length))
+            if not data:
+                break
+            if length is not None:
+                length -= len(data)
+            yield data
+    finally:
+        fp.close()
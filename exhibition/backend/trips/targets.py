@@ -0,0 +1,129 @@
+# trips/targets.py
+"""MindAR 標記檔依路線打包：把每一關的 targets_NN.mind 合併成各路線專用的 .mind，玩家只下載自己路線的標記。
+
+產生的檔案與 manifest.json 放在 MEDIA_ROOT/optimized/mind/，manifest 的格式為
+{"A": {"url", "levels": [關卡, ...], "bytes", "hash", "missing": [缺少標記檔的關卡]}}，
+levels 的順序即 bundle 內的 targetIndex。由 build_route_targets 指令產生，題目的路線改變後需重新執行。
+需要 msgpack（uv sync --extra ar）。
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.utils.text import get_valid_filename
+
+from .images import OPTIMIZED_DIR, MANIFEST_NAME, load_manifest, save_manifest
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 選用套件
+    msgpack = None
+
+BUNDLE_DIR = f'{OPTIMIZED_DIR}/mind'
+
+
+def bundle_manifest_path():
+    return os.path.join(settings.MEDIA_ROOT, BUNDLE_DIR, MANIFEST_NAME)
+
+
+def load_bundle_manifest():
+    return load_manifest(bundle_manifest_path())
+
+
+def source_path(level, source_dir=None):
+    source_dir = source_dir or settings.TRIPS_MIND_SOURCE_DIR
+    return os.path.join(source_dir, f'targets_{level:02d}.mind')
+
+
+def split_targets(data):
+    """拆開 .mind 檔，回傳 (版本, [每個標記原本的 msgpack 位元組])。
+
+    標記內容不重新編碼，避免 float32 被放大成 float64。
+    """
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(data)
+    version, targets = None, []
+    for _ in range(unpacker.read_map_header()):
+        key = unpacker.unpack()
+        if key == 'v':
+            version = unpacker.unpack()
+        elif key == 'dataList':
+            for _ in range(unpacker.read_array_header()):
+                start = unpacker.tell()
+                unpacker.skip()
+                targets.append(data[start:unpacker.tell()])
+        else:
+            unpacker.skip()
+    return version, targets
+
+
+def pack_targets(version, targets):
+    """把多個標記組回 MindAR 的 {v, dataList} 格式。"""
+    packer = msgpack.Packer()
+    return b''.join([
+        packer.pack_map_header(2),
+        packer.pack('v'), packer.pack(version),
+        packer.pack('dataList'), packer.pack_array_header(len(targets)),
+        *targets,
+    ])
+
+
+def build_route_bundles(routes, source_dir=None):
+    """依 {路線: [關卡, ...]} 產生各路線的 bundle，寫入並回傳 manifest；沒有任何標記的路線略過。"""
+    if msgpack is None:
+        raise RuntimeError('需要 msgpack 才能合併 MindAR 標記檔：uv sync --extra ar')
+
+    manifest = {}
+    for route, levels in sorted(routes.items()):
+        version, targets, included, missing = None, [], [], []
+        for level in sorted(levels):
+            path = source_path(level, source_dir)
+            if not os.path.isfile(path):
+                missing.append(level)
+                continue
+            with open(path, 'rb') as fp:
+                level_version, level_targets = split_targets(fp.read())
+            if version is None:
+                version = level_version
+            elif level_version != version:
+                raise ValueError(f'{path} 的版本 {level_version} 與同路線其他標記檔（{version}）不同')
+            targets.extend(level_targets)
+            included.extend([level] * len(level_targets))
+        if not targets:
+            continue
+
+        payload = pack_targets(version, targets)
+        digest = hashlib.sha256(payload).hexdigest()[:10]
+        name = f'{BUNDLE_DIR}/targets_{get_valid_filename(route)}.{digest}.mind'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            with open(path, 'wb') as fp:
+                fp.write(payload)
+        manifest[route] = {
+            'url': settings.MEDIA_URL + name,
+            'levels': included,
+            'bytes': len(payload),
+            'hash': digest,
+            'missing': missing,
+        }
+
+    save_manifest(manifest, bundle_manifest_path())
+    _remove_stale_bundles(manifest)
+    return manifest
+
+
+def _remove_stale_bundles(manifest):
+    directory = os.path.join(settings.MEDIA_ROOT, BUNDLE_DIR)
+    keep = {os.path.basename(entry['url']) for entry in manifest.values()}
+    for name in os.listdir(directory):
+        if name.endswith('.mind') and name not in keep:
+            os.remove(os.path.join(directory, name))
+
+
+def bundle_for_level(level):
+    """包含某一關的路線與 bundle，找不到時回傳 (None, None)。"""
+    for route, entry in load_bundle_manifest().items():
+        if level in entry['levels']:
+            return route, entry
+    return None, None
@@ -1,3 +1,1661 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import async_views, events, export
+from .answer_log import compact_events, replay_events
+from .cache import bump_question_version, get_answer_index, question_cache, question_cache_version
+from .export import iter_rows
+from .images import Image, load_manifest, media_relative_path, optimize_image, save_manifest
+from .metrics import registry
+from .models import AnswerEvent, AnswerReceipt, LevelResult, Post, ProgressCounter, Question, UserProfile
+from .pagination import encode_cursor
+from .progress import LevelContent, build_content, load_content, rebuild_counters, record_level
+from .question_io import QuestionImportError, export_questions, fetch_icon, import_questions, openpyxl
+from .signals import apply_sqlite_pragmas
+from .targets import build_route_bundles, load_bundle_manifest, msgpack
+from .write_behind import GroupCommitWriter
+
+# 後台頁面使用未經 collectstatic 的靜態檔
+ADMIN_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def create_question(number, **fields):
+    defaults = {
+        'batch': '第一天', 'route': 'A', 'title': f'廠商{number}', 'question': f'第 {number} 題',
+        'choiceA': 'A', 'choiceB': 'B', 'choiceC': 'C', 'choiceD': 'D', 'answer': 'A',
+    }
+    defaults.update(fields)
+    return Question.objects.create(number=number, **defaults)
+
+
+@override_settings(TRIPS_CLIENT_VERDICTS=True)
+class PostUpdateAPIViewTests(TestCase):
+    """PATCH 的寫入方式；多數測試以舊版前端送來的 status 等欄位寫入（TRIPS_CLIENT_VERDICTS）。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.user = UserProfile.objects.create(phone='0912345678', gender='M')
+        self.post = Post.objects.create(user=self.user)
+        self.url = '/trips/api/post/0912345678/'
+
+    def patch(self, data):
+        return self.client.patch(self.url, data, content_type='application/json')
+
+    def test_updates_single_level_without_reading_progress(self):
+        # SAVEPOINT、upsert 該關（以 RETURNING 取回原狀態）、讀題目索引、更新 Post、累加計數器、新增事件、RELEASE SAVEPOINT
+        with self.assertNumQueries(7):
+            response = self.patch({'level': '3', 'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'})
+        self.assertEqual(
+            list(LevelResult.objects.values_list('level', 'status')), [(3, 'pass')]
+        )
+
+    def test_partial_update_keeps_other_fields(self):
+        self.patch({'level': 5, 'status': 'fail', 'user_answer': 'B', 'correct_answer': 'C'})
+        response = self.patch({'level': 5, 'status': 'pass'})
+
+        self.assertEqual(response.json(), {'status': 'pass', 'user_answer': 'B', 'correct_answer': 'C'})
+        self.assertEqual(LevelResult.objects.get(level=5).as_entry(), response.json())
+
+    def test_write_without_returning(self):
+        # SQLite 3.35 以前沒有 RETURNING，upsert 後在同一個交易內再讀一次
+        self.patch({'level': 5, 'status': 'fail', 'user_answer': 'B', 'correct_answer': 'C'})
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.patch({'level': 5, 'status': 'pass'})
+
+        self.assertEqual(response.json(), {'status': 'pass', 'user_answer': 'B', 'correct_answer': 'C'})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.passed_count, self.post.failed_count), (1, 0))
+
+    def test_creates_profile_and_post_for_unknown_phone(self):
+        response = self.client.patch(
+            '/trips/api/post/0900000000/', {'level': '1', 'status': 'pass'}, content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Post.objects.filter(user_id='0900000000').exists())
+        self.assertEqual(LevelResult.objects.get(user_id='0900000000', level=1).status, 'pass')
+
+    def test_invalid_payload_is_rejected(self):
+        self.assertEqual(self.patch({'status': 'pass'}).status_code, 400)
+        self.assertEqual(self.patch({'level': 'x', 'status': 'pass'}).status_code, 400)
+        self.assertEqual(self.patch({'level': '²', 'status': 'pass'}).json(), {'error': '無效的關卡參數'})
+        self.assertEqual(self.patch([{'level': 1, 'status': 'pass'}]).status_code, 400)
+        self.assertEqual(self.patch(1).status_code, 400)
+        self.assertEqual(self.patch({'level': 1, 'status': 'passed-with-honours'}).status_code, 400)
+        self.assertEqual(self.patch({'level': 1, 'status': 'pass', 'user_answer': 'A' * 101}).status_code, 400)
+        self.assertEqual(self.patch({'level': 1, 'status': 'pass', 'correct_answer': ['A']}).status_code, 400)
+        self.assertFalse(LevelResult.objects.exists())
+
+    @override_settings(TRIPS_CLIENT_VERDICTS=False)
+    def test_verdict_comes_from_server(self):
+        create_question(3, answer='C')
+
+        forged = self.patch({'level': 3, 'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'})
+        graded = self.patch({'level': 3, 'choice': 'A', 'status': 'pass', 'correct_answer': 'A'})
+
+        self.assertEqual(forged.status_code, 400)
+        self.assertEqual(graded.json(), {'status': 'fail', 'user_answer': 'A', 'correct_answer': 'C'})
+        self.assertEqual(AnswerEvent.objects.get().choice, 'A')
+        self.assertEqual(self.patch({'level': 4, 'choice': 'A'}).status_code, 404)
+        self.assertEqual(self.patch({'level': 3, 'choice': 'E'}).status_code, 400)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite 的寫入本來就依序進行')
+class ConcurrentLevelWriteTests(TransactionTestCase):
+    """PostgreSQL 上同一關的兩筆併發寫入，第二筆要等第一筆 commit 後才讀原狀態，統計只增加一次。"""
+
+    def test_same_level_is_counted_once(self):
+        Post.objects.create(user=UserProfile.objects.create(phone='0912345678', gender='M'))
+        written, release = threading.Event(), threading.Event()
+
+        def first():
+            try:
+                with transaction.atomic():
+                    record_level('0912345678', 1, {'status': 'pass'})
+                    written.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                record_level('0912345678', 1, {'status': 'pass'})
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        threads[0].start()
+        written.wait(5)
+        threads[1].start()
+        time.sleep(0.2)  # 第二筆在等第一筆的鎖
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(ProgressCounter.objects.get(key='level:1:pass').value, 1)
+        self.assertEqual(Post.objects.get(user_id='0912345678').passed_count, 1)
+
+
+class ProgressReadTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(phone='0912345678', gender='F')
+        Post.objects.create(user=self.user)
+        LevelResult.objects.create(user=self.user, level=2, status='fail', user_answer='B', correct_answer='C')
+
+    def test_post_detail_keeps_29_level_content_shape(self):
+        response = self.client.get('/trips/api/post-detail/0912345678/')
+
+        content = response.json()['content']
+        self.assertEqual(len(content), 29)
+        self.assertEqual(content['1'], {'status': 'null', 'user_answer': '', 'correct_answer': ''})
+        self.assertEqual(content['2'], {'status': 'fail', 'user_answer': 'B', 'correct_answer': 'C'})
+
+    def test_load_content_matches_python_fallback(self):
+        LevelResult.objects.create(user=self.user, level=12, status='pass', user_answer='A', correct_answer='A')
+        expected = build_content(LevelResult.objects.filter(user=self.user))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(load_content('0912345678'), expected)
+        with mock.patch.object(LevelContent, 'vendors', ()):
+            self.assertEqual(load_content('0912345678'), expected)
+        self.assertEqual(load_content('0900000000'), build_content([]))
+
+    def test_user_level_lookup(self):
+        response = self.client.get('/trips/api/user/', {'phone': '0912345678', 'level': '2'})
+
+        self.assertEqual(response.json(), {'2': {'status': 'fail', 'user_answer': 'B', 'correct_answer': 'C'}})
+        for level in ('²', 'x', '30'):
+            response = self.client.get('/trips/api/user/', {'phone': '0912345678', 'level': level})
+            self.assertEqual(response.status_code, 400)
+
+    def test_user_lookup_is_a_single_query(self):
+        expected = build_content(LevelResult.objects.filter(user=self.user))
+        with self.assertNumQueries(1):
+            data = self.client.get('/trips/api/user/', {'phone': '0912345678'}).json()
+        with self.assertNumQueries(1):
+            level = self.client.get('/trips/api/user/', {'phone': '0912345678', 'level': '3'}).json()
+
+        self.assertEqual((data['phone'], data['gender'], data['post']['content']), ('0912345678', 'F', expected))
+        self.assertEqual(level, {'3': {'status': 'null', 'user_answer': '', 'correct_answer': ''}})
+        with mock.patch.object(LevelContent, 'vendors', ()):
+            self.assertEqual(self.client.get('/trips/api/user/', {'phone': '0912345678'}).json(), data)
+        self.assertEqual(self.client.get('/trips/api/user/', {'phone': '0900000000'}).status_code, 404)
+
+    def test_registration_is_atomic(self):
+        with self.assertNumQueries(4):  # 兩個 INSERT，測試中的交易以 savepoint 進行
+            response = self.client.post('/trips/api/user/', {'phone': '0922222222', 'gender': 'M'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['post']['content'], build_content([]))
+        self.assertTrue(Post.objects.filter(user_id='0922222222').exists())
+
+        response = self.client.post('/trips/api/user/', {'phone': '0922222222', 'gender': 'F'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'phone': ['user profile with this phone already exists.']})
+        self.assertEqual(Post.objects.filter(user_id='0922222222').count(), 1)
+
+
+class QuestionDetailCacheTests(TestCase):
+    def setUp(self):
+        question_cache().clear()
+        self.question = create_question(1)
+        self.url = '/trips/api/question/1/'
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['question'], '第 1 題')
+
+    def test_admin_edit_invalidates_cache(self):
+        etag = self.client.get(self.url)['ETag']
+        version = question_cache_version()
+
+        self.question.question = '修改後的題目'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.question.save()
+            # commit 前的讀取仍拿到快取中的內容，也不會把任何內容寫進 commit 後使用的 key
+            self.assertEqual(self.client.get(self.url)['ETag'], etag)
+        self.assertEqual(question_cache_version(), version)
+        for callback in callbacks:
+            callback()
+        # 其他 worker 的 locmem 沒有被清除，但下一次讀取時版本已經不同
+        self.assertNotEqual(question_cache_version(), version)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['question'], '修改後的題目')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_concurrent_version_bumps(self):
+        # 同一個行程的多個執行緒同時換版本檔，各自使用不同的暫存檔
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(TRIPS_QUESTION_CACHE_VERSION_FILE=os.path.join(directory, 'version')):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(lambda _: bump_question_version(), range(200)))
+
+            self.assertEqual(os.listdir(directory), ['version'])
+            with open(os.path.join(directory, 'version')) as fp:
+                self.assertEqual(fp.read(), str(os.getpid()))
+
+    def test_renumbered_and_deleted_questions_are_invalidated(self):
+        self.client.get(self.url)
+
+        self.question.number = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.save()
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get('/trips/api/question/2/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.delete()
+        self.assertEqual(self.client.get('/trips/api/question/2/').status_code, 400)
+
+    def test_revalidation_returns_304(self):
+        first = self.client.get(self.url)
+
+        by_etag = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        by_date = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_etag.content, b'')
+        self.assertEqual(by_date.status_code, 304)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'questions': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        TRIPS_QUESTION_CACHE='questions',
+    )
+    def test_cache_backend_is_pluggable(self):
+        self.client.get(self.url)
+
+        # DummyCache 不保存任何東西，每次都回到資料庫
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+
+class RouteBootstrapAPIViewTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(phone='0912345678', gender='M')
+        Post.objects.create(user=self.user)
+        for number, route, batch in [(1, 'A', '第一天'), (2, 'A', '第一天'), (3, 'B', '第一天'), (29, 'A', '第二天')]:
+            create_question(number, route=route, batch=batch)
+        LevelResult.objects.create(user=self.user, level=2, status='pass', user_answer='A', correct_answer='A')
+        LevelResult.objects.create(user=self.user, level=3, status='fail', user_answer='B', correct_answer='A')
+
+    def test_returns_route_questions_with_progress_in_fixed_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/trips/api/route/a/0912345678/')
+
+        self.assertEqual(response.status_code, 200)
+        questions = response.json()['questions']
+        self.assertEqual([question['number'] for question in questions], [1, 2, 29])
+        self.assertEqual(questions[0]['progress']['status'], 'null')
+        self.assertEqual(questions[1]['progress'], {'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'})
+
+    def test_batch_filter(self):
+        response = self.client.get('/trips/api/route/A/0912345678/', {'batch': '第二天'})
+
+        self.assertEqual([question['number'] for question in response.json()['questions']], [29])
+
+    def test_unknown_player(self):
+        self.assertEqual(self.client.get('/trips/api/route/A/0900000000/').status_code, 404)
+
+
+@override_settings(TRIPS_CLIENT_VERDICTS=True)
+class PostBatchUpdateAPIViewTests(TestCase):
+    def setUp(self):
+        question_cache().clear()
+        self.user = UserProfile.objects.create(phone='0912345678', gender='M')
+        Post.objects.create(user=self.user)
+        self.url = '/trips/api/post/0912345678/batch/'
+
+    def submit(self, answers):
+        return self.client.post(self.url, {'answers': answers}, content_type='application/json')
+
+    def answer(self, key, level, status='pass', **extra):
+        return {'key': key, 'level': level, 'status': status, 'user_answer': 'A', 'correct_answer': 'A', **extra}
+
+    def test_applies_many_levels_with_constant_queries(self):
+        answers = [self.answer(f'k{level}', level) for level in range(1, 30)]
+
+        # SAVEPOINT、查冪等鍵、upsert（取回原狀態）、讀題目索引、更新 Post、累加計數器、新增事件、寫冪等鍵、RELEASE
+        with self.assertNumQueries(9):
+            response = self.submit(answers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['result'] for item in response.json()['results']}, {'applied'})
+        self.assertEqual(LevelResult.objects.filter(user=self.user, status='pass').count(), 29)
+
+    def test_resubmission_is_idempotent(self):
+        self.submit([self.answer('k1', 1, 'fail')])
+        LevelResult.objects.filter(level=1).update(status='pass')
+
+        response = self.submit([self.answer('k1', 1, 'fail'), self.answer('k2', 2)])
+
+        self.assertEqual([item['result'] for item in response.json()['results']], ['duplicate', 'applied'])
+        self.assertEqual(LevelResult.objects.get(level=1).status, 'pass')
+        self.assertEqual(AnswerReceipt.objects.count(), 2)
+
+    def test_same_key_from_another_player_is_applied(self):
+        self.submit([self.answer('k1', 1)])
+
+        response = self.client.post(
+            '/trips/api/post/0987654321/batch/', {'answers': [self.answer('k1', 1)]}, content_type='application/json',
+        )
+
+        self.assertEqual(response.json()['results'][0]['result'], 'applied')
+        self.assertTrue(LevelResult.objects.filter(user_id='0987654321', level=1).exists())
+        self.assertEqual(AnswerReceipt.objects.filter(key='k1').count(), 2)
+
+    def test_latest_client_ts_wins_within_batch(self):
+        response = self.submit([
+            self.answer('late', 4, 'pass', client_ts='2025-10-01T10:05:00Z'),
+            self.answer('early', 4, 'fail', client_ts='2025-10-01T10:00:00Z'),
+        ])
+
+        self.assertEqual([item['result'] for item in response.json()['results']], ['applied', 'superseded'])
+        self.assertEqual(LevelResult.objects.get(level=4).status, 'pass')
+
+    def test_invalid_items_are_reported_per_item(self):
+        response = self.submit([self.answer('ok', 3), {'key': 'bad', 'level': 0}])
+
+        results = response.json()['results']
+        self.assertEqual(results[0]['result'], 'applied')
+        self.assertEqual(results[1]['result'], 'invalid')
+        self.assertIn('level', results[1]['errors'])
+
+    def test_rejects_non_list_payload(self):
+        self.assertEqual(self.client.post(self.url, {'answers': 'x'}, content_type='application/json').status_code, 400)
+
+    @override_settings(TRIPS_CLIENT_VERDICTS=False)
+    def test_choice_is_judged_by_server(self):
+        create_question(5, answer='B')
+
+        response = self.submit([
+            {'key': 'c1', 'level': 5, 'choice': 'B', 'status': 'fail'},
+            {'key': 'c2', 'level': 6, 'choice': 'A'},
+        ])
+
+        results = response.json()['results']
+        self.assertEqual((results[0]['result'], results[0]['status']), ('applied', 'pass'))
+        self.assertEqual(results[1]['result'], 'invalid')
+        self.assertEqual(
+            LevelResult.objects.get(level=5).as_entry(), {'status': 'pass', 'user_answer': 'B', 'correct_answer': 'B'},
+        )
+
+        forged = self.submit([self.answer('c3', 5, 'pass')]).json()['results'][0]
+        self.assertEqual((forged['result'], list(forged['errors'])), ('invalid', ['choice']))
+
+
+class AnswerSubmitAPIViewTests(TestCase):
+    def setUp(self):
+        question_cache().clear()
+        self.user = UserProfile.objects.create(phone='0912345678', gender='M')
+        Post.objects.create(user=self.user)
+        self.question = create_question(7, answer='C')
+        self.url = '/trips/api/post/0912345678/answer/'
+
+    def submit(self, level, choice):
+        return self.client.post(self.url, {'level': level, 'choice': choice}, content_type='application/json')
+
+    def test_grades_and_records_answer(self):
+        response = self.submit(7, 'C')
+
+        self.assertEqual(response.json(), {'level': '7', 'status': 'pass'})
+        self.assertEqual(
+            LevelResult.objects.get(user=self.user, level=7).as_entry(),
+            {'status': 'pass', 'user_answer': 'C', 'correct_answer': 'C'},
+        )
+
+        self.assertEqual(self.submit(7, 'A').json()['status'], 'fail')
+
+    def test_answer_index_is_cached_and_invalidated(self):
+        self.submit(7, 'C')
+        with self.assertNumQueries(5):  # 狀態沒變：只有 upsert（取回原狀態）、更新 Post 與新增事件，不再查題目
+            self.submit(7, 'C')
+
+        self.question.answer = 'A'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.save()
+        self.assertEqual(self.submit(7, 'A').json()['status'], 'pass')
+
+    def test_question_payload_no_longer_contains_answer(self):
+        self.assertNotIn('answer', self.client.get('/trips/api/question/7/').json())
+
+    def test_unknown_level_and_invalid_choice(self):
+        self.assertEqual(self.submit(8, 'A').status_code, 404)
+        self.assertEqual(self.submit(7, 'E').status_code, 400)
+
+
+@override_settings(TRIPS_CLIENT_VERDICTS=True)
+class AnswerLogTests(TestCase):
+    """作答事件紀錄：每次寫入都新增事件；append 模式只新增事件，整併後才更新 LevelResult 與統計。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.user = UserProfile.objects.create(phone='0912345678', gender='M')
+        Post.objects.create(user=self.user)
+        self.question = create_question(1, answer='C')
+        create_question(2, answer='B')
+        self.url = '/trips/api/post/0912345678/'
+
+    def answer(self, level, choice):
+        data = {'level': level, 'choice': choice}
+        return self.client.post(f'{self.url}answer/', data, content_type='application/json')
+
+    def patch(self, **data):
+        return self.client.patch(self.url, data, content_type='application/json')
+
+    def test_every_write_is_logged(self):
+        self.patch(level=1, status='pass')
+        self.answer(2, 'A')
+
+        self.assertEqual(
+            list(AnswerEvent.objects.order_by('id').values_list('level', 'status', 'user_answer', 'choice')),
+            [(1, 'pass', None, ''), (2, 'fail', 'A', 'A')],
+        )
+
+    @override_settings(TRIPS_ANSWER_WRITES='queue', TRIPS_ANSWER_COMPACT_DELAY=2, TRIPS_WRITE_BEHIND_TIMEOUT=10)
+    def test_late_commit_is_not_skipped(self):
+        # 第一筆先配發 id，所在的合併交易 5 秒後才 commit；之後配發 id 的第二筆已經 commit
+        created_at = timezone.now() - timedelta(seconds=5)
+        AnswerEvent.objects.create(id=2, phone='0912345678', level=2, status='fail', created_at=created_at)
+        self.assertEqual(compact_events(), 0)
+
+        AnswerEvent.objects.create(id=1, phone='0912345678', level=1, status='pass', created_at=created_at)
+        self.assertEqual(compact_events(delay=0), 2)
+        self.assertEqual(dict(LevelResult.objects.values_list('level', 'status')), {1: 'pass', 2: 'fail'})
+
+    @override_settings(TRIPS_ANSWER_WRITES='append', TRIPS_ANSWER_COMPACT_DELAY=0)
+    def test_append_mode_defers_state_until_compaction(self):
+        get_answer_index()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.answer(1, 'C').json()['status'], 'pass')
+        self.assertEqual(
+            self.patch(level=2, user_answer='D').json(), {'status': 'null', 'user_answer': 'D', 'correct_answer': ''},
+        )
+
+        # 還沒整併：LevelResult 與統計不變，玩家讀到的進度已包含剛才的作答
+        self.assertFalse(LevelResult.objects.exists())
+        content = self.client.get('/trips/api/post-detail/0912345678/').json()['content']
+        self.assertEqual(content['1'], {'status': 'pass', 'user_answer': 'C', 'correct_answer': 'C'})
+        self.assertEqual(content['2']['user_answer'], 'D')
+
+        self.assertEqual(compact_events(), 2)
+        self.assertEqual(compact_events(), 0)
+        self.assertEqual(load_content('0912345678'), content)
+        self.assertEqual(ProgressCounter.objects.get(key='level:1:pass').value, 1)
+        self.assertEqual(Post.objects.get(user=self.user).passed_count, 1)
+
+    def test_regrade_after_question_fix(self):
+        self.answer(1, 'A')
+        self.answer(2, 'B')
+        self.question.answer = 'A'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.save()
+
+        call_command('replay_answer_events', '--regrade', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(
+            LevelResult.objects.get(level=1).as_entry(), {'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'},
+        )
+        self.assertEqual(Post.objects.get(user=self.user).passed_count, 2)
+        self.assertEqual(ProgressCounter.objects.get(key='level:1:pass').value, 1)
+        # 原本的判分保留在紀錄中，更正以新事件追加
+        self.assertEqual(list(AnswerEvent.objects.filter(level=1).values_list('status', flat=True)), ['fail', 'pass'])
+
+    def test_replay_rebuilds_state_from_log(self):
+        self.patch(level=1, status='pass', user_answer='C')
+        self.patch(level=1, correct_answer='C')
+        LevelResult.objects.update(status='fail')
+        Post.objects.update(passed_count=0)
+
+        self.assertEqual(replay_events(), 1)
+
+        self.assertEqual(
+            LevelResult.objects.get(level=1).as_entry(), {'status': 'pass', 'user_answer': 'C', 'correct_answer': 'C'},
+        )
+        self.assertEqual(Post.objects.get(user=self.user).passed_count, 1)
+
+
+class WriteBehindTests(TestCase):
+    """queue 模式：多個請求的寫入合併成一個交易；整併失敗時快照不前進，下一輪重新整併。"""
+
+    def setUp(self):
+        question_cache().clear()
+        create_question(1, answer='C')
+        self.writer = GroupCommitWriter(interval_ms=0)
+
+    def event(self, level, phone='0912345678'):
+        return AnswerEvent(phone=phone, level=level, status='pass')
+
+    def commit(self, *jobs):
+        batch = [(job, Future()) for job in jobs]
+        self.writer.commit(batch)
+        return [future.exception() or future.result() for _, future in batch]
+
+    def fail(self, exc):
+        def job():
+            AnswerEvent.objects.create(phone='0912345678', level=9, status='fail')
+            raise exc
+        return job
+
+    def test_failed_job_only_affects_its_request(self):
+        with CaptureQueriesContext(connection) as ctx:
+            results = self.commit(self.event(1).save, self.fail(ValueError('x')), self.event(2).save)
+
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(sorted(AnswerEvent.objects.values_list('level', flat=True)), [1, 2])
+        # 三個請求共用一個交易（測試中為外層 savepoint），各自再包一層 savepoint
+        self.assertEqual(sum(query['sql'].startswith('SAVEPOINT') for query in ctx.captured_queries), 4)
+
+    def test_database_error_fails_the_whole_batch(self):
+        results = self.commit(self.event(1).save, self.fail(OperationalError('database is locked')))
+
+        self.assertTrue(all(isinstance(result, OperationalError) for result in results))
+        self.assertFalse(AnswerEvent.objects.exists())
+
+    def test_cancelled_job_is_skipped(self):
+        # 請求逾時後取消的 job 不再執行，同一批的其他寫入照常 commit
+        cancelled = Future()
+        cancelled.cancel()
+        batch = [(self.event(1).save, cancelled), (self.event(2).save, Future())]
+        self.writer.commit(batch)
+
+        self.assertEqual(list(AnswerEvent.objects.values_list('level', flat=True)), [2])
+        self.assertTrue(batch[1][1].done())
+
+    def test_asubmit_waits_on_the_event_loop(self):
+        def commit(batch):
+            for job, future in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(job())
+
+        writer = GroupCommitWriter(interval_ms=0)
+        writer.commit = commit
+        self.addCleanup(writer.stop)
+        release = threading.Event()
+
+        async def requests():
+            self.assertEqual(await writer.asubmit(lambda: 42), 42)
+            # 逾時只停止等待，已送出的 job 照常完成，寫入執行緒不受影響
+            with self.assertRaises(TimeoutError):
+                await writer.asubmit(release.wait, timeout=0.01)
+            # 逾時時還沒開始的 job 不再執行，合併交易因此最晚在逾時前開始
+            with self.assertRaises(TimeoutError):
+                await writer.asubmit(skipped.set, timeout=0.01)
+            release.set()
+            self.assertEqual(await writer.asubmit(lambda: 'after'), 'after')
+
+        skipped = threading.Event()
+        asyncio.run(requests())
+        self.assertFalse(skipped.is_set())
+
+    @override_settings(TRIPS_ANSWER_WRITES='append', TRIPS_ANSWER_COMPACT_DELAY=0)
+    def test_compaction_failure_is_retried(self):
+        UserProfile.objects.create(phone='0912345678', gender='M')
+        record_level('0912345678', 1, {'status': 'pass'})
+
+        with mock.patch('trips.answer_log.apply_changes', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                compact_events()
+        self.assertFalse(LevelResult.objects.exists())
+
+        self.assertEqual(compact_events(), 1)
+        self.assertEqual(ProgressCounter.objects.get(key='level:1:pass').value, 1)
+        self.assertEqual(Post.objects.get(user_id='0912345678').passed_count, 1)
+
+
+class WriteBehindCrashTests(SimpleTestCase):
+    """queue 模式下行程在請求進行中當掉：已回應 200 的作答都在 AnswerEvent 中，重新啟動後整併不遺失。"""
+    crash_after = 0.5
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_path = os.path.join(directory, 'crash.sqlite3')
+        self.env = {
+            **os.environ, 'DJANGO_SETTINGS_MODULE': 'mysite.settings', 'DB_ENGINE': 'sqlite3',
+            'DB_NAME': self.db_path, 'TRIPS_ANSWER_WRITES': 'queue', 'TRIPS_WRITE_BEHIND_APPLY_MS': '0',
+            'TRIPS_CLIENT_VERDICTS': '1',
+        }
+
+    def run_child(self, code):
+        return subprocess.run(
+            [sys.executable, '-c', textwrap.dedent(code)], cwd=settings.BASE_DIR, env=self.env,
+            capture_output=True, text=True, timeout=60,
+        )
+
+    def test_acknowledged_answers_survive_crash(self):
+        child = self.run_child(f"""
+            import os, sys, threading
+            import django
+            django.setup()
+            from django.core.management import call_command
+            from django.test import Client
+            from django.test.utils import setup_test_environment
+            from trips.models import Post, UserProfile
+
+            setup_test_environment()
+            call_command('migrate', verbosity=0)
+            phones = [f'09000000{{index:02d}}' for index in range(8)]
+            for phone in phones:
+                Post.objects.create(user=UserProfile.objects.create(phone=phone, gender='O'))
+            lock = threading.Lock()
+
+            def play(phone):
+                client = Client()
+                for level in range(1, 1000):
+                    level = level % 29 + 1
+                    response = client.patch(f'/trips/api/post/{{phone}}/', {{'level': level, 'status': 'pass'}},
+                                            content_type='application/json')
+                    if response.status_code == 200:
+                        with lock:
+                            sys.stdout.write(f'{{phone}} {{level}}\\n')
+                            sys.stdout.flush()
+
+            for phone in phones:
+                threading.Thread(target=play, args=(phone,), daemon=True).start()
+            # 請求進行中直接結束行程：不執行 atexit，寫入與整併執行緒來不及收尾
+            threading.Timer({self.crash_after}, os._exit, args=(1,)).start()
+            threading.Event().wait()
+        """)
+        self.assertEqual(child.returncode, 1, child.stderr)
+        # 行程可能在輸出一行的途中結束，最後一行不完整時不計
+        acknowledged = {tuple(line.split()) for line in child.stdout.splitlines(keepends=True) if line.endswith('\n')}
+        self.assertTrue(acknowledged, child.stderr)
+
+        with sqlite3.connect(self.db_path) as db:
+            logged = set(db.execute('SELECT phone, level FROM trips_answerevent'))
+            self.assertEqual(db.execute('SELECT COUNT(*) FROM trips_levelresult').fetchone(), (0,))
+        self.assertLessEqual(acknowledged, {(phone, str(level)) for phone, level in logged})
+
+        # 重新啟動後整併
+        restart = self.run_child("""
+            import django
+            django.setup()
+            from django.core.management import call_command
+            call_command('compact_answer_events')
+        """)
+        self.assertEqual(restart.returncode, 0, restart.stderr)
+        with sqlite3.connect(self.db_path) as db:
+            results = set(db.execute("SELECT user_id, level FROM trips_levelresult WHERE status = 'pass'"))
+            last_event = db.execute('SELECT MAX(id) FROM trips_answerevent').fetchone()[0]
+            self.assertEqual(db.execute('SELECT event_id FROM trips_progresssnapshot').fetchone(), (last_event,))
+        self.assertEqual(results, logged)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        question_cache().clear()
+        cache.clear()
+        for number, route in [(1, 'A'), (2, 'A'), (3, 'B')]:
+            create_question(number, route=route, answer='A')
+        for phone in ('0911111111', '0922222222', '0933333333'):
+            Post.objects.create(user=UserProfile.objects.create(phone=phone, gender='O'))
+
+    def answer(self, phone, level, choice):
+        self.client.post(f'/trips/api/post/{phone}/answer/', {'level': level, 'choice': choice},
+                         content_type='application/json')
+
+    def counters(self):
+        return dict(ProgressCounter.objects.exclude(value=0).values_list('key', 'value'))
+
+    def test_counters_follow_each_answer(self):
+        self.answer('0911111111', 1, 'A')
+        self.answer('0911111111', 2, 'B')
+        self.answer('0922222222', 1, 'B')
+
+        self.assertEqual(self.counters(), {
+            'level:1:pass': 1, 'level:1:fail': 1, 'level:2:fail': 1, 'route:A:finished': 1,
+        })
+        post = Post.objects.get(user_id='0911111111')
+        self.assertEqual((post.passed_count, post.failed_count), (1, 1))
+
+    def test_changing_an_answer_moves_counts_instead_of_double_counting(self):
+        self.answer('0911111111', 1, 'B')
+        self.answer('0911111111', 1, 'A')
+
+        self.assertEqual(self.counters(), {'level:1:pass': 1})
+        self.assertEqual(Post.objects.get(user_id='0911111111').passed_count, 1)
+
+    def test_leaderboard_endpoint(self):
+        self.answer('0911111111', 1, 'A')
+        self.answer('0922222222', 1, 'A')
+        self.answer('0922222222', 2, 'A')
+
+        with self.assertNumQueries(2):
+            data = self.client.get('/trips/api/leaderboard/', {'limit': 2}).json()
+        with self.assertNumQueries(0):
+            self.client.get('/trips/api/leaderboard/', {'limit': 2})
+
+        self.assertEqual(data['routes']['A'], {'levels': 2, 'finished': 1})
+        self.assertEqual(data['levels']['1'], {'pass': 2, 'fail': 0})
+        self.assertEqual([(row['phone'], row['passed']) for row in data['top']],
+                         [('0922***222', 2), ('0911***111', 1)])
+        for limit in ('²', 'x', '0', '101'):
+            self.assertEqual(self.client.get('/trips/api/leaderboard/', {'limit': limit}).status_code, 400)
+
+    def test_rebuild_matches_incremental_counters(self):
+        self.answer('0911111111', 1, 'A')
+        self.answer('0911111111', 2, 'A')
+        self.answer('0933333333', 3, 'C')
+        incremental = self.counters()
+
+        rebuild_counters()
+
+        self.assertEqual(self.counters(), incremental)
+
+
+class AsyncViewTests(TestCase):
+    """ASGI 模式的 async view 必須與同步 APIView 回傳相同的內容。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.factory = AsyncRequestFactory()
+        self.user = UserProfile.objects.create(phone='0912345678', gender='M')
+        Post.objects.create(user=self.user)
+        create_question(1)
+
+    async def test_question_detail_matches_sync_view(self):
+        sync_response = await self.async_client.get('/trips/api/question/1/')
+        response = await async_views.question_detail(self.factory.get('/'), 1)
+
+        self.assertEqual(json.loads(response.content), sync_response.json())
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+
+        not_modified = await async_views.question_detail(
+            self.factory.get('/', headers={'If-None-Match': response['ETag']}), 1
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    async def test_post_update_then_detail(self):
+        request = self.factory.patch('/', {'level': '1', 'choice': 'B'}, content_type='application/json')
+        response = await async_views.post_update(request, '0912345678')
+        self.assertEqual(json.loads(response.content), {'status': 'fail', 'user_answer': 'B', 'correct_answer': 'A'})
+
+        detail = await async_views.post_detail(self.factory.get('/'), '0912345678')
+        sync_detail = await self.async_client.get('/trips/api/post-detail/0912345678/')
+        self.assertEqual(json.loads(detail.content), sync_detail.json())
+
+    @override_settings(TRIPS_ANSWER_WRITES='queue')
+    async def test_post_update_in_queue_mode_does_not_hold_a_thread(self):
+        async def inline(job):
+            return await sync_to_async(job)()
+
+        request = self.factory.patch('/', {'level': '1', 'choice': 'A'}, content_type='application/json')
+        with mock.patch('trips.write_behind.asubmit', side_effect=inline) as asubmit, \
+                mock.patch('trips.write_behind.submit') as submit:
+            response = await async_views.post_update(request, '0912345678')
+
+        self.assertEqual(json.loads(response.content), {'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'})
+        self.assertEqual(asubmit.call_count, 1)
+        submit.assert_not_called()
+        self.assertTrue(await AnswerEvent.objects.filter(phone='0912345678', level=1, choice='A').aexists())
+
+    async def test_errors(self):
+        missing = await async_views.post_detail(self.factory.get('/'), '0900000000')
+        bad_level = await async_views.post_update(
+            self.factory.patch('/', {'level': 'x'}, content_type='application/json'), '0912345678'
+        )
+
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(bad_level.status_code, 400)
+
+
+class ProgressEventTests(TestCase):
+    """作答 commit 後推播進度變化（trips/events.py）。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.factory = AsyncRequestFactory()
+        Post.objects.create(user=UserProfile.objects.create(phone='0912345678', gender='M'))
+        for number in (1, 2):
+            create_question(number, route='A')
+
+    def test_commit_publishes_levels_and_counters(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def subscribe():
+            return events.get_broker().subscribe([events.player_channel('0912345678'), events.PROGRESS_CHANNEL])
+
+        subscription = loop.run_until_complete(subscribe())
+        self.addCleanup(subscription.close)
+
+        def receive():
+            return loop.run_until_complete(asyncio.wait_for(subscription.get(), 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_level('0912345678', 1, {'status': 'pass', 'user_answer': 'A', 'correct_answer': 'A'})
+            record_level('0912345678', 2, {'status': 'fail', 'user_answer': 'B', 'correct_answer': 'A'})
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            # 狀態沒有改變時不推播
+            record_level('0912345678', 2, {'user_answer': 'C'})
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(receive(), ('levels', {'levels': {'1': 'pass'}}))
+        self.assertEqual(receive(), ('counters', {'routes': {}, 'levels': {'1': {'pass': 1}}}))
+        self.assertEqual(receive(), ('levels', {'levels': {'2': 'fail'}}))
+        self.assertEqual(receive(), ('counters', {'routes': {'A': {'finished': 1}}, 'levels': {'2': {'fail': 1}}}))
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_player_stream_sends_snapshot_then_events(self):
+        missing = await async_views.player_events(self.factory.get('/'), '0900000000')
+        self.assertEqual(missing.status_code, 404)
+
+        response = await async_views.player_events(self.factory.get('/'), '0912345678')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        try:
+            self.assertEqual(await anext(content), f'retry: {events.RETRY_MS}\n\n'.encode())
+            snapshot = (await anext(content)).decode()
+            self.assertTrue(snapshot.startswith('event: snapshot\ndata: '))
+            self.assertEqual(json.loads(snapshot.split('data: ', 1)[1])['content']['1']['status'], 'null')
+
+            events.publish(events.player_channel('0912345678'), 'levels', {'levels': {'1': 'pass'}})
+            events.publish(events.player_channel('0900000000'), 'levels', {'levels': {'1': 'fail'}})
+            self.assertEqual(await anext(content), b'event: levels\ndata: {"levels": {"1": "pass"}}\n\n')
+        finally:
+            await content.aclose()
+
+    async def test_socket_broker_relays_to_other_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # 已結束的 worker 留下的 socket 檔
+        stale = os.path.join(directory, 'stale.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.bind(stale)
+
+        listener, publisher = events.SocketBroker(directory), events.SocketBroker(directory)
+        subscription = listener.subscribe([events.PROGRESS_CHANNEL])
+        try:
+            publisher.publish(events.PROGRESS_CHANNEL, 'counters', {'routes': {'A': {'finished': 3}}})
+            received = await asyncio.wait_for(subscription.get(), 1)
+        finally:
+            subscription.close()
+            listener.close()
+
+        self.assertEqual(received, ('counters', {'routes': {'A': {'finished': 3}}}))
+        self.assertFalse(os.path.exists(stale))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'PRAGMA 只適用於 SQLite')
+class SqlitePragmaTests(TestCase):
+    """DB_PROFILE 的 PRAGMA 在每條新連線建立時套用。"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connection_created(self):
+        original = self.pragma('busy_timeout')
+
+        with override_settings(TRIPS_SQLITE_PRAGMAS={'busy_timeout': 1234}):
+            apply_sqlite_pragmas(sender=None, connection=connection)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+
+        with override_settings(TRIPS_SQLITE_PRAGMAS={'busy_timeout': original}):
+            apply_sqlite_pragmas(sender=None, connection=connection)
+        self.assertEqual(self.pragma('busy_timeout'), original)
+
+
+
+@skipUnless(Image is not None, '需要 Pillow')
+class ImageVariantTests(TestCase):
+    icon = 'https://github.com/tdance555/tdance2024/blob/main/media/vendor_icons/11.png'
+
+    def setUp(self):
+        question_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(
+            MEDIA_ROOT=self.media_root, TRIPS_IMAGE_WIDTHS=(320, 640), TRIPS_IMAGE_FORMATS=('webp',)
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'vendor_icons'))
+        self.save_png((255, 0, 0))
+
+    def save_png(self, color):
+        Image.new('RGB', (800, 400), color).save(os.path.join(self.media_root, 'vendor_icons', '11.png'))
+
+    def test_media_relative_path(self):
+        self.assertEqual(media_relative_path(self.icon), 'vendor_icons/11.png')
+        self.assertEqual(media_relative_path('/media/questions/%E9%BB%83.png'), 'questions/黃.png')
+        self.assertIsNone(media_relative_path('https://example.com/logo.png'))
+        self.assertIsNone(media_relative_path(''))
+
+    def test_variants_are_content_hashed_and_replaced(self):
+        manifest = {}
+        entry = optimize_image('vendor_icons/11.png', manifest)
+
+        self.assertEqual([(v['format'], v['width']) for v in entry['variants']], [('webp', 320), ('webp', 640)])
+        self.assertIn(f".{entry['hash']}.320w.webp", entry['variants'][0]['url'])
+        self.assertIs(optimize_image('vendor_icons/11.png', manifest), entry)
+
+        self.save_png((0, 0, 255))
+        updated = optimize_image('vendor_icons/11.png', manifest)
+        self.assertNotEqual(updated['hash'], entry['hash'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'optimized', 'vendor_icons'))), sorted(
+            os.path.basename(v['url']) for v in updated['variants']
+        ))
+
+    def test_question_save_generates_variants_and_api_picks_best(self):
+        create_question(1, icon=self.icon)
+        self.assertIn('vendor_icons/11.png', load_manifest())
+
+        small = self.client.get('/trips/api/question/1/', {'icon_width': '300'}, HTTP_ACCEPT='image/webp,*/*')
+        default = self.client.get('/trips/api/question/1/')
+        original = self.client.get('/trips/api/question/1/', {'icon_format': 'png'})
+
+        self.assertTrue(small.json()['icon'].startswith('http://testserver/media/optimized/'))
+        self.assertTrue(small.json()['icon'].endswith('.320w.webp'))
+        self.assertTrue(default.json()['icon'].endswith('.640w.webp'))
+        self.assertEqual(original.json()['icon'], self.icon)
+        self.assertEqual(len(default.json()['icon_variants']), 2)
+        self.assertTrue(all(v['url'].startswith('http://testserver/') for v in default.json()['icon_variants']))
+        self.assertEqual(len({small['ETag'], default['ETag'], original['ETag']}), 3)
+        self.assertIn('Accept', default['Vary'])
+        self.assertEqual(self.client.get('/trips/api/question/1/', {'icon_width': '²'}).json()['icon'], default.json()['icon'])
+
+    def test_concurrent_manifest_saves(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda index: save_manifest({'index': index}), range(200)))
+
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'optimized')), ['manifest.json'])
+        self.assertIn('index', load_manifest())
+        self.assertEqual(os.stat(os.path.join(self.media_root, 'optimized', 'manifest.json')).st_mode & 0o777, 0o644)
+
+    def test_icon_outside_media_root_is_skipped(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        Image.new('RGB', (800, 400)).save(os.path.join(outside, 'escape.png'))
+        relative = os.path.relpath(os.path.join(outside, 'escape.png'), self.media_root)
+
+        create_question(1, icon=f'/media/{relative}')
+
+        self.assertNotIn(relative, load_manifest())
+        self.assertEqual(os.listdir(outside), ['escape.png'])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'optimized')))
+
+
+
+class AssetServingTests(TestCase):
+    """collectstatic 產生雜湊檔名與壓縮檔，AssetMiddleware 以正確的快取標頭、ETag 與 Range 提供。"""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.static_root)
+        os.makedirs(os.path.join(self.source, 'css'))
+        with open(os.path.join(self.source, 'index.html'), 'w') as fp:
+            fp.write('<link href="css/site.css"><img src="./missing.png"><a href="https://example.com/">')
+        with open(os.path.join(self.source, 'css', 'site.css'), 'w') as fp:
+            fp.write('body { color: #333; }\n' * 200)
+
+        override = override_settings(
+            STATIC_ROOT=self.static_root,
+            STATICFILES_DIRS=[('frontend', self.source)],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            TRIPS_SERVE_ASSETS=True,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as fp:
+            self.css = json.load(fp)['paths']['frontend/css/site.css']
+
+    def test_collectstatic_rewrites_html_and_precompresses(self):
+        with open(os.path.join(self.static_root, 'frontend', 'index.html')) as fp:
+            html = fp.read()
+
+        self.assertIn(f'href="{self.css.split("/", 1)[1]}"', html)
+        self.assertIn('src="./missing.png"', html)
+        self.assertIn('href="https://example.com/"', html)
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, self.css + '.gz')))
+
+    def test_hashed_files_are_immutable_and_precompressed(self):
+        response = self.client.get(f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip')
+        page = self.client.get('/static/frontend/index.html')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(page['Cache-Control'], 'no-cache')
+        self.assertEqual(self.client.get('/static/frontend/nope.css').status_code, 404)
+
+    def test_conditional_and_range_requests(self):
+        url = f'/static/{self.css}'
+        full = b''.join(self.client.get(url).streaming_content)
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 10-19/{len(full)}')
+        self.assertEqual(b''.join(partial.streaming_content), full[10:20])
+        self.assertNotIn('Content-Encoding', partial)
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(full)}-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    async def test_served_under_asgi(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get(f'/static/{self.css}', headers={'Accept-Encoding': 'gzip'})
+            body = b''.join([chunk async for chunk in response])
+            partial = await self.async_client.get(f'/static/{self.css}', headers={'Range': 'bytes=10-19'})
+            partial_body = b''.join([chunk async for chunk in partial])
+        missing = await self.async_client.get('/static/frontend/nope.css')
+
+        # 內容以 async iterator 傳送，不會先整個讀進記憶體
+        self.assertFalse([warning for warning in caught if 'synchronous iterators' in str(warning.message)])
+        self.assertTrue(response.is_async and partial.is_async)
+        with open(os.path.join(self.static_root, self.css + '.gz'), 'rb') as fp:
+            self.assertEqual(body, fp.read())
+        with open(os.path.join(self.static_root, self.css), 'rb') as fp:
+            self.assertEqual((partial.status_code, partial_body), (206, fp.read()[10:20]))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(missing.status_code, 404)
+
+
+@skipUnless(msgpack is not None, '需要 msgpack')
+class RouteTargetBundleTests(TestCase):
+    """各關的 .mind 依路線合併，manifest 端點回傳 bundle 網址與 targetIndex 對應的關卡。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.source = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, TRIPS_MIND_SOURCE_DIR=self.source)
+        override.enable()
+        self.addCleanup(override.disable)
+        for number, route in ((1, 'A'), (2, 'B'), (3, 'A'), (4, 'B')):
+            create_question(number, route=route)
+        for level in (1, 2, 3):
+            self.write_mind(level)
+
+    def write_mind(self, level):
+        # 與 MindAR 編譯器相同使用 float32
+        data = {'v': 2, 'dataList': [{'targetImage': {'width': level, 'height': level}, 'scale': 0.1 * level}]}
+        with open(os.path.join(self.source, f'targets_{level:02d}.mind'), 'wb') as fp:
+            fp.write(msgpack.packb(data, use_single_float=True))
+
+    def read_bundle(self, entry):
+        with open(os.path.join(self.media_root, entry['url'][len('/media/'):]), 'rb') as fp:
+            return fp.read()
+
+    def test_bundles_follow_question_routes(self):
+        call_command('build_route_targets', stdout=open(os.devnull, 'w'))
+        manifest = self.client.get('/trips/api/targets/').json()
+
+        self.assertEqual(manifest['A']['levels'], [1, 3])
+        self.assertEqual(manifest['B']['levels'], [2])
+        data = msgpack.unpackb(self.read_bundle(load_bundle_manifest()['A']), strict_map_key=False)
+        self.assertEqual([target['targetImage']['width'] for target in data['dataList']], [1, 3])
+        self.assertTrue(manifest['A']['url'].startswith('http://testserver/media/optimized/mind/targets_A.'))
+        # 重新打包不改變標記內容，bundle 大小約為各關之和
+        sources = sum(os.path.getsize(os.path.join(self.source, f'targets_0{n}.mind')) for n in (1, 3))
+        self.assertLess(manifest['A']['bytes'], sources)
+
+    def test_lookup_by_level_and_route(self):
+        build_route_bundles({'A': [1, 3], 'B': [2, 4]})
+
+        by_level = self.client.get('/trips/api/targets/', {'level': 3}).json()
+        self.assertEqual((by_level['route'], by_level['levels']), ('A', [1, 3]))
+        self.assertEqual(self.client.get('/trips/api/targets/b/').json()['levels'], [2])
+        self.assertEqual(self.client.get('/trips/api/targets/', {'level': 4}).status_code, 404)
+        self.assertEqual(self.client.get('/trips/api/targets/Z/').status_code, 404)
+        self.assertEqual(self.client.get('/trips/api/targets/', {'level': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/trips/api/targets/', {'level': '²'}).status_code, 400)
+
+    def test_rebuild_replaces_stale_bundle(self):
+        old = build_route_bundles({'A': [1, 3]})['A']
+        new = build_route_bundles({'A': [1]})['A']
+
+        self.assertNotEqual(old['url'], new['url'])
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.media_root, 'optimized', 'mind'))),
+            sorted(['manifest.json', os.path.basename(new['url'])]),
+        )
+
+
+
+class ARAssetTests(TestCase):
+    """AR 素材的分段校驗表與 Range 續傳：模擬下載到一半斷線後繼續。"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, TRIPS_ASSET_CHUNK_SIZE=1000)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'AR掃描'))
+        self.data = os.urandom(4500)
+        self.write(self.data)
+        self.url = '/trips/api/assets/AR掃描/targets.mind'
+
+    def write(self, data):
+        path = os.path.join(self.media_root, 'AR掃描', 'targets.mind')
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        # 確保修改時間改變，快取的校驗碼才會重新計算
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + len(data)))
+
+    def fetch(self, **headers):
+        response = self.client.get(self.url, **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_chunk_manifest(self):
+        response = self.client.get('/trips/api/asset-chunks/AR掃描/targets.mind')
+        manifest = response.json()
+
+        self.assertEqual(manifest['url'], 'http://testserver/trips/api/assets/AR%E6%8E%83%E6%8F%8F/targets.mind')
+        self.assertEqual(manifest['size'], 4500)
+        self.assertEqual([chunk['length'] for chunk in manifest['chunks']], [1000, 1000, 1000, 1000, 500])
+        self.assertEqual(manifest['chunks'][4]['sha256'], hashlib.sha256(self.data[4000:]).hexdigest())
+        self.assertEqual(manifest['etag'], self.client.get(self.url)['ETag'])
+        self.assertEqual(
+            self.client.get('/trips/api/asset-chunks/AR掃描/targets.mind', HTTP_IF_NONE_MATCH=manifest['etag']).status_code,
+            304,
+        )
+
+    def test_resume_truncated_transfer(self):
+        first, _ = self.fetch()
+        etag = first['ETag']
+        # 連線在 1234 bytes 處中斷，剩下的部分以 Range + If-Range 續傳
+        received = self.data[:1234]
+        resumed, body = self.fetch(HTTP_RANGE=f'bytes={len(received)}-', HTTP_IF_RANGE=etag)
+
+        self.assertEqual(resumed.status_code, 206)
+        self.assertEqual(resumed['Content-Range'], 'bytes 1234-4499/4500')
+        self.assertEqual(received + body, self.data)
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag)[0].status_code, 304)
+
+    def test_resume_after_file_changed_restarts(self):
+        manifest = self.client.get('/trips/api/asset-chunks/AR掃描/targets.mind').json()
+        self.write(os.urandom(4500))
+
+        response, body = self.fetch(HTTP_RANGE='bytes=1000-1999', HTTP_IF_RANGE=manifest['etag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body), 4500)
+        # 沒帶 If-Range 的舊分段會與校驗表不符，前端據此丟棄
+        response, body = self.fetch(HTTP_RANGE='bytes=1000-1999')
+        self.assertNotEqual(hashlib.sha256(body).hexdigest(), manifest['chunks'][1]['sha256'])
+
+    async def test_streamed_under_asgi(self):
+        # AsyncClient 以 latin-1 解讀路徑，無法測試中文檔名，另存一份英文檔名
+        shutil.copy(os.path.join(self.media_root, 'AR掃描', 'targets.mind'), self.media_root)
+        url = '/trips/api/assets/targets.mind'
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            full = await self.async_client.get(url)
+            full_body = b''.join([chunk async for chunk in full])
+            partial = await self.async_client.get(url, headers={'Range': 'bytes=1234-', 'If-Range': full['ETag']})
+            partial_body = b''.join([chunk async for chunk in partial])
+
+        # 同步 iterator 在 ASGI 下會整個讀進記憶體並發出 Warning
+        self.assertFalse([warning for warning in caught if 'synchronous iterators' in str(warning.message)])
+        self.assertTrue(full.is_async and partial.is_async)
+        self.assertEqual((full.status_code, full['Content-Length'], full_body), (200, '4500', self.data))
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], 'bytes 1234-4499/4500')
+        self.assertEqual(partial_body, self.data[1234:])
+
+    def test_path_outside_media_root(self):
+        self.assertEqual(self.client.get('/trips/api/assets/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/trips/api/asset-chunks/AR掃描/nope.mind').status_code, 404)
+
+
+class PrecacheManifestTests(TestCase):
+    """service worker 的預先快取清單：前端檔案由頁面出發收集，題目與路線依目前資料即時產生。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.app_dir = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.app_dir)
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(
+            MEDIA_ROOT=self.media_root, TRIPS_PRECACHE_APP_DIR=self.app_dir, TRIPS_PRECACHE_APP_EXCLUDE=('mind/',),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.write('index.html', '<link href="css/style.css" rel="stylesheet"><script src="js/app.js"></script>'
+                                 '<script src="https://cdn.example.com/lib@1.0/lib.js"></script>')
+        self.write('css/style.css', 'body { background: url("../img/bg 1.png"); }')
+        self.write('js/app.js', 'var target = "mind/targets_01.mind"; var icon = "img/icon.png";')
+        self.write('img/bg 1.png', 'bg')
+        self.write('img/icon.png', 'icon')
+        self.write('img/unused.png', 'unused')
+        self.write('mind/targets_01.mind', 'mind')
+        create_question(1)
+        create_question(2, route='B')
+
+    def write(self, relative, text):
+        path = os.path.join(self.app_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fp:
+            fp.write(text)
+
+    def test_collects_referenced_files(self):
+        call_command('build_precache_manifest', stdout=open(os.devnull, 'w'))
+        manifest = self.client.get('/trips/api/offline/manifest/').json()
+
+        self.assertEqual(
+            [entry['url'] for entry in manifest['app']],
+            ['css/style.css', 'img/bg%201.png', 'img/icon.png', 'index.html', 'js/app.js',
+             'https://cdn.example.com/lib@1.0/lib.js'],
+        )
+        self.assertEqual(
+            [entry['url'] for entry in manifest['api']],
+            ['http://testserver/trips/api/question/1/', 'http://testserver/trips/api/question/2/'],
+        )
+        self.assertEqual(manifest['routes'], {})
+
+    def test_version_changes_with_questions(self):
+        response = self.client.get('/trips/api/offline/manifest/')
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{response.json()["version"]}"')
+        self.assertEqual(self.client.get('/trips/api/offline/manifest/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Question.objects.filter(number=2).update(question='改過的題目')
+        question_cache().clear()
+        self.assertNotEqual(self.client.get('/trips/api/offline/manifest/')['ETag'], etag)
+
+
+# 測試環境沒有執行 collectstatic，後台頁面改用不帶雜湊的 storage
+@override_settings(STORAGES=ADMIN_STORAGES)
+class PostAdminTests(TestCase):
+    """後台 Post 列表：手機號碼以範圍查詢搜尋，查詢數不隨列數增加。"""
+
+    def setUp(self):
+        question_cache().clear()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        create_question(1)
+        create_question(2)
+        create_question(3, route='B')
+        create_question(4, route='B')
+        # 0912000001 答完 A 路線；0912000002 兩條路線各答一關，作答數與 A 路線關卡數相同但尚未完成
+        for phone, levels in (('0912000001', (1, 2)), ('0912000002', (1, 3)), ('0933000003', ())):
+            user = UserProfile.objects.create(phone=phone, gender='F')
+            Post.objects.create(user=user, passed_count=len(levels))
+            for level in levels:
+                LevelResult.objects.create(user=user, level=level, status='pass')
+
+    def changelist(self, **params):
+        response = self.client.get('/admin/trips/post/', params)
+        return [post.user_id for post in response.context['cl'].result_list]
+
+    def test_phone_prefix_search(self):
+        self.assertEqual(sorted(self.changelist(q='0912')), ['0912000001', '0912000002'])
+        self.assertEqual(self.changelist(q='0933000003'), ['0933000003'])
+        self.assertEqual(self.changelist(q='0999'), [])
+
+    def test_progress_filter(self):
+        self.assertEqual(self.changelist(progress='none'), ['0933000003'])
+        self.assertEqual(self.changelist(progress='playing'), ['0912000002'])
+        self.assertEqual(self.changelist(progress='finished'), ['0912000001'])
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.get('/admin/trips/post/')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/admin/trips/post/')
+        for n in range(10):
+            user = UserProfile.objects.create(phone=f'0955{n:06d}', gender='M')
+            Post.objects.create(user=user)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get('/admin/trips/post/')
+        self.assertEqual(len(many), len(few))
+
+
+class ProgressExportTests(TestCase):
+    """匯出玩家進度：每位玩家一列、每關展開成三欄，需要管理員權限。"""
+
+    def setUp(self):
+        for phone in ('0912000002', '0912000001'):
+            user = UserProfile.objects.create(phone=phone, gender='F')
+            Post.objects.create(user=user, passed_count=1)
+        LevelResult.objects.create(user_id='0912000001', level=3, status='pass', user_answer='B', correct_answer='B')
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        self.async_client.force_login(admin)
+
+    def test_csv_is_streamed_with_flattened_levels(self):
+        response = self.client.get('/trips/api/export/progress.csv')
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        header = rows[0]
+        self.assertEqual(len(header), 6 + 29 * 3)
+        self.assertEqual([row[0] for row in rows[1:]], ['0912000001', '0912000002'])
+        first = dict(zip(header, rows[1]))
+        self.assertEqual((first['level_3_status'], first['level_3_user_answer']), ('pass', 'B'))
+        self.assertEqual(first['level_4_status'], '')
+
+    async def test_csv_is_streamed_under_asgi(self):
+        # 同步產生器在 ASGI 下會先整份讀進記憶體，並發出 Warning
+        with mock.patch('trips.views.CSV_BATCH_LINES', 1), warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get('/trips/api/export/progress.csv')
+            chunks = [chunk async for chunk in response]
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(chunks), 3)
+        self.assertFalse([warning for warning in caught if 'synchronous iterators' in str(warning.message)])
+        rows = list(csv.reader(b''.join(chunks).decode('utf-8-sig').splitlines()))
+        self.assertEqual([row[0] for row in rows[1:]], ['0912000001', '0912000002'])
+
+    @skipUnless(export.pyarrow is not None, '需要 pyarrow')
+    async def test_parquet_is_streamed_under_asgi(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get('/trips/api/export/progress.parquet')
+            body = b''.join([chunk async for chunk in response])
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertFalse([warning for warning in caught if 'synchronous iterators' in str(warning.message)])
+        self.assertEqual(export.pyarrow.parquet.read_table(export.pyarrow.BufferReader(body)).num_rows, 2)
+
+    def test_rows_are_fetched_in_chunks(self):
+        # 玩家只查一次（逐批讀取游標），作答紀錄每批一次
+        with self.assertNumQueries(3):
+            rows = list(iter_rows(chunk_size=1))
+        self.assertEqual(len(rows), 2)
+
+    @skipUnless(export.pyarrow is not None, '需要 pyarrow')
+    def test_parquet(self):
+        response = self.client.get('/trips/api/export/progress.parquet')
+        table = export.pyarrow.parquet.read_table(export.pyarrow.BufferReader(b''.join(response.streaming_content)))
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.column('level_3_status').to_pylist(), ['pass', ''])
+
+    def test_requires_admin(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/trips/api/export/progress.csv').status_code, 403)
+
+
+class PostListTests(TestCase):
+    """玩家進度列表：依 (updated_at, id) 的游標分頁、欄位投影與增量同步。"""
+
+    def setUp(self):
+        self.start = timezone.now() - timedelta(hours=1)
+        for n in range(5):
+            user = UserProfile.objects.create(phone=f'091200000{n}', gender='M')
+            post = Post.objects.create(user=user, passed_count=n)
+            # 前兩筆時間相同，測試同一時間的排序
+            Post.objects.filter(pk=post.pk).update(updated_at=self.start + timedelta(minutes=max(n, 1)))
+        LevelResult.objects.create(user_id='0912000003', level=2, status='pass')
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+
+    def test_cursor_pages_cover_every_post_once(self):
+        phones, url = [], '/trips/api/posts/?limit=2'
+        while url:
+            data = self.client.get(url).json()
+            phones += [item['phone'] for item in data['results']]
+            url = data['next']
+
+        self.assertEqual(phones, [f'091200000{n}' for n in range(5)])
+        self.assertFalse(data['has_more'])
+        self.assertIsNotNone(data['cursor'])
+
+    def test_field_projection_skips_level_results(self):
+        with self.assertNumQueries(3):  # session、登入的使用者、玩家列表
+            data = self.client.get('/trips/api/posts/', {'fields': 'phone,passed_count'}).json()
+
+        self.assertEqual(data['results'][3], {'phone': '0912000003', 'passed_count': 3})
+        full = self.client.get('/trips/api/posts/').json()['results'][3]
+        self.assertEqual(full['content']['2']['status'], 'pass')
+        self.assertEqual(self.client.get('/trips/api/posts/', {'fields': 'phone,secret'}).status_code, 400)
+
+    def test_incremental_sync(self):
+        since = (self.start + timedelta(minutes=3)).isoformat()
+        data = self.client.get('/trips/api/posts/', {'updated_since': since, 'fields': 'phone'}).json()
+        self.assertEqual([item['phone'] for item in data['results']], ['0912000004'])
+
+        # 之後帶 cursor 輪詢，只取得新變動的玩家
+        Post.objects.filter(user_id='0912000001').update(updated_at=timezone.now())
+        delta = self.client.get('/trips/api/posts/', {'cursor': data['cursor'], 'fields': 'phone'}).json()
+        self.assertEqual([item['phone'] for item in delta['results']], ['0912000001'])
+        # 剛變動的玩家在重疊區間內，下次輪詢會再出現一次
+        again = self.client.get('/trips/api/posts/', {'cursor': delta['cursor'], 'fields': 'phone'}).json()
+        self.assertEqual([item['phone'] for item in again['results']], ['0912000001'])
+        with override_settings(TRIPS_SYNC_OVERLAP_SECONDS=0):
+            settled = self.client.get('/trips/api/posts/', {'cursor': again['cursor']}).json()
+            idle = self.client.get('/trips/api/posts/', {'cursor': settled['cursor']}).json()
+        self.assertEqual((idle['results'], idle['cursor']), ([], settled['cursor']))
+
+    def test_poll_rereads_late_commits(self):
+        Post.objects.filter(user_id='0912000004').update(updated_at=timezone.now())
+        first = self.client.get('/trips/api/posts/', {'fields': 'phone'}).json()
+        self.assertIsNone(first['next'])
+
+        # 0912000002 的交易較早決定 updated_at，在上次輪詢之後才 commit，時間落在上次最後一筆之前
+        Post.objects.filter(user_id='0912000002').update(updated_at=timezone.now() - timedelta(seconds=5))
+        later = self.client.get('/trips/api/posts/', {'cursor': first['cursor'], 'fields': 'phone'}).json()
+        self.assertEqual([item['phone'] for item in later['results']], ['0912000002', '0912000004'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/trips/api/posts/', {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/trips/api/posts/', {'updated_since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/trips/api/posts/', {'limit': '0'}).status_code, 400)
+        self.assertEqual(self.client.get('/trips/api/posts/', {'limit': '²'}).status_code, 400)
+        cursor = encode_cursor(self.start, '²')
+        self.assertEqual(self.client.get('/trips/api/posts/', {'cursor': cursor}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get('/trips/api/posts/').status_code, 403)
+
+
+class QuestionImportTests(TestCase):
+    """題目批次匯入/匯出：依題號新增或更新、驗證失敗不寫入、匯入後清除題目快取。"""
+
+    def setUp(self):
+        question_cache().clear()
+        self.existing = create_question(1, title='舊廠商')
+
+    def rows(self, *numbers, **fields):
+        header = 'number,batch,route,title,icon,question,choiceA,choiceB,choiceC,choiceD,answer'
+        lines = [header]
+        for number in numbers:
+            values = {'route': 'b', 'title': f'廠商{number}', 'answer': 'c', **fields}
+            lines.append(f'{number},第一天,{values["route"]},{values["title"]},,第 {number} 題,甲,乙,丙,{values.get("choiceD", "丁")},{values["answer"]}')
+        return io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+    def test_upsert_by_number(self):
+        self.client.get('/trips/api/question/1/')  # 先放進快取
+        before = self.existing.updated_at
+
+        # 不論幾列都只有查既有題號與一次 upsert（測試中的交易以 savepoint 進行）
+        with self.assertNumQueries(4), self.captureOnCommitCallbacks(execute=True):
+            summary = import_questions(self.rows(1, 2), 'csv', download=False)
+
+        self.assertEqual((summary['created'], summary['updated']), (1, 1))
+        question = Question.objects.get(number=1)
+        self.assertEqual((question.title, question.route, question.answer), ('廠商1', 'B', 'C'))
+        self.assertGreater(question.updated_at, before)
+        self.assertEqual(self.client.get('/trips/api/question/1/').json()['title'], '廠商1')
+        self.assertEqual(Question.objects.count(), 2)
+
+    def test_invalid_rows_write_nothing(self):
+        upload = self.rows(2, 3, 3, answer='E')
+        with self.assertRaises(QuestionImportError) as raised:
+            import_questions(upload, 'csv', download=False)
+
+        messages = [message for _, message in raised.exception.errors]
+        self.assertEqual([row for row, _ in raised.exception.errors], [1, 2, 3])
+        self.assertIn('答案必須是 A、B、C 或 D', messages[0])
+        self.assertEqual(Question.objects.count(), 1)
+        with self.assertRaises(QuestionImportError):
+            import_questions(self.rows(2, choiceD='甲'), 'csv', download=False)
+
+    def test_export_round_trip(self):
+        create_question(2, route='B')
+        for fmt in ('csv', 'json'):
+            data = export_questions(fmt)
+            Question.objects.all().delete()
+            summary = import_questions(io.BytesIO(data), fmt, download=False)
+            self.assertEqual(summary['created'], 2)
+        self.assertEqual(Question.objects.get(number=1).title, '舊廠商')
+        self.assertEqual(list(json.loads(export_questions('json'))[1].values())[:3], [2, '第一天', 'B'])
+
+    def test_malformed_files_raise_value_error(self):
+        with self.assertRaises(QuestionImportError) as raised:
+            import_questions(io.BytesIO(b'[{"number": 2}, "x", 3]'), 'json', download=False)
+        self.assertEqual([row for row, _ in raised.exception.errors], [2, 3])
+        with self.assertRaises(ValueError):
+            import_questions(io.BytesIO(b'42'), 'json', download=False)
+        if openpyxl is not None:
+            with self.assertRaisesMessage(ValueError, '無法讀取 XLSX'):
+                import_questions(io.BytesIO(b'not a zip'), 'xlsx', download=False)
+
+    def test_fetch_icon_rejects_unsafe_sources_and_paths(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            self.assertIn('不是 http/https', fetch_icon('file:///etc/passwd', 'vendor_icons/x.png'))
+            self.assertIn('不在 media/ 內', fetch_icon('https://example.com/media/../x.png', '../x.png'))
+        self.assertEqual(os.listdir(media_root), [])
+
+    @skipUnless(openpyxl is not None, '需要 openpyxl')
+    def test_xlsx(self):
+        data = export_questions('xlsx')
+        Question.objects.update(title='改過')
+        self.assertEqual(import_questions(io.BytesIO(data), 'xlsx', download=False)['updated'], 1)
+        self.assertEqual(Question.objects.get(number=1).title, '舊廠商')
+
+    @override_settings(STORAGES=ADMIN_STORAGES)
+    def test_admin_import(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile('questions.csv', self.rows(2).getvalue())
+
+        response = self.client.post('/admin/trips/question/import/', {'file': upload, 'dry_run': 'on'})
+        self.assertRedirects(response, '/admin/trips/question/import/', fetch_redirect_response=False)
+        self.assertFalse(Question.objects.filter(number=2).exists())
+
+        upload.seek(0)
+        self.client.post('/admin/trips/question/import/', {'file': upload})
+        self.assertTrue(Question.objects.filter(number=2).exists())
+
+        response = self.client.post('/admin/trips/question/import/', {
+            'file': SimpleUploadedFile('questions.csv', self.rows(3, answer='E').getvalue()),
+        })
+        self.assertContains(response, '第 1 列')
+
+
+@override_settings(TRIPS_METRICS=True)
+class QueryBudgetTests(TestCase):
+    """走一遍玩家流程，每個 view 單一請求的查詢數不得超過 settings.TRIPS_QUERY_BUDGETS。"""
+
+    def setUp(self):
+        question_cache().clear()
+        cache.clear()
+        registry.reset()
+        for number in (1, 2, 3):
+            create_question(number, route='A' if number < 3 else 'B')
+
+    def play(self):
+        phone = '0912345678'
+        self.client.post('/trips/api/user/', {'phone': phone, 'gender': 'F'}, content_type='application/json')
+        self.client.get('/trips/api/user/', {'phone': phone})
+        self.client.get(f'/trips/api/route/A/{phone}/')
+        for level in (1, 2):
+            self.client.get(f'/trips/api/question/{level}/')
+            self.client.get(f'/trips/api/question/{level}/')
+            self.client.patch(f'/trips/api/post/{phone}/', {'level': level, 'choice': 'A'},
+                              content_type='application/json')
+        self.client.post(f'/trips/api/post/{phone}/answer/', {'level': 3, 'choice': 'B'},
+                         content_type='application/json')
+        self.client.post(f'/trips/api/post/{phone}/batch/', {'answers': [
+            {'key': f'k{level}', 'level': level, 'choice': 'B'} for level in (1, 2, 3)
+        ]}, content_type='application/json')
+        self.client.get(f'/trips/api/post-detail/{phone}/')
+        self.client.get('/trips/api/leaderboard/')
+        self.client.get('/trips/api/offline/manifest/')
+
+    def test_views_stay_within_query_budget(self):
+        self.play()
+
+        views = registry.snapshot()
+        for view, budget in settings.TRIPS_QUERY_BUDGETS.items():
+            with self.subTest(view=view):
+                self.assertIn(view, views)
+                self.assertLessEqual(views[view].max_queries, budget)
+                self.assertEqual(views[view].over_budget, 0)
+
+    def test_metrics_endpoint(self):
+        self.play()
+        self.assertEqual(self.client.get('/trips/api/metrics').status_code, 403)
+
+        with override_settings(TRIPS_METRICS_TOKEN='secret'):
+            response = self.client.get('/trips/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        text = response.content.decode()
+
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('trips_requests_total{view="PostUpdateAPIView",method="PATCH",status="200"} 2', text)
+        self.assertIn('trips_request_duration_seconds_count{view="QuestionDetailAPIView"} 4', text)
+        self.assertIn('trips_db_queries_max{view="QuestionDetailAPIView"} 1', text)
+        serializer_time = float(text.split('trips_serializer_seconds_total{view="RouteBootstrapAPIView"} ')[1].split()[0])
+        self.assertGreater(serializer_time, 0)
+
+    async def test_queries_counted_under_asgi(self):
+        # async middleware 鏈中，sync view 在其他執行緒執行的查詢也要計入
+        await self.async_client.get('/trips/api/question/1/')
+
+        self.assertEqual(registry.snapshot()['QuestionDetailAPIView'].max_queries, 1)
+
+    def test_slow_requests_are_profiled(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(TRIPS_PROFILE_SAMPLE_RATE=1, TRIPS_PROFILE_SLOW_MS=0, TRIPS_PROFILE_DIR=directory), \
+                self.assertLogs('trips.middleware', 'WARNING'):
+            self.client.get('/trips/api/question/1/')
+        self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.prof')]), 1)
@@ -1,18 +1,49 @@
 # trips/urls.py
-from django.urls import path
-from .views import QuestionDetailAPIView, UserProfileAPIView, PostUpdateAPIView,PostDetailAPIView
+from django.conf import settings
+from django.urls import path, re_path
+from . import async_views
+from .views import QuestionDetailAPIView, UserProfileAPIView, PostUpdateAPIView,PostDetailAPIView, RouteBootstrapAPIView, PostBatchUpdateAPIView, AnswerSubmitAPIView, LeaderboardAPIView, TargetBundleAPIView, ARAssetAPIView, ARAssetChunksAPIView, ProgressExportAPIView, PostListCreate, MetricsAPIView, PrecacheManifestAPIView
+
+# ASGI 模式：題目、進度讀取與更新改用 async view（見 trips/async_views.py）
+if settings.TRIPS_ASYNC_API:
+    question_detail_view = async_views.question_detail
+    post_update_view = async_views.post_update
+    post_detail_view = async_views.post_detail
+else:
+    question_detail_view = QuestionDetailAPIView.as_view()
+    post_update_view = PostUpdateAPIView.as_view()
+    post_detail_view = PostDetailAPIView.as_view()
 
 urlpatterns = [
     # API調用----------------------------------------------------------------------------------------------------
     # path('get_api/', views.get_api, name='get_api'),
     path('api/user/', UserProfileAPIView.as_view(), name='user-create'),
-    path('api/question/<int:question_id>/', QuestionDetailAPIView.as_view(), name='question-detail'),
-    path('api/post/<str:phone>/', PostUpdateAPIView.as_view(), name='post-update'),
-    path('api/post-detail/<str:phone>/', PostDetailAPIView.as_view(), name='post-detail'),
+    path('api/question/<int:question_id>/', question_detail_view, name='question-detail'),
+    path('api/post/<str:phone>/', post_update_view, name='post-update'),
+    path('api/post/<str:phone>/answer/', AnswerSubmitAPIView.as_view(), name='answer-submit'),
+    path('api/post/<str:phone>/batch/', PostBatchUpdateAPIView.as_view(), name='post-batch-update'),
+    path('api/post-detail/<str:phone>/', post_detail_view, name='post-detail'),
+    path('api/posts/', PostListCreate.as_view(), name='post-list'),
+    path('api/leaderboard/', LeaderboardAPIView.as_view(), name='leaderboard'),
+    re_path(r'^api/export/progress\.(?P<fmt>csv|parquet)$', ProgressExportAPIView.as_view(), name='progress-export'),
+    path('api/route/<str:route>/<str:phone>/', RouteBootstrapAPIView.as_view(), name='route-bootstrap'),
+    path('api/targets/', TargetBundleAPIView.as_view(), name='target-bundles'),
+    path('api/targets/<str:route>/', TargetBundleAPIView.as_view(), name='target-bundle'),
+    path('api/assets/<path:name>', ARAssetAPIView.as_view(), name='ar-asset'),
+    path('api/asset-chunks/<path:name>', ARAssetChunksAPIView.as_view(), name='ar-asset-chunks'),
+    path('api/offline/manifest/', PrecacheManifestAPIView.as_view(), name='precache-manifest'),
+    path('api/metrics', MetricsAPIView.as_view(), name='metrics'),
 
     # path('api/check-status/<str:phone>/', CheckStatusAPIView.as_view(), name='check-status'),
 ]
 
+# 進度推播（SSE）需要 ASGI 的長連線，只在 ASGI 模式提供（見 trips/events.py）
+if settings.TRIPS_ASYNC_API:
+    urlpatterns += [
+        path('api/events/progress/', async_views.progress_events, name='progress-events'),
+        path('api/events/<str:phone>/', async_views.player_events, name='player-events'),
+    ]
+
 
 
 
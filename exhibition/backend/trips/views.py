@@ -1,27 +1,65 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import BasePermission, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, status
-from .models import Post, Question, UserProfile
-from .serializers import QuestionSerializer, UserProfileSerializer, PostSerializer
+from .assets import REVALIDATE, chunk_manifest, media_cache_control, media_path, serve_file
+from .cache import get_question_entry
+from .export import CSV_BATCH_LINES, export_columns, iter_csv, iter_rows, pyarrow, write_parquet
+from .images import select_icon, tagged_etag
+from .metrics import render_metrics
+from .offline import precache_manifest
+from .pagination import UpdatedAtCursorPagination
+from .models import LevelResult, Post, Question, default_content
+from .progress import (
+    LEVEL_FIELDS, append_only, build_leaderboard, judge_answer, load_content, load_profile, parse_level_update,
+    pending_events, record_level, record_levels,
+)
+from .serializers import (
+    AnswerChoiceSerializer, AnswerSubmissionSerializer, PostListSerializer, PostSerializer, RouteQuestionSerializer,
+    UserProfileSerializer,
+)
+from .streaming import aiter_batches, aread_file, is_asgi
+from .targets import bundle_for_level, load_bundle_manifest
 
 
 class QuestionDetailAPIView(APIView):
 
-    def get_object(self, question_id):
-        try:
-            return Question.objects.get(number=question_id)
-        except Question.DoesNotExist:
-            return None
-
     def get(self, request, question_id, *args, **kwargs):
-        question_instance = self.get_object(question_id)
-        if not question_instance:
+        entry = get_question_entry(question_id)
+        if entry is None:
             return Response(
                 {"res": "Object with question id does not exist"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        serializer = QuestionSerializer(question_instance)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+        data, tag = select_icon(entry['data'], request)
+        etag = tagged_etag(entry['etag'], tag)
+
+        # 手機帶 If-None-Match / If-Modified-Since 重新驗證時，題目沒變就回 304
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=entry['last_modified']
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(data, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept'])
+        return response
 
 
 class UserProfileAPIView(APIView):
@@ -32,109 +70,347 @@ class UserProfileAPIView(APIView):
         if not phone:
             return Response({"error": "缺少手機號碼"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user_profile = UserProfile.objects.get(phone=phone)
-        except UserProfile.DoesNotExist:
+        if level:
+            try:
+                level = int(level)
+            except ValueError:
+                level = 0
+            if not 1 <= level <= 29:
+                return Response({"error": "無效的關卡參數"}, status=status.HTTP_400_BAD_REQUEST)
+            if str(level) not in default_content():
+                return Response({"error": "該關卡不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        # 玩家、Post 與進度（指定 level 時只有該關）在同一個查詢取回
+        user_profile, content = load_profile(phone, level or None)
+        if user_profile is None:
             return Response({"error": "使用者不存在"}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            post = Post.objects.get(user=user_profile)
+            user_profile.post
         except Post.DoesNotExist:
             return Response({"error": "使用者遊戲歷程不存在"}, status=status.HTTP_404_NOT_FOUND)
 
-        user_data = UserProfileSerializer(user_profile).data
-
         if level:
-            if not level.isdigit() or int(level) < 1 or int(level) > 29:
-                return Response({"error": "無效的關卡參數"}, status=status.HTTP_400_BAD_REQUEST)
-
-            level = str(int(level))
-            content = user_data['post']['content']
-
-            if level not in content:
-                return Response({"error": "該關卡不存在"}, status=status.HTTP_404_NOT_FOUND)
-
-            return Response({level: content[level]}, status=status.HTTP_200_OK)
-        else:
-            return Response(user_data, status=status.HTTP_200_OK)
+            return Response(content, status=status.HTTP_200_OK)
+        return Response(UserProfileSerializer(user_profile, context={'content': content}).data, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         serializer = UserProfileSerializer(data=request.data)
         if serializer.is_valid():
             user_profile = serializer.save()
-            return Response(UserProfileSerializer(user_profile).data, status=status.HTTP_201_CREATED)
+            # 新玩家還沒有作答紀錄，不必再查詢
+            data = UserProfileSerializer(user_profile, context={'content': default_content()}).data
+            return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class PostUpdateAPIView(APIView):
     def patch(self, request, phone, *args, **kwargs):
         try:
-            # 獲取或創建與該手機號碼相關的 user_profile 和 post
-            user_profile, _ = UserProfile.objects.get_or_create(phone=phone)
-            post, created = Post.objects.get_or_create(user=user_profile)
-        except UserProfile.DoesNotExist:
-            return Response({"error": "User profile not found"}, status=status.HTTP_404_NOT_FOUND)
-        except Post.DoesNotExist:
-            return Response({"error": "User post not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        level = request.data.get("level")
-        level_status = request.data.get('status')
-        user_answer = request.data.get('user_answer')
-        correct_answer = request.data.get('correct_answer')
-
-        if level is None:
-            return Response({"error": "缺少 level 或 data 参数"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 初始化 content 作為一個空字典（若之前沒有設置 content）
-        if post.content is None:
-            post.content = {}
-
-        content = post.content
-
-        # 檢查關卡是否存在並更新或創建對應的內容
-        if level in content:
-            if level_status is not None:
-                content[level]['status'] = level_status
-            if user_answer is not None:
-                content[level]['user_answer'] = user_answer
-            if correct_answer is not None:
-                content[level]['correct_answer'] = correct_answer
-        else:
-            content[level] = {
-                'status': level_status or '',
-                'user_answer': user_answer or '',
-                'correct_answer': correct_answer or ''
-            }
+            level, fields, choice = parse_level_update(request.data)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if choice:
+            fields = judge_answer(level, choice)
+            if fields is None:
+                return Response({"error": "該關卡不存在"}, status=status.HTTP_404_NOT_FOUND)
 
-        # 保存更新
-        post.content = content
-        post.save()
+        entry = record_level(phone, level, fields, choice=choice)
 
-        return Response(content[level], status=status.HTTP_200_OK)
+        return Response(entry, status=status.HTTP_200_OK)
+
+
+class AnswerSubmitAPIView(APIView):
+    """玩家送出選項，伺服器對照正確答案判斷對錯並記錄，只回傳通過與否。"""
+
+    def post(self, request, phone, *args, **kwargs):
+        serializer = AnswerChoiceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        level = serializer.validated_data['level']
+
+        choice = serializer.validated_data['choice']
+        fields = judge_answer(level, choice)
+        if fields is None:
+            return Response({"error": "該關卡不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        record_level(phone, level, fields, choice=choice)
+        return Response({'level': str(level), 'status': fields['status']}, status=status.HTTP_200_OK)
+
+
+class PostBatchUpdateAPIView(APIView):
+    """離線時累積的答案一次上傳；每筆帶手機產生的 key，重送不會重複套用。
+
+    每筆帶 choice 由伺服器判斷對錯（結果多回傳 status）；settings.TRIPS_CLIENT_VERDICTS 開啟時，
+    舊版前端也可以直接帶 status/user_answer/correct_answer。
+    """
+    max_batch_size = 100
+
+    def post(self, request, phone, *args, **kwargs):
+        items = request.data.get('answers') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "缺少 answers 陣列"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_batch_size:
+            return Response(
+                {"error": f"單次最多上傳 {self.max_batch_size} 筆"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results, answers, positions = [], [], []
+        for item in items:
+            serializer = AnswerSubmissionSerializer(data=item)
+            if not serializer.is_valid():
+                key = item.get('key') if isinstance(item, dict) else None
+                results.append({'key': key, 'result': 'invalid', 'errors': serializer.errors})
+                continue
+            data = serializer.validated_data
+            result = {'key': data['key'], 'level': str(data['level'])}
+            fields = {name: data[name] for name in LEVEL_FIELDS if name in data}
+            if 'choice' in data:
+                fields = judge_answer(data['level'], data['choice'])
+                if fields is None:
+                    results.append({'key': data['key'], 'result': 'invalid', 'errors': {'level': ['該關卡不存在']}})
+                    continue
+                result['status'] = fields['status']
+            positions.append(len(results))
+            results.append(result)
+            answers.append({
+                'key': data['key'],
+                'level': data['level'],
+                'fields': fields,
+                'client_ts': data.get('client_ts'),
+                'choice': data.get('choice', ''),
+            })
+
+        if answers:
+            for position, outcome in zip(positions, record_levels(phone, answers)):
+                results[position]['result'] = outcome
+
+        return Response({'results': results}, status=status.HTTP_200_OK)
 
 
 class PostListCreate(generics.ListCreateAPIView):
-    queryset = Post.objects.all()
+    """玩家進度列表（管理員）：游標分頁，?fields= 只取需要的欄位，?updated_since= 或 cursor 只取有變動的玩家。"""
+    queryset = Post.objects.filter(user__isnull=False)
     serializer_class = PostSerializer
+    pagination_class = UpdatedAtCursorPagination
+    permission_classes = [IsAdminUser]
 
+    def get_serializer_class(self):
+        return PostListSerializer if self.request.method == 'GET' else PostSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs['fields'] = self.requested_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # 只有要 content 時才讀取每一關的作答紀錄
+        if self.request.method != 'GET' or 'content' in self.requested_fields():
+            queryset = queryset.prefetch_related('user__level_results')
+        return queryset
+
+    def requested_fields(self):
+        available = PostListSerializer.Meta.fields
+        fields = [name for name in self.request.query_params.get('fields', '').split(',') if name]
+        unknown = set(fields) - set(available)
+        if unknown:
+            raise ValidationError({'fields': f'不支援的欄位：{", ".join(sorted(unknown))}，可用：{", ".join(available)}'})
+        return fields or available
 
-class PostDetailAPIView(APIView):
-    def get_object(self, phone):
-        try:
-            user_profile = UserProfile.objects.get(phone=phone)
-            return user_profile.post
-        except UserProfile.DoesNotExist:
-            return None
-        except Post.DoesNotExist:
-            return None
 
+class ProgressExportAPIView(APIView):
+    """主辦單位匯出所有玩家進度：/api/export/progress.csv 或 .parquet，需先以管理員登入後台。"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, fmt, *args, **kwargs):
+        columns = export_columns()
+        rows = iter_rows()
+        # ASGI 下同步的內容會先整份讀進記憶體才送出，改用 async iterator（見 trips/streaming.py）
+        asgi = is_asgi(request)
+        if fmt == 'csv':
+            content = iter_csv(rows, columns)
+            if asgi:
+                content = aiter_batches(content, CSV_BATCH_LINES)
+            response = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+        else:
+            if pyarrow is None:
+                return Response({"error": "伺服器未安裝 pyarrow"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+            # Parquet 的欄位索引寫在檔尾，先寫入暫存檔再傳送
+            output = tempfile.TemporaryFile()
+            write_parquet(output, rows, columns)
+            size = output.seek(0, os.SEEK_END)
+            output.seek(0)
+            if asgi:
+                response = StreamingHttpResponse(aread_file(output), content_type='application/vnd.apache.parquet')
+                response['Content-Length'] = str(size)
+            else:
+                response = FileResponse(output, content_type='application/vnd.apache.parquet')
+        response['Content-Disposition'] = f'attachment; filename="progress-{timezone.localdate():%Y%m%d}.{fmt}"'
+        return response
+
+
+class PostDetailAPIView(APIView):
     def get(self, request, phone, *args, **kwargs):
-        post_instance = self.get_object(phone)
-        if not post_instance:
+        updated_at = Post.objects.filter(user_id=phone).values_list('updated_at', flat=True).first()
+        if updated_at is None:
             return Response(
                 {"error": "用户不存在"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = PostSerializer(post_instance)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        # 進度在資料庫內組成 JSON（見 progress.load_content）
+        return Response({'content': load_content(phone), 'updated_at': updated_at}, status=status.HTTP_200_OK)
+
+
+class RouteBootstrapAPIView(APIView):
+    """一次取回某條路線的所有題目與玩家在每一關的狀態，固定三個查詢。"""
+
+    def get(self, request, route, phone, *args, **kwargs):
+        updated_at = Post.objects.filter(user_id=phone).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return Response({"error": "用户不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        route = route.upper()
+        questions = Question.objects.filter(route=route).order_by('number')
+        batch = request.query_params.get('batch')
+        if batch:
+            questions = questions.filter(batch=batch)
+        questions = list(questions)
+
+        levels = [question.number for question in questions]
+        progress = {result.level: result for result in LevelResult.objects.filter(user_id=phone, level__in=levels)}
+        if append_only():
+            # 尚未整併的作答（見 progress.append_only）
+            for event in pending_events(phone, levels):
+                result = progress.setdefault(event.level, LevelResult(user_id=phone, level=event.level))
+                for name, value in event.as_fields().items():
+                    setattr(result, name, value)
+        serializer = RouteQuestionSerializer(questions, many=True, context={'progress': progress})
+        return Response({
+            'route': route,
+            'batch': batch,
+            'updated_at': updated_at,
+            'questions': [select_icon(item, request)[0] for item in serializer.data],
+        }, status=status.HTTP_200_OK)
+
+
+class TargetBundleAPIView(APIView):
+    """各路線 MindAR bundle 的網址與關卡順序（bundle 內第 i 個標記即 levels[i]）。
+
+    /api/targets/ 列出所有路線，加上 ?level=N 則回傳包含該關的路線；/api/targets/<route>/ 回傳單一路線。
+    """
+
+    def get(self, request, route=None, *args, **kwargs):
+        level = request.query_params.get('level')
+        if route is not None:
+            route = route.upper()
+            entry = load_bundle_manifest().get(route)
+        elif level is not None:
+            try:
+                level = int(level)
+            except ValueError:
+                return Response({"error": "無效的 level 參數"}, status=status.HTTP_400_BAD_REQUEST)
+            route, entry = bundle_for_level(level)
+        else:
+            return Response(
+                {name: self.describe(request, name, item) for name, item in load_bundle_manifest().items()},
+                status=status.HTTP_200_OK,
+            )
+
+        if entry is None:
+            return Response({"error": "找不到對應的 AR 標記檔"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.describe(request, route, entry), status=status.HTTP_200_OK)
+
+    @staticmethod
+    def describe(request, route, entry):
+        # 前端與 API 不同網域，回傳完整網址；chunks 為分段續傳用的校驗表
+        name = entry['url'][len(settings.MEDIA_URL):]
+        return {
+            'route': route,
+            'url': request.build_absolute_uri(entry['url']),
+            'chunks': request.build_absolute_uri(reverse('ar-asset-chunks', args=[name])),
+            'levels': entry['levels'],
+            'bytes': entry['bytes'],
+        }
+
+
+class ARAssetAPIView(APIView):
+    """MEDIA_ROOT 下的 AR 素材（.mind、.gltf 等），支援 Range 續傳、If-Range 與 304。"""
+
+    def get(self, request, name, *args, **kwargs):
+        return serve_file(request, media_path(name), media_cache_control(name))
+
+
+class ARAssetChunksAPIView(APIView):
+    """AR 素材的分段校驗表，前端依此逐段下載、驗證 SHA-256，斷線後從缺少的分段繼續。"""
+
+    def get(self, request, name, *args, **kwargs):
+        manifest = chunk_manifest(media_path(name))
+        not_modified = get_conditional_response(request, etag=manifest['etag'])
+        if not_modified is not None:
+            return not_modified
+
+        response = Response({
+            'url': request.build_absolute_uri(reverse('ar-asset', args=[name])),
+            **manifest,
+        }, status=status.HTTP_200_OK)
+        response['ETag'] = manifest['etag']
+        response['Cache-Control'] = REVALIDATE
+        return response
+
+
+class PrecacheManifestAPIView(APIView):
+    """service worker 的預先快取清單（見 trips/offline.py），以 version 當作 ETag，沒有變動時回傳 304。"""
+
+    def get(self, request, *args, **kwargs):
+        manifest = precache_manifest(request.build_absolute_uri)
+        etag = f'"{manifest["version"]}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(manifest, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Cache-Control'] = REVALIDATE
+        return response
+
+
+class LeaderboardAPIView(APIView):
+    """現場大螢幕用：路線完成人數、各關人數與前 N 名，結果短暫快取。"""
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        # isdigit() 也接受「²」等 int() 無法轉換的字元，直接以 int() 判斷
+        try:
+            limit = int(request.query_params.get('limit', '10'))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            return Response({"error": "無效的 limit 參數"}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = f'trips:leaderboard:{limit}'
+        data = cache.get(key)
+        if data is None:
+            data = build_leaderboard(limit)
+            cache.set(key, data, settings.TRIPS_LEADERBOARD_CACHE_TIMEOUT)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class HasMetricsToken(BasePermission):
+    """Prometheus 以 Authorization: Bearer <TRIPS_METRICS_TOKEN> 抓取，不必登入後台。"""
+
+    def has_permission(self, request, view):
+        token = settings.TRIPS_METRICS_TOKEN
+        return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+class MetricsAPIView(APIView):
+    """各 view 的處理時間、查詢數、序列化時間與回應大小（Prometheus 文字格式），需開啟 TRIPS_METRICS。"""
+    permission_classes = [IsAdminUser | HasMetricsToken]
+
+    def get(self, request, *args, **kwargs):
+        if not settings.TRIPS_METRICS:
+            raise Http404('未開啟 TRIPS_METRICS')
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
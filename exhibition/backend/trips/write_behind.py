@@ -0,0 +1,202 @@
+# trips/write_behind.py
+"""寫入緩衝（TRIPS_ANSWER_WRITES=queue）：作答合併寫入（group commit），背景整併。
+
+熱門攤位同時有幾十個 PATCH 時，逐筆寫入各自取得一次 SQLite 寫入鎖、各自 commit。queue 模式下，
+請求把寫入（新增 AnswerEvent，批次上傳另含冪等鍵）交給本行程的寫入執行緒，寫入執行緒把
+TRIPS_WRITE_BEHIND_COMMIT_MS 內收到的寫入合併成一個交易，commit 後才讓請求回應。另一個執行緒每
+TRIPS_WRITE_BEHIND_APPLY_MS 把新事件整併進 LevelResult 與統計（answer_log.compact_events）。
+
+AnswerEvent 表就是持久化的佇列：回應 200 時事件已經 commit，行程在整併前當掉也不會遺失，
+重新啟動後的整併從快照繼續；還沒 commit 就當掉的請求收不到回應，由前端重送（批次上傳以冪等鍵去重）。
+讀取玩家進度時與 append 模式相同，疊上尚未整併的事件。
+"""
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, close_old_connections, transaction
+
+from .answer_log import compact_events
+
+logger = logging.getLogger(__name__)
+STOP = object()
+
+
+class GroupCommitWriter:
+    """把多個請求的寫入合併成一個交易的寫入執行緒。"""
+
+    def __init__(self, interval_ms=None, max_batch=None):
+        self.interval = (interval_ms if interval_ms is not None else settings.TRIPS_WRITE_BEHIND_COMMIT_MS) / 1000
+        self.max_batch = max_batch or settings.TRIPS_WRITE_BEHIND_MAX_BATCH
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def enqueue(self, job):
+        self.start()
+        future = Future()
+        self.queue.put((job, future))
+        return future
+
+    def submit(self, job, timeout=None):
+        """把 job（在交易內執行的函式）交給寫入執行緒，commit 後回傳 job 的結果；job 或 commit 失敗時拋出例外。
+
+        逾時時還沒開始執行的 job 不再執行，寫入的交易因此最晚在逾時前開始（見 answer_log.compact_delay）；
+        已經開始的 job 照常完成。
+        """
+        future = self.enqueue(job)
+        try:
+            return future.result(timeout if timeout is not None else settings.TRIPS_WRITE_BEHIND_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def asubmit(self, job, timeout=None):
+        """submit 的 async 版本：在事件迴圈上等待 commit，不佔用任何執行緒；逾時的處理與 submit 相同。"""
+        future = self.enqueue(job)
+        timeout = timeout if timeout is not None else settings.TRIPS_WRITE_BEHIND_TIMEOUT
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='trips-group-commit', daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=5):
+        """寫完已收到的寫入後結束執行緒。"""
+        with self.lock:
+            thread = self.thread
+        if thread is not None and thread.is_alive():
+            self.queue.put(STOP)
+            thread.join(timeout)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if STOP in batch:
+                stopping = True
+                batch.remove(STOP)
+            if batch:
+                self.commit(batch)
+            close_old_connections()
+
+    def commit(self, batch):
+        """在一個交易內依序執行 batch 中的 [(job, future)]，commit 後才設定結果。
+
+        每個 job 在自己的 savepoint 內執行，單一 job 失敗（例如資料驗證）只影響該請求；
+        資料庫鎖定、連線中斷或 commit 失敗時整批都沒有寫入，全部拋出同一個例外。請求已經逾時（future 已取消）的 job 略過。
+        """
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for job, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, job(), None))
+                    except OperationalError:
+                        raise
+                    except Exception as exc:
+                        outcomes.append((future, None, exc))
+        except Exception as exc:
+            logger.exception('合併寫入 %d 筆失敗', len(batch))
+            for _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(exc)
+            return
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+class Compactor:
+    """定期整併新事件的背景執行緒；多個 worker 各有一個時，由快照列的鎖輪流整併。"""
+
+    def __init__(self, interval_ms=None):
+        self.interval = (interval_ms if interval_ms is not None else settings.TRIPS_WRITE_BEHIND_APPLY_MS) / 1000
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='trips-compactor', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                compact_events()
+            except DatabaseError:
+                # 其他 worker 正在整併（database is locked）或資料庫暫時無法連線，下一輪再試
+                logger.warning('整併作答事件失敗，下一輪重試', exc_info=True)
+            except Exception:
+                logger.exception('整併作答事件失敗，下一輪重試')
+            finally:
+                close_old_connections()
+
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def get_writer():
+    """本行程的寫入執行緒；第一次使用時一併啟動整併執行緒（TRIPS_WRITE_BEHIND_APPLY_MS 為 0 時不啟動）。"""
+    global _workers
+    with _workers_lock:
+        # gunicorn 先載入再 fork 時，子行程沒有父行程的執行緒，依 pid 重新建立
+        if _workers is None or _workers[0] != os.getpid():
+            writer = GroupCommitWriter()
+            compactor = None
+            if settings.TRIPS_WRITE_BEHIND_APPLY_MS:
+                compactor = Compactor()
+                compactor.start()
+            _workers = (os.getpid(), writer, compactor)
+        return _workers[1]
+
+
+def submit(job):
+    return get_writer().submit(job)
+
+
+async def asubmit(job):
+    # get_writer 只在第一次使用時啟動執行緒，其餘只是取鎖，可以直接在事件迴圈上呼叫
+    return await get_writer().asubmit(job)
+
+
+@atexit.register
+def shutdown():
+    """正常結束時寫完已收到的寫入、停止整併；剩下的事件由下次啟動或 compact_answer_events 整併。"""
+    if _workers is None or _workers[0] != os.getpid():
+        return
+    _, writer, compactor = _workers
+    writer.stop()
+    if compactor is not None:
+        compactor.stop()
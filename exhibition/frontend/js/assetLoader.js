@@ -0,0 +1,77 @@
+// 大型 AR 素材（.mind、.gltf）分段下載
+// 依後端的分段校驗表（/api/asset-chunks/）以 Range 逐段下載並驗證 SHA-256，
+// 驗證過的分段存在 Cache Storage，斷線或重新整理後只下載缺少的分段。
+// 瀏覽器不支援或下載失敗時，回傳原本的網址改用一般下載。
+
+const assetCacheName = 'ar-assets';
+const assetRetries = 3;
+
+async function loadAsset(chunksUrl, fallbackUrl) {
+    if (!chunksUrl || !window.caches || !window.crypto || !crypto.subtle) {
+        return fallbackUrl;
+    }
+    try {
+        const manifest = await (await fetch(chunksUrl)).json();
+        const cache = await caches.open(assetCacheName);
+        const parts = [];
+        for (const chunk of manifest.chunks) {
+            parts.push(await loadChunk(cache, manifest, chunk));
+        }
+        await removeStaleChunks(cache, manifest);
+        return URL.createObjectURL(new Blob(parts));
+    } catch (error) {
+        console.error('分段下載失敗，改用一般下載:', error);
+        return fallbackUrl;
+    }
+}
+
+function chunkKey(manifest, chunk) {
+    return `${manifest.url}?chunk=${chunk.sha256}`;
+}
+
+async function loadChunk(cache, manifest, chunk) {
+    const key = chunkKey(manifest, chunk);
+    const cached = await cache.match(key);
+    if (cached) {
+        return await cached.arrayBuffer();
+    }
+
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch(manifest.url, {
+                headers: {
+                    'Range': `bytes=${chunk.offset}-${chunk.offset + chunk.length - 1}`,
+                    'If-Range': manifest.etag,
+                },
+            });
+            // 200 表示檔案已更新（If-Range 不符），需要重新取得校驗表
+            if (response.status !== 206) {
+                throw new Error(`預期 206，收到 ${response.status}`);
+            }
+            const data = await response.arrayBuffer();
+            if (await sha256Hex(data) !== chunk.sha256) {
+                throw new Error(`分段 ${chunk.offset} 校驗失敗`);
+            }
+            await cache.put(key, new Response(data));
+            return data;
+        } catch (error) {
+            if (attempt >= assetRetries) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+    }
+}
+
+// 同一個素材舊版本的分段不再需要
+async function removeStaleChunks(cache, manifest) {
+    const current = new Set(manifest.chunks.map(chunk => chunkKey(manifest, chunk)));
+    for (const request of await cache.keys()) {
+        if (request.url.startsWith(`${manifest.url}?chunk=`) && !current.has(request.url)) {
+            await cache.delete(request);
+        }
+    }
+}
+
+async function sha256Hex(buffer) {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
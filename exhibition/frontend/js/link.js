@@ -9,6 +9,9 @@ var teach="teach.html";//詳細使用教學頁面
 
 //api引用位址
 var postDetailUrl = "https://tdance.fansee.studio/trips/api/post-detail/";//通關狀況讀取(arScan.js)
+var eventsUrl = "https://tdance.fansee.studio/trips/api/events/";//通關狀況推播(route1.js)
 var questionUrl = "https://tdance.fansee.studio/trips/api/question/";//問題資料讀取(arScan.js)
 var postUrl = "https://tdance.fansee.studio/trips/api/post/";//通關狀況資料表更新(arScan.js)
 var userUrl = "https://tdance.fansee.studio/trips/api/user/";//使用者資料表新增(userProfile.js)
+var targetsUrl = "https://tdance.fansee.studio/trips/api/targets/";//各路線AR標記檔(arScan00.html)
+var precacheUrl = "https://tdance.fansee.studio/trips/api/offline/manifest/";//離線預先快取清單(sw.js)
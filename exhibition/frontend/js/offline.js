@@ -0,0 +1,25 @@
+// 離線優先：註冊 service worker（sw.js），頁面載入時檢查預先快取清單是否更新，
+// 並在頁面載入與恢復連線時上傳離線時累積的答案（不支援 Background Sync 的瀏覽器靠這裡補上傳）。
+
+function postToServiceWorker(message) {
+    if (!('serviceWorker' in navigator)) return;
+    navigator.serviceWorker.ready.then(registration => {
+        if (registration.active) registration.active.postMessage(message);
+    });
+}
+
+// 預先下載包含該關的路線（標記檔與題目），之後掃描不需要網路
+function precacheRoute(level) {
+    postToServiceWorker({type: 'route', level: level});
+}
+
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('sw.js').catch(error => {
+        console.error('service worker 註冊失敗:', error);
+    });
+    window.addEventListener('load', () => {
+        postToServiceWorker({type: 'update'});
+        postToServiceWorker({type: 'flush'});
+    });
+    window.addEventListener('online', () => postToServiceWorker({type: 'flush'}));
+}
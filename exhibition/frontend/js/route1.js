@@ -16,6 +16,7 @@ document.addEventListener('DOMContentLoaded', function () {
     };
 
     var postDetailUrl = "https://tdance.fansee.studio/trips/api/post-detail/";
+    var eventsUrl = "https://tdance.fansee.studio/trips/api/events/";//進度推播，伺服器沒有提供時改用 postDetailUrl
 // 修改區結束------------------------------------------------------------------------------------
 
 
@@ -51,30 +52,64 @@ document.addEventListener('DOMContentLoaded', function () {
         contentDiv.appendChild(buttonContainer);
     });
 
-    if (phone) {
+    // 依關卡狀態顯示通過/失敗標記
+    function showStatus(level, status) {
+        const button = document.querySelector(`button[data-level="${level}"]`);
+        button.disabled = status === 'pass' || status === 'fail';
+        document.getElementById(`status${level}`).style.display = status === 'pass' ? 'block' : 'none';
+        document.getElementById(`fail${level}`).style.display = status === 'fail' ? 'block' : 'none';
+    }
+
+    function fetchProgress() {
         // fetch(`https://tdance.fansee.studio/trips/api/post-detail/${phone}/`)
         fetch(postDetailUrl+phone)
             .then(response => response.json())
             .then(data => {
-                levels.forEach(level => {
-                    const statusPassElement = document.getElementById(`status${level}`);
-                    const statusFailElement = document.getElementById(`fail${level}`);
-                    const button = document.querySelector(`button[data-level="${level}"]`);
-
-                    const status = data.content[level.toString()]?.status;
-                    if (status === 'pass') {
-                        button.disabled = true;
-                        statusPassElement.style.display = 'block';
-                    } else if (status === 'fail') {
-                        button.disabled = true;
-                        statusFailElement.style.display = 'block';
-                    }
-                });
+                levels.forEach(level => showStatus(level, data.content[level.toString()]?.status));
             })
             .catch(error => {
                 console.error('Error fetching post details', error);
             });
     }
+
+    // 連線後先收到完整進度（snapshot），之後每次作答由伺服器推送變動的關卡（levels），不必重新讀取
+    function listenProgress() {
+        const source = new EventSource(eventsUrl + phone + '/');
+        let received = false;
+        source.addEventListener('snapshot', event => {
+            received = true;
+            const content = JSON.parse(event.data).content;
+            levels.forEach(level => showStatus(level, content[level.toString()]?.status));
+        });
+        source.addEventListener('levels', event => {
+            const changed = JSON.parse(event.data).levels;
+            levels.forEach(level => {
+                if (level.toString() in changed) {
+                    showStatus(level, changed[level.toString()]);
+                }
+            });
+        });
+        source.onerror = () => {
+            // 伺服器沒有提供推播（非 ASGI 模式）時改為讀取一次；已連線過的斷線由瀏覽器自動重連
+            if (!received) {
+                source.close();
+                fetchProgress();
+            }
+        };
+    }
+
+    // 先下載這條路線的標記檔與題目，到關卡時離線也能掃描作答
+    if (typeof precacheRoute === 'function') {
+        precacheRoute(levels[0]);
+    }
+
+    if (phone) {
+        if (window.EventSource) {
+            listenProgress();
+        } else {
+            fetchProgress();
+        }
+    }
 });
 
 function getCookie(name) {
@@ -0,0 +1,312 @@
+// service worker：離線優先
+// 依後端的預先快取清單（/api/offline/manifest/，由 build_precache_manifest 產生）下載頁面、題目與各路線的 AR 標記檔，
+// 之後掃描、讀題不需要網路。送出答案時先存進 IndexedDB，連得上就立刻以批次 API 上傳，
+// 連不上時回應 queued，等恢復連線（Background Sync，或頁面載入、online 事件時由 js/offline.js 通知）再上傳。
+
+importScripts('js/link.js');
+
+const appCacheName = 'trips-app';
+const apiCacheName = 'trips-api';
+const routeCacheName = 'trips-routes';
+const progressCacheName = 'trips-progress';
+const metaCacheName = 'trips-meta';
+const assetCacheName = 'ar-assets';  // 與 js/assetLoader.js 相同，分段的 key 也相同
+const outboxName = 'trips-outbox';
+const syncTag = 'trips-answers';
+const networkTimeout = 4000;
+const maxBatchSize = 100;  // 後端 PostBatchUpdateAPIView.max_batch_size
+const apiOrigin = new URL(precacheUrl).origin;
+
+self.addEventListener('install', event => {
+    event.waitUntil(precache().catch(error => console.error('預先快取失敗:', error)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(self.clients.claim());
+});
+
+self.addEventListener('message', event => {
+    const message = event.data || {};
+    if (message.type === 'update') {
+        event.waitUntil(precache().catch(error => console.error('預先快取失敗:', error)));
+    } else if (message.type === 'route') {
+        event.waitUntil(precacheRoute(message.level).catch(error => console.error('路線快取失敗:', error)));
+    } else if (message.type === 'flush') {
+        event.waitUntil(flush().catch(() => {}));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === syncTag) {
+        event.waitUntil(flush());
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method === 'POST' && request.url.startsWith(postUrl) && request.url.endsWith('/answer/')) {
+        event.respondWith(submitAnswer(request));
+    } else if (request.method === 'GET' && request.url.startsWith(postDetailUrl)) {
+        event.respondWith(progress(request));
+    } else if (request.method === 'GET' && request.headers.get('Accept') !== 'text/event-stream') {
+        event.respondWith(cacheFirst(request));
+    }
+});
+
+// ---- 預先快取 --------------------------------------------------------------------------------
+
+async function readMeta(key, fallback) {
+    const response = await (await caches.open(metaCacheName)).match(key);
+    return response ? await response.json() : fallback;
+}
+
+async function writeMeta(key, value) {
+    await (await caches.open(metaCacheName)).put(key, new Response(JSON.stringify(value)));
+}
+
+// 只下載 revision 改變的項目，並刪除清單中已經沒有的項目
+async function syncCache(cacheName, entries, revisions) {
+    const cache = await caches.open(cacheName);
+    const wanted = new Set();
+    for (const entry of entries) {
+        const url = new URL(entry.url, self.registration.scope).href;
+        wanted.add(url);
+        if (revisions[url] === entry.revision && await cache.match(url, {ignoreVary: true})) {
+            continue;
+        }
+        // CDN 的檔案不一定有 CORS 標頭，以 no-cors 取得（opaque 回應仍可快取）
+        const origin = new URL(url).origin;
+        const cdn = origin !== self.location.origin && origin !== apiOrigin;
+        const response = await fetch(url, {cache: 'no-cache', mode: cdn ? 'no-cors' : 'cors'});
+        if (!response.ok && response.type !== 'opaque') {
+            throw new Error(`${url} 回應 ${response.status}`);
+        }
+        await cache.put(url, response);
+        revisions[url] = entry.revision;
+    }
+    for (const request of await cache.keys()) {
+        if (!wanted.has(request.url)) {
+            await cache.delete(request);
+            delete revisions[request.url];
+        }
+    }
+}
+
+async function fetchManifest() {
+    // 伺服器以 version 當作 ETag，沒有變動時瀏覽器以 304 沿用 HTTP 快取
+    const response = await fetch(precacheUrl, {cache: 'no-cache'});
+    if (!response.ok) {
+        throw new Error(`預先快取清單回應 ${response.status}`);
+    }
+    return await response.json();
+}
+
+async function precache() {
+    const manifest = await fetchManifest();
+    const previous = await readMeta('manifest', {});
+    if (previous.version === manifest.version) {
+        return;
+    }
+    const revisions = await readMeta('revisions', {});
+    await syncCache(appCacheName, manifest.app, revisions);
+    await syncCache(apiCacheName, manifest.api, revisions);
+    await writeMeta('revisions', revisions);
+    await writeMeta('manifest', manifest);
+    // 已經下載過的路線一併更新
+    for (const route of await readMeta('routes', [])) {
+        if (manifest.routes[route]) {
+            await precacheRoute(manifest.routes[route].levels[0]);
+        }
+    }
+}
+
+// 下載包含該關的路線：標記檔查詢、分段校驗表，以及 bundle 的每一個分段（存進 js/assetLoader.js 的快取）
+async function precacheRoute(level) {
+    let manifest = await readMeta('manifest', null);
+    if (!manifest) {
+        await precache();
+        manifest = await readMeta('manifest', {routes: {}});
+    }
+    const route = Object.keys(manifest.routes).find(name => manifest.routes[name].levels.includes(Number(level)));
+    if (!route) {
+        return;
+    }
+    const routes = await readMeta('routes', []);
+    const entries = manifest.routes[route].entries;
+    // 不同路線的 entries 放在同一個快取，保留其他已下載的路線
+    const others = routes.filter(name => name !== route && manifest.routes[name])
+        .flatMap(name => manifest.routes[name].entries);
+    const revisions = await readMeta('revisions', {});
+    await syncCache(routeCacheName, [...others, ...entries], revisions);
+    await writeMeta('revisions', revisions);
+    await writeMeta('routes', [...new Set([...routes, route])]);
+
+    const cache = await caches.open(routeCacheName);
+    for (const entry of entries.filter(item => item.url.includes('/asset-chunks/'))) {
+        await storeChunks(await (await cache.match(entry.url)).json());
+    }
+}
+
+async function storeChunks(chunks) {
+    const cache = await caches.open(assetCacheName);
+    const keys = chunks.chunks.map(chunk => `${chunks.url}?chunk=${chunk.sha256}`);
+    const missing = [];
+    for (const key of keys) {
+        if (!await cache.match(key)) missing.push(key);
+    }
+    if (!missing.length) {
+        return;
+    }
+    const data = await (await fetch(chunks.url)).arrayBuffer();
+    for (const [index, chunk] of chunks.chunks.entries()) {
+        await cache.put(keys[index], new Response(data.slice(chunk.offset, chunk.offset + chunk.length)));
+    }
+}
+
+// ---- 讀取 ------------------------------------------------------------------------------------
+
+async function cacheFirst(request) {
+    for (const name of [appCacheName, apiCacheName, routeCacheName]) {
+        // 題目 API 帶 Vary: Accept，預先快取時的 Accept 與頁面不同
+        const cached = await (await caches.open(name)).match(request, {ignoreVary: true});
+        if (cached) return cached;
+    }
+    return fetch(request);
+}
+
+function withTimeout(promise, ms) {
+    return Promise.race([promise, new Promise((_, reject) => setTimeout(() => reject(new Error('逾時')), ms))]);
+}
+
+// 進度以網路為優先，連不上時用上一次的結果，並把尚未上傳的答案標成 queued
+async function progress(request) {
+    const cache = await caches.open(progressCacheName);
+    let response;
+    try {
+        response = await withTimeout(fetch(request), networkTimeout);
+        if (response.ok) {
+            await cache.put(request.url, response.clone());
+        }
+    } catch (error) {
+        response = await cache.match(request.url);
+        if (!response) throw error;
+    }
+    const queued = await outboxFor(phoneFrom(request.url, postDetailUrl));
+    if (!queued.length || !response.ok) {
+        return response;
+    }
+    const data = await response.json();
+    for (const item of queued) {
+        data.content[String(item.level)] = {status: 'queued', user_answer: item.choice, correct_answer: ''};
+    }
+    return jsonResponse(data, 200);
+}
+
+// ---- 答案上傳 --------------------------------------------------------------------------------
+
+function phoneFrom(url, prefix) {
+    return decodeURIComponent(url.slice(prefix.length).split('/')[0]);
+}
+
+function jsonResponse(data, status) {
+    return new Response(JSON.stringify(data), {status, headers: {'Content-Type': 'application/json'}});
+}
+
+async function submitAnswer(request) {
+    const body = await request.clone().json();
+    const item = {
+        key: self.crypto.randomUUID(),
+        phone: phoneFrom(request.url, postUrl),
+        level: Number(body.level),
+        choice: body.choice,
+        client_ts: new Date().toISOString(),
+    };
+    await outboxPut(item);
+    let results = {};
+    try {
+        results = await withTimeout(flush(item.phone), networkTimeout);
+    } catch (error) {
+        if (self.registration.sync) {
+            await self.registration.sync.register(syncTag).catch(() => {});
+        }
+    }
+    const result = results[item.key];
+    if (!result) {
+        return jsonResponse({level: String(item.level), status: 'queued'}, 202);
+    }
+    if (result.result === 'invalid') {
+        return jsonResponse(result.errors, 400);
+    }
+    return jsonResponse({level: String(item.level), status: result.status}, 200);
+}
+
+// 把 outbox 中的答案依玩家分批上傳，伺服器已處理（含重複、被取代、格式錯誤）的從 outbox 刪除，回傳 {key: 結果}
+async function flush(phone) {
+    const items = phone ? await outboxFor(phone) : await outboxAll();
+    const groups = {};
+    for (const item of items) {
+        (groups[item.phone] = groups[item.phone] || []).push(item);
+    }
+    const results = {};
+    for (const [owner, answers] of Object.entries(groups)) {
+        for (let start = 0; start < answers.length; start += maxBatchSize) {
+            const batch = answers.slice(start, start + maxBatchSize);
+            const response = await fetch(`${postUrl}${encodeURIComponent(owner)}/batch/`, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    answers: batch.map(({key, level, choice, client_ts}) => ({key, level, choice, client_ts})),
+                }),
+            });
+            if (!response.ok) {
+                throw new Error(`批次上傳回應 ${response.status}`);
+            }
+            for (const result of (await response.json()).results) {
+                results[result.key] = result;
+            }
+            await outboxDelete(batch.map(item => item.key).filter(key => key in results));
+        }
+    }
+    return results;
+}
+
+// ---- IndexedDB outbox ----------------------------------------------------------------------
+
+function openOutbox() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(outboxName, 1);
+        open.onupgradeneeded = () => {
+            open.result.createObjectStore('answers', {keyPath: 'key'}).createIndex('phone', 'phone');
+        };
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+async function outboxRequest(mode, operation) {
+    const db = await openOutbox();
+    return new Promise((resolve, reject) => {
+        const transaction = db.transaction('answers', mode);
+        const request = operation(transaction.objectStore('answers'));
+        transaction.oncomplete = () => resolve(request && request.result);
+        transaction.onerror = () => reject(transaction.error);
+    });
+}
+
+function outboxPut(item) {
+    return outboxRequest('readwrite', store => store.put(item));
+}
+
+function outboxAll() {
+    return outboxRequest('readonly', store => store.getAll());
+}
+
+function outboxFor(phone) {
+    return outboxRequest('readonly', store => store.index('phone').getAll(phone));
+}
+
+function outboxDelete(keys) {
+    return outboxRequest('readwrite', store => {
+        keys.forEach(key => store.delete(key));
+    });
+}